@@ -0,0 +1,44 @@
+# dialog/bridge.py - Python → JS 消息传输
+
+import itertools
+import json
+import logging
+from typing import Any
+from ..consts import ADDON_NAME
+
+logger = logging.getLogger(ADDON_NAME)
+
+# 序列化后不超过该长度的消息直接通过一次 eval 传递
+DIRECT_MESSAGE_LIMIT = 256 * 1024
+# 分块传输时每块的字符数
+CHUNK_SIZE = 256 * 1024
+
+_message_ids = itertools.count(1)
+
+
+def send_to_webview(webview, handler: str, payload: Any) -> None:
+    """
+    将数据交给 webview 中的全局函数处理
+
+    小消息直接以 JSON 字面量调用 handler(payload)；大消息（例如带有大量时间戳的长 ASR 转写结果）
+    拆分为带序号的多个分块依次 eval，由 webview_bridge.js 重组后再解析并调用 handler，
+    避免一次性生成和解析数 MB 的 JS 源码字符串。
+
+    Args:
+        webview: AnkiWebView 实例
+        handler: webview 中全局函数的名称
+        payload: 可 JSON 序列化的数据
+    """
+    # ensure_ascii 保证 JSON 只含 ASCII 字符（包括 U+2028 等在 JS 字面量中有问题的字符都会被转义）
+    data = json.dumps(payload)
+    if len(data) <= DIRECT_MESSAGE_LIMIT:
+        webview.eval(f"{handler}({data});")
+        return
+
+    message_id = next(_message_ids)
+    total = (len(data) + CHUNK_SIZE - 1) // CHUNK_SIZE
+    logger.debug(f"[send_to_webview] Sending {len(data)} chars to '{handler}' in {total} chunks (id={message_id}).")
+    handler_js = json.dumps(handler)
+    for seq in range(total):
+        chunk = data[seq * CHUNK_SIZE:(seq + 1) * CHUNK_SIZE]
+        webview.eval(f"bridgeReceiveChunk({message_id}, {seq}, {total}, {handler_js}, {json.dumps(chunk)});")
@@ -7,7 +7,7 @@ import urllib.parse
 import logging
 from typing import Optional, List, Dict, Any
 from aqt import mw
-from ..consts import ADDON_NAME, DEFAULT_FIELD_NAMES
+from ..consts import ADDON_NAME
 from ..upload_to_anki import upload_anki
 
 logger = logging.getLogger(ADDON_NAME)
@@ -61,19 +61,10 @@ class CardManager:
                 back_content=back_content,
                 card_type=card_type,
                 audio_file_path=audio_path_to_add,
-                deck_name=final_deck_name
+                deck_name=final_deck_name,
+                timestamps=timestamps
             )
 
-            # 如果成功添加了笔记并且有时间戳数据，则更新笔记的 Timestamps 字段
-            if note_ids and timestamps:
-                note_id = note_ids[0]
-                note = mw.col.get_note(note_id)
-                timestamps_field_name = DEFAULT_FIELD_NAMES['Timestamps']
-                if note and timestamps_field_name in note.keys():
-                    note[timestamps_field_name] = json.dumps(timestamps)
-                    mw.col.update_note(note)
-                    logger.info(f"Updated note {note_id} with new timestamps.")
-
             self.webview.eval("setLoading(false);")
             if note_ids:
                 if self.config.get('last_used_deck') != final_deck_name:
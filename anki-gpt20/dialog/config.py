@@ -4,6 +4,7 @@ import logging
 from typing import Dict, Any
 from aqt import mw
 from ..consts import ADDON_NAME, SUPPORTED_CARD_TYPES
+from ..llm import get_service_registry
 
 logger = logging.getLogger(ADDON_NAME)
 
@@ -25,19 +26,47 @@ class ConfigManager:
             'default_card_type': '问答题（附翻转卡片）',
             'default_deck_name': 'Default',
             'interactive_player_enabled': True,
+            'streaming_preview_enabled': True,
+            'audio_media_url_enabled': True,
             'tts_provider': 'cosyvoice-v2',
             'qwen_tts_options': {
                 "model": "qwen3-tts-flash",
                 "voice": "Cherry",
-                "language_type": "Japanese"
+                "language_type": "Japanese",
+                "inline_audio": False,
+                "download_deadline": 20
             },
             'cosyvoice_tts_options': {
                 "model": "cosyvoice-v2",
-                "voice": "loongyuuna_v2"
+                "voice": "loongyuuna_v2",
+                "pool_enabled": True,
+                "pool_size": 4,
+                "task_timeout": 60
             },
             'ssml_options': {
                 "enabled": False,
                 "rules": {"\n": "1000ms"}
+            },
+            'batch_options': {
+                "max_workers": 4,
+                "tts_workers": 2,
+                "queue_size": 8,
+                "llm_batch_size": 1,
+                "write_batch_size": 20
+            },
+            'llm_cache_options': {
+                "enabled": True,
+                "max_size_mb": 50
+            },
+            'tts_cache_options': {
+                "enabled": True
+            },
+            'audio_postprocess_options': {
+                "enabled": False,
+                "format": "mp3",
+                "bitrate": "64k",
+                "trim_silence": True,
+                "silence_threshold_db": -45
             }
         }
         for key, value in defaults.items():
@@ -80,6 +109,32 @@ class ConfigManager:
         if not isinstance(qwen_options, dict):
             logger.warning("Invalid qwen_tts_options structure, using defaults.")
             self.config['qwen_tts_options'] = defaults['qwen_tts_options']
+        else:
+            qwen_options.setdefault('inline_audio', defaults['qwen_tts_options']['inline_audio'])
+            download_deadline = qwen_options.get('download_deadline', defaults['qwen_tts_options']['download_deadline'])
+            if not isinstance(download_deadline, (int, float)) or download_deadline <= 0:
+                logger.warning(f"Invalid qwen download_deadline '{download_deadline}', using default.")
+                download_deadline = defaults['qwen_tts_options']['download_deadline']
+            qwen_options['download_deadline'] = download_deadline
+        
+        # 验证 cosyvoice_tts_options 的连接池选项
+        cosyvoice_options = self.config.get('cosyvoice_tts_options', {})
+        if not isinstance(cosyvoice_options, dict):
+            logger.warning("Invalid cosyvoice_tts_options structure, using defaults.")
+            self.config['cosyvoice_tts_options'] = dict(defaults['cosyvoice_tts_options'])
+        else:
+            cosyvoice_defaults = defaults['cosyvoice_tts_options']
+            cosyvoice_options.setdefault('pool_enabled', cosyvoice_defaults['pool_enabled'])
+            pool_size = cosyvoice_options.get('pool_size', cosyvoice_defaults['pool_size'])
+            if not isinstance(pool_size, int) or not 1 <= pool_size <= 16:
+                logger.warning(f"Invalid cosyvoice pool_size '{pool_size}', using default.")
+                pool_size = cosyvoice_defaults['pool_size']
+            cosyvoice_options['pool_size'] = pool_size
+            task_timeout = cosyvoice_options.get('task_timeout', cosyvoice_defaults['task_timeout'])
+            if not isinstance(task_timeout, (int, float)) or task_timeout <= 0:
+                logger.warning(f"Invalid cosyvoice task_timeout '{task_timeout}', using default.")
+                task_timeout = cosyvoice_defaults['task_timeout']
+            cosyvoice_options['task_timeout'] = task_timeout
         
         # 验证 ssml_options 结构
         ssml_options = self.config.get('ssml_options', {})
@@ -90,6 +145,51 @@ class ConfigManager:
             ssml_options['enabled'] = False
         elif 'rules' not in ssml_options:
             ssml_options['rules'] = {}
+        
+        # 验证 batch_options 结构和并发数/队列范围
+        batch_options = self.config.get('batch_options', {})
+        if not isinstance(batch_options, dict):
+            logger.warning("Invalid batch_options structure, using defaults.")
+            self.config['batch_options'] = dict(defaults['batch_options'])
+        else:
+            limits = {'max_workers': 16, 'tts_workers': 16, 'queue_size': 64, 'llm_batch_size': 10,
+                      'write_batch_size': 200}
+            for key, upper in limits.items():
+                value = batch_options.get(key, defaults['batch_options'][key])
+                if not isinstance(value, int) or not 1 <= value <= upper:
+                    logger.warning(f"Invalid batch option {key}='{value}', using default.")
+                    value = defaults['batch_options'][key]
+                batch_options[key] = value
+    
+        # 验证 llm_cache_options 结构
+        llm_cache_options = self.config.get('llm_cache_options', {})
+        if not isinstance(llm_cache_options, dict):
+            logger.warning("Invalid llm_cache_options structure, using defaults.")
+            self.config['llm_cache_options'] = dict(defaults['llm_cache_options'])
+        else:
+            llm_cache_options.setdefault('enabled', True)
+            max_size_mb = llm_cache_options.get('max_size_mb')
+            if not isinstance(max_size_mb, (int, float)) or max_size_mb <= 0:
+                logger.warning(f"Invalid llm cache max_size_mb '{max_size_mb}', using default.")
+                llm_cache_options['max_size_mb'] = defaults['llm_cache_options']['max_size_mb']
+    
+        # 验证 audio_postprocess_options 结构和取值
+        audio_options = self.config.get('audio_postprocess_options', {})
+        audio_defaults = defaults['audio_postprocess_options']
+        if not isinstance(audio_options, dict):
+            logger.warning("Invalid audio_postprocess_options structure, using defaults.")
+            self.config['audio_postprocess_options'] = dict(audio_defaults)
+        else:
+            for key in ('enabled', 'trim_silence', 'bitrate'):
+                audio_options.setdefault(key, audio_defaults[key])
+            if audio_options.get('format') not in ('mp3', 'opus', 'wav'):
+                logger.warning(f"Invalid audio format '{audio_options.get('format')}', using default.")
+                audio_options['format'] = audio_defaults['format']
+            threshold = audio_options.get('silence_threshold_db', audio_defaults['silence_threshold_db'])
+            if not isinstance(threshold, (int, float)) or not -90 <= threshold < 0:
+                logger.warning(f"Invalid silence_threshold_db '{threshold}', using default.")
+                threshold = audio_defaults['silence_threshold_db']
+            audio_options['silence_threshold_db'] = threshold
     
     def save_config(self, new_config: Dict[str, Any]) -> None:
         """
@@ -101,5 +201,7 @@ class ConfigManager:
         logger.info("Received new config from webview. Saving...")
         self.config.update(new_config)
         mw.addonManager.writeConfig(ADDON_NAME, self.config)
+        # 服务相关配置变化时，下次使用前重建服务实例
+        get_service_registry().refresh(self.config.get('dashscope_api_key', ''), self.config)
         logger.info("Config saved successfully.")
 
@@ -4,14 +4,22 @@ import os
 import json
 import re
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 from aqt import mw
 from ..consts import ADDON_NAME, DEFAULT_FIELD_NAMES, SUPPORTED_CARD_TYPES
 from ..llm import estimate_timestamps
-from ..utils import encode_audio_to_base64, get_audio_mime_type
+from ..llm.timestamp_codec import decode_timestamps, encode_timestamps, is_compact_timestamps
+from ..utils import build_audio_payload
+from .bridge import send_to_webview
 
 logger = logging.getLogger(ADDON_NAME)
 
+# 每次批量查询的笔记 ID 数量，避免生成过长的 SQL 语句
+NOTE_QUERY_CHUNK_SIZE = 5000
+# 牌组卡片列表的默认分页大小和单页上限
+DECK_CARDS_PAGE_SIZE = 100
+DECK_CARDS_MAX_PAGE_SIZE = 500
+
 
 class DeckBrowserHandler:
     """牌组浏览功能处理器"""
@@ -19,58 +27,74 @@ class DeckBrowserHandler:
     def __init__(self, config: Dict[str, Any], webview):
         self.config = config
         self.webview = webview
+        # 牌组名称 -> 按新到旧排列的笔记 ID 列表，用于后续分页
+        self._deck_nids: Dict[str, List[int]] = {}
     
-    def fetch_deck_cards(self, deck_name: str) -> None:
+    def fetch_deck_cards(self, deck_name: str, offset: int = 0, limit: int = DECK_CARDS_PAGE_SIZE,
+                         list_id: Optional[str] = None, token: Optional[int] = None) -> None:
         """
-        获取指定牌组中的所有卡片信息
-        
+        分页获取指定牌组中的卡片信息
+
+        offset 为 0 时重新查询牌组的笔记 ID 列表并缓存，后续分页直接复用该列表，
+        每页只读取本页笔记的第一个字段，webview 收到的数据量与牌组大小无关。
+
         Args:
             deck_name: 牌组名称
+            offset: 起始位置（按新到旧排序）
+            limit: 本页条数
+            list_id: 目标列表元素 ID，为空时由前端按当前激活的 tab 决定
+            token: 前端的请求标记，原样返回，用于丢弃过期的分页结果
         """
         if not deck_name: 
             return
-        logger.info(f"Fetching cards for deck: {deck_name}")
         try:
-            query = f'"deck:{deck_name}"'
-            nids = mw.col.find_notes(query)
-            cards_info = []
-            for nid in nids:
-                note = mw.col.get_note(nid)
-                if not note: 
-                    continue
-                try:
-                    first_field_name = note.note_type()['flds'][0]['name']
-                    front_content = note[first_field_name]
-                    cards_info.append({"nid": nid, "front": front_content})
-                except (IndexError, KeyError):
-                    logger.warning(f"Could not get front field for note {nid}, skipping.")
-            cards_info.reverse()
-            # 根据当前激活的tab来决定填充哪个列表
-            # 检查生成器tab是否激活
-            self.webview.eval(f"""
-                (function() {{
-                    const generatorTab = document.getElementById('generatorTab');
-                    const asrTab = document.getElementById('asrTab');
-                    const browserTab = document.getElementById('browserTab');
-                    
-                    if (generatorTab && generatorTab.classList.contains('active')) {{
-                        if (typeof window.populateGeneratorDeckCards === 'function') {{
-                            window.populateGeneratorDeckCards({json.dumps(cards_info)});
-                        }}
-                    }} else if (asrTab && asrTab.classList.contains('active')) {{
-                        if (typeof window.populateAsrDeckCards === 'function') {{
-                            window.populateAsrDeckCards({json.dumps(cards_info)});
-                        }}
-                    }} else if (browserTab && browserTab.classList.contains('active')) {{
-                        if (typeof window.populateDeckCardList === 'function') {{
-                            window.populateDeckCardList({json.dumps(cards_info)}, false);
-                        }}
-                    }}
-                }})();
-            """)
+            offset = max(0, int(offset))
+            limit = max(1, min(int(limit), DECK_CARDS_MAX_PAGE_SIZE))
+            if offset == 0 or deck_name not in self._deck_nids:
+                logger.info(f"Fetching cards for deck: {deck_name}")
+                nids = list(mw.col.find_notes(f'"deck:{deck_name}"'))
+                nids.reverse()
+                self._deck_nids[deck_name] = nids
+            nids = self._deck_nids[deck_name]
+            page_nids = nids[offset:offset + limit]
+            fronts = self._fetch_note_fronts(page_nids)
+            page = {
+                "deckName": deck_name,
+                "listId": list_id,
+                "token": token,
+                "offset": offset,
+                "total": len(nids),
+                # 已被删除的笔记保留空行，保证索引与总数一致
+                "cards": [{"nid": nid, "front": fronts.get(nid, "")} for nid in page_nids],
+            }
+            self.webview.eval(f"window.receiveDeckCardsPage({json.dumps(page)});")
         except Exception as e:
             logger.exception(f"Error fetching deck cards: {e}")
     
+    @staticmethod
+    def _fetch_note_fronts(nids) -> Dict[int, str]:
+        """
+        批量读取笔记的第一个字段
+
+        直接查询 notes 表，而不是为每个笔记调用 get_note 和 note_type()。
+        字段在 flds 列中按字段序号以 0x1f 分隔存储，第一个字段即序号为 0 的字段，
+        因此无需查询笔记类型。
+
+        Args:
+            nids: 笔记 ID 列表
+
+        Returns:
+            {nid: 第一个字段内容}
+        """
+        from anki.utils import ids2str
+
+        fronts: Dict[int, str] = {}
+        for start in range(0, len(nids), NOTE_QUERY_CHUNK_SIZE):
+            chunk = nids[start:start + NOTE_QUERY_CHUNK_SIZE]
+            for nid, flds in mw.col.db.all(f"select id, flds from notes where id in {ids2str(chunk)}"):
+                fronts[nid] = flds.split("\x1f", 1)[0]
+        return fronts
+
     def fetch_card_details(self, nid: int) -> None:
         """
         获取指定笔记的详细信息
@@ -114,11 +138,15 @@ class DeckBrowserHandler:
                     audio_filename = match.group(1)
                     audio_path = os.path.join(mw.col.media.dir(), audio_filename)
 
-            if timestamps_field:
-                try:
-                    timestamps = json.loads(timestamps_field)
+            if is_compact_timestamps(timestamps_field):
+                # 紧凑格式原样发送，由前端 decodeTimestamps 解码，减少桥接负载
+                timestamps = timestamps_field
+                logger.info(f"Loaded compact timestamps from note field for nid {nid}.")
+            elif timestamps_field:
+                timestamps = decode_timestamps(timestamps_field)
+                if timestamps:
                     logger.info(f"Loaded timestamps from note field for nid {nid}.")
-                except (json.JSONDecodeError, TypeError):
+                else:
                     logger.warning(f"Invalid JSON in Timestamps field for nid {nid}. Will re-estimate.")
 
             if not timestamps and front_content and audio_path and os.path.exists(audio_path):
@@ -127,26 +155,21 @@ class DeckBrowserHandler:
                 timestamps = estimate_timestamps(front_content, audio_path, ssml_config, logger)
                 timestamps_field_name = DEFAULT_FIELD_NAMES['Timestamps']
                 if timestamps and timestamps_field_name in note.keys():
-                    note[timestamps_field_name] = json.dumps(timestamps)
+                    note[timestamps_field_name] = encode_timestamps(timestamps)
                     mw.col.update_note(note)
                     logger.info(f"Updated note {nid} with newly estimated timestamps.")
 
-            audio_base64 = ""
-            if audio_path and os.path.exists(audio_path):
-                mime_type = get_audio_mime_type(audio_path)
-                audio_base64 = encode_audio_to_base64(audio_path, mime_type) or ""
-
             card_data = {
                 "success": True,
                 "isExistingCard": True,
                 "nid": nid,
                 "frontContent": front_content,
                 "backContent": back_content,
-                "audioBase64": audio_base64,
+                **build_audio_payload(audio_path, self.config.get('audio_media_url_enabled', True)),
                 "audioFilename": audio_filename,
                 "timestamps": timestamps or []
             }
-            self.webview.eval(f"window.displayDeckCardDetails({json.dumps(card_data)});")
+            send_to_webview(self.webview, "displayDeckCardDetails", card_data)
         except Exception as e:
             logger.exception(f"Error fetching card details: {e}")
     
@@ -182,47 +205,12 @@ class DeckBrowserHandler:
             
             # 刷新卡片列表，并自动选择下一个卡片
             if deck_name:
-                # 先获取当前索引，然后刷新列表
+                # 刷新列表并选中原位置的下一张卡片（列表按需分页加载）
                 deck_name_js = json.dumps(deck_name)
                 self.webview.eval(f"""
-                    (function() {{
-                        const currentIndex = typeof getCurrentCardIndex === 'function' ? getCurrentCardIndex() : -1;
-                        const deckName = {deck_name_js};
-                        // 刷新列表
-                        pycmd('fetch_deck_cards::["' + deckName + '"]');
-                        // 延迟一下，等待列表刷新完成
-                        setTimeout(function() {{
-                            const cardList = typeof getDeckCardList === 'function' ? getDeckCardList() : [];
-                            const previewPanel = document.getElementById('deckCardPreview');
-                            if (cardList.length === 0) {{
-                                // 如果列表为空，清空预览区
-                                if (previewPanel) {{
-                                    previewPanel.innerHTML = '<div class="preview-placeholder"><p>此牌组中没有卡片</p></div>';
-                                }}
-                            }} else {{
-                                // 如果有卡片，选择下一个应该显示的卡片
-                                let targetIndex = currentIndex;
-                                if (targetIndex >= cardList.length) {{
-                                    targetIndex = cardList.length - 1;
-                                }}
-                                if (targetIndex < 0 && cardList.length > 0) {{
-                                    targetIndex = 0;
-                                }}
-                                if (targetIndex >= 0 && targetIndex < cardList.length) {{
-                                    const targetCard = cardList[targetIndex];
-                                    const listItems = document.querySelectorAll('#deckCardList li');
-                                    if (listItems[targetIndex]) {{
-                                        listItems[targetIndex].classList.add('selected');
-                                        if (typeof setCurrentCardIndex === 'function') {{
-                                            setCurrentCardIndex(targetIndex);
-                                        }}
-                                        previewPanel.innerHTML = '<div class="preview-placeholder loading"><p>正在加载卡片详情...</p></div>';
-                                        pycmd('fetch_card_details::[' + targetCard.nid + ']');
-                                    }}
-                                }}
-                            }}
-                        }}, 100);
-                    }})();
+                    if (typeof reloadDeckCardListAfterDelete === 'function') {{
+                        reloadDeckCardListAfterDelete({deck_name_js});
+                    }}
                 """)
             else:
                 # 如果无法获取牌组名称，清空预览
@@ -0,0 +1,314 @@
+# dialog/deck_maintenance.py - 牌组维护任务
+
+import os
+import re
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+from aqt import mw
+from ..consts import ADDON_NAME, DEFAULT_FIELD_NAMES, SUPPORTED_CARD_TYPES
+from ..llm.timestamp_codec import encode_timestamps
+from ..llm.utils import estimate_timestamps_bulk
+from .dispatcher import CancellationToken, CommandDispatcher
+
+logger = logging.getLogger(ADDON_NAME)
+
+# 插件根目录（dialog 的父目录）；user_files 目录在插件更新时会被 Anki 保留
+addon_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKFILL_STATE_PATH = os.path.join(addon_dir, "user_files", "deck_maintenance.json")
+
+# 每次批量查询的笔记 ID 数量
+NOTE_QUERY_CHUNK_SIZE = 5000
+# 每批估算并写回的笔记数
+BACKFILL_BATCH_SIZE = 200
+# 每个工作线程一次处理的笔记数
+BACKFILL_SLICE_SIZE = 50
+
+SOUND_PATTERN = re.compile(r'\[sound:(.*?)\]')
+
+
+class DeckMaintenanceHandler:
+    """
+    牌组维护功能处理器
+
+    在后台为整个牌组回填 Timestamps 字段：扫描有音频但 Timestamps 为空的笔记，
+    在线程池中估算时间戳，再按批在主线程中写回集合，浏览旧牌组时无需再临时估算。
+
+    任务可以随时取消（关闭对话框或再次启动）。已写回的笔记不再是候选项，
+    无法估算的笔记连同当时的音频文件名和修改时间记录在 user_files 中，再次运行时跳过；
+    音频被替换或修改后会重新尝试。
+    """
+
+    def __init__(self, config: Dict[str, Any], webview, dispatcher: CommandDispatcher):
+        self.config = config
+        self.webview = webview
+        self.dispatcher = dispatcher
+        self._state_lock = threading.Lock()
+
+    def backfill_deck_timestamps(self, deck_name: str) -> None:
+        """
+        启动牌组时间戳回填任务；同一时间只运行一个，新任务会取代旧任务
+
+        Args:
+            deck_name: 牌组名称
+        """
+        if not deck_name:
+            return
+        logger.info(f"[backfill] Starting timestamp backfill for deck '{deck_name}'.")
+        self._report_progress({"deckName": deck_name, "processed": 0, "total": 0, "updated": 0,
+                               "failed": 0, "done": False})
+        self.dispatcher.run_in_background(
+            "backfill",
+            lambda token: self._backfill(deck_name, token),
+            self._on_backfill_complete
+        )
+
+    def cancel_backfill(self) -> None:
+        """取消正在进行的回填任务"""
+        self.dispatcher.cancel("backfill")
+        logger.info("[backfill] Backfill cancelled by user.")
+        self._report_progress({"cancelled": True, "done": True})
+
+    def _backfill(self, deck_name: str, token: CancellationToken) -> Dict[str, Any]:
+        """
+        回填任务主体（后台线程）
+
+        Returns:
+            统计字典 {"deckName", "total", "processed", "updated", "failed", "cancelled"}
+        """
+        skipped = self._load_failed(deck_name)
+        candidates = self._find_candidates(deck_name, skipped)
+        stats = {"deckName": deck_name, "total": len(candidates), "processed": 0, "updated": 0,
+                 "failed": 0, "cancelled": False}
+        logger.info(f"[backfill] Deck '{deck_name}': {len(candidates)} notes need timestamps "
+                    f"({len(skipped)} previously failed notes are skipped unless their audio changed).")
+        if not token.cancelled:
+            self._report_progress({**stats, "done": False})
+
+        ssml_config = self.config.get('ssml_options', {})
+        batch_options = self.config.get('batch_options', {})
+        workers = max(1, int(batch_options.get('max_workers', 4)))
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{ADDON_NAME}-backfill") as pool:
+            for start in range(0, len(candidates), BACKFILL_BATCH_SIZE):
+                if token.cancelled:
+                    stats["cancelled"] = True
+                    break
+                batch = candidates[start:start + BACKFILL_BATCH_SIZE]
+                slices = [batch[i:i + BACKFILL_SLICE_SIZE] for i in range(0, len(batch), BACKFILL_SLICE_SIZE)]
+                estimated: List[Optional[list]] = []
+                for result in pool.map(
+                        lambda part: estimate_timestamps_bulk([(text, path) for _, text, path in part],
+                                                              ssml_config, logger),
+                        slices):
+                    estimated.extend(result)
+
+                updates = [(nid, timestamps) for (nid, _, _), timestamps in zip(batch, estimated) if timestamps]
+                failed = [(nid, path) for (nid, _, path), timestamps in zip(batch, estimated) if not timestamps]
+                written = self._write_batch(updates, token)
+                stats["processed"] += len(batch)
+                stats["updated"] += written
+                stats["failed"] += len(failed)
+                if failed:
+                    self._record_failed(deck_name, failed)
+                # 已取消的任务不再推送进度，避免覆盖新任务或取消后的界面状态
+                if not token.cancelled:
+                    self._report_progress({**stats, "done": False})
+        return stats
+
+    @staticmethod
+    def _field_indices(mid: int) -> Optional[Tuple[int, int, int]]:
+        """
+        返回笔记类型中 (正面, 音频, Timestamps) 字段的序号，缺少 Timestamps 字段时返回 None
+        """
+        model = mw.col.models.get(mid)
+        if not model:
+            return None
+        ords = {f['name']: f['ord'] for f in model['flds']}
+        card_config = SUPPORTED_CARD_TYPES.get(model['name'], {})
+        front_field = card_config.get('front_field', DEFAULT_FIELD_NAMES['正面'])
+        audio_field = card_config.get('audio_field', DEFAULT_FIELD_NAMES['Audio'])
+        timestamps_ord = ords.get(DEFAULT_FIELD_NAMES['Timestamps'])
+        front_ord = ords.get(front_field)
+        audio_ord = ords.get(audio_field, ords.get(DEFAULT_FIELD_NAMES['发音']))
+        if timestamps_ord is None or front_ord is None or audio_ord is None:
+            return None
+        return front_ord, audio_ord, timestamps_ord
+
+    def _find_candidates(self, deck_name: str,
+                         skipped: Dict[int, Tuple[str, int]]) -> List[Tuple[int, str, str]]:
+        """
+        扫描牌组，找出有音频文件但 Timestamps 字段为空的笔记
+
+        直接读取 notes 表的 flds 列，按笔记类型缓存字段序号，不为每个笔记调用 get_note。
+
+        Args:
+            deck_name: 牌组名称
+            skipped: 之前估算失败的笔记 -> (音频文件名, 修改时间)，音频未变化时跳过
+
+        Returns:
+            [(nid, 正面内容, 音频路径)]
+        """
+        from anki.utils import ids2str
+
+        media_dir = mw.col.media.dir()
+        nids = list(mw.col.find_notes(f'"deck:{deck_name}"'))
+        indices: Dict[int, Optional[Tuple[int, int, int]]] = {}
+        candidates: List[Tuple[int, str, str]] = []
+        for start in range(0, len(nids), NOTE_QUERY_CHUNK_SIZE):
+            chunk = nids[start:start + NOTE_QUERY_CHUNK_SIZE]
+            for nid, mid, flds in mw.col.db.all(f"select id, mid, flds from notes where id in {ids2str(chunk)}"):
+                if mid not in indices:
+                    indices[mid] = self._field_indices(mid)
+                field_ords = indices[mid]
+                if field_ords is None:
+                    continue
+                fields = flds.split("\x1f")
+                front_ord, audio_ord, timestamps_ord = field_ords
+                if max(field_ords) >= len(fields) or fields[timestamps_ord].strip() or not fields[front_ord]:
+                    continue
+                match = SOUND_PATTERN.search(fields[audio_ord])
+                if not match:
+                    continue
+                audio_path = os.path.join(media_dir, match.group(1))
+                signature = self._audio_signature(audio_path)
+                if signature is None or skipped.get(nid) == signature:
+                    continue
+                candidates.append((nid, fields[front_ord], audio_path))
+        return candidates
+
+    @staticmethod
+    def _audio_signature(audio_path: str) -> Optional[Tuple[str, int]]:
+        """返回 (音频文件名, 修改时间)，文件不存在时返回 None"""
+        try:
+            return os.path.basename(audio_path), os.stat(audio_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _write_batch(self, updates: List[Tuple[int, list]], token: CancellationToken) -> int:
+        """
+        在主线程中把一批时间戳写回集合，并等待写入完成
+
+        任务被取消时不再等待（已提交的写入仍会在主线程中完成），避免对话框关闭时阻塞后台线程。
+
+        Returns:
+            实际写入的笔记数
+        """
+        if not updates:
+            return 0
+        result = {"written": 0}
+        finished = threading.Event()
+
+        def write() -> None:
+            try:
+                result["written"] = self._apply_updates(updates)
+            except Exception as e:
+                logger.exception(f"[backfill] Failed to write {len(updates)} notes: {e}")
+            finally:
+                finished.set()
+
+        mw.taskman.run_on_main(write)
+        while not finished.wait(0.5):
+            if token.cancelled:
+                return 0
+        return result["written"]
+
+    @staticmethod
+    def _apply_updates(updates: List[Tuple[int, list]]) -> int:
+        """把时间戳写入笔记并批量更新（必须在主线程中调用）"""
+        field_name = DEFAULT_FIELD_NAMES['Timestamps']
+        notes = []
+        for nid, timestamps in updates:
+            try:
+                note = mw.col.get_note(nid)
+            except Exception:
+                # 笔记可能在扫描之后被删除
+                continue
+            # 扫描之后用户可能已经打开过该卡片并写入了时间戳
+            if field_name not in note.keys() or note[field_name].strip():
+                continue
+            note[field_name] = encode_timestamps(timestamps)
+            notes.append(note)
+        if not notes:
+            return 0
+        if hasattr(mw.col, "update_notes"):
+            mw.col.update_notes(notes)
+        else:
+            for note in notes:
+                mw.col.update_note(note)
+        return len(notes)
+
+    def _load_state(self) -> Dict[str, Any]:
+        try:
+            with open(BACKFILL_STATE_PATH, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _load_failed(self, deck_name: str) -> Dict[int, Tuple[str, int]]:
+        """
+        读取牌组中之前估算失败的笔记
+
+        Returns:
+            nid -> (音频文件名, 修改时间)；旧版本记录的纯 ID 列表没有音频信息，忽略后会重新尝试一次
+        """
+        failed = self._load_state().get(deck_name, {}).get("failed")
+        if not isinstance(failed, dict):
+            return {}
+        skipped = {}
+        for nid, signature in failed.items():
+            try:
+                skipped[int(nid)] = (signature[0], int(signature[1]))
+            except (TypeError, ValueError, IndexError):
+                continue
+        return skipped
+
+    def _record_failed(self, deck_name: str, failed: List[Tuple[int, str]]) -> None:
+        """
+        记录无法估算的笔记及其音频的文件名和修改时间，音频未变化时下次运行跳过
+
+        Args:
+            deck_name: 牌组名称
+            failed: [(nid, 音频路径)]
+        """
+        with self._state_lock:
+            state = self._load_state()
+            deck_state = state.setdefault(deck_name, {})
+            entries = deck_state.get("failed")
+            if not isinstance(entries, dict):
+                entries = {}
+            for nid, audio_path in failed:
+                signature = self._audio_signature(audio_path)
+                if signature:
+                    entries[str(nid)] = list(signature)
+            deck_state["failed"] = entries
+            try:
+                os.makedirs(os.path.dirname(BACKFILL_STATE_PATH), exist_ok=True)
+                tmp_path = f"{BACKFILL_STATE_PATH}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(state, f)
+                os.replace(tmp_path, BACKFILL_STATE_PATH)
+            except OSError as e:
+                logger.warning(f"[backfill] Failed to save backfill state: {e}")
+
+    def _report_progress(self, progress: Dict[str, Any]) -> None:
+        """把进度推送到 webview（可在任意线程调用）"""
+        mw.taskman.run_on_main(lambda: self.webview.eval(
+            f"if (typeof window.updateBackfillProgress === 'function') "
+            f"{{ window.updateBackfillProgress({json.dumps(progress, ensure_ascii=False)}); }}"
+        ))
+
+    def _on_backfill_complete(self, future) -> None:
+        """回填任务完成后的回调"""
+        try:
+            stats = future.result()
+        except Exception as e:
+            logger.exception(f"[backfill] Backfill failed: {e}")
+            self._report_progress({"done": True, "error": str(e)})
+            return
+        logger.info(f"[backfill] Deck '{stats['deckName']}': updated {stats['updated']}, "
+                    f"failed {stats['failed']}, processed {stats['processed']}/{stats['total']}"
+                    f"{' (cancelled)' if stats['cancelled'] else ''}.")
+        self._report_progress({**stats, "done": True})
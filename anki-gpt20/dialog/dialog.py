@@ -15,6 +15,8 @@ from .generator_handler import GeneratorHandler
 from .asr_handler import ASRHandler
 from .card_manager import CardManager
 from .deck_browser import DeckBrowserHandler
+from .deck_maintenance import DeckMaintenanceHandler
+from .dispatcher import CommandDispatcher
 from .utils import get_deck_names, get_note_type_names
 
 logger = logging.getLogger(ADDON_NAME)
@@ -37,10 +39,12 @@ class AnkiGPTWebViewDialog(QDialog):
         self.config_manager.ensure_default_config()
         
         self.session_history_manager = SessionHistoryManager(self.config)
-        self.generator_handler = GeneratorHandler(self.config, None)  # webview稍后设置
-        self.asr_handler = ASRHandler(self.config, None)  # webview稍后设置
+        self.dispatcher = CommandDispatcher()
+        self.generator_handler = GeneratorHandler(self.config, None, self.dispatcher)  # webview稍后设置
+        self.asr_handler = ASRHandler(self.config, None, self.dispatcher)  # webview稍后设置
         self.card_manager = CardManager(self.config, None)  # webview稍后设置
         self.deck_browser_handler = DeckBrowserHandler(self.config, None)  # webview稍后设置
+        self.deck_maintenance_handler = DeckMaintenanceHandler(self.config, None, self.dispatcher)  # webview稍后设置
         
         self.setup_webview_ui()
         
@@ -49,6 +53,9 @@ class AnkiGPTWebViewDialog(QDialog):
         self.asr_handler.webview = self.webview
         self.card_manager.webview = self.webview
         self.deck_browser_handler.webview = self.webview
+        self.deck_maintenance_handler.webview = self.webview
+        
+        self._register_commands()
         
         logger.info(f"[{ADDON_NAME}] Dialog initialized.")
 
@@ -93,50 +100,38 @@ class AnkiGPTWebViewDialog(QDialog):
         """)
         self.webview.eval("setLoading(false);")
 
-    def _on_js_command(self, command: str) -> None:
-        """
-        处理从 WebView 发送过来的命令
-        
-        Args:
-            command: 命令字符串，格式为 "command::[args]"
-        """
-        logger.info(f"[_on_js_command] 收到命令: {command[:100]}...")  # 只记录前100个字符
-        parts = command.split("::", 1)
-        cmd, args_str = parts[0], parts[1] if len(parts) > 1 else "[]"
-        logger.debug(f"[_on_js_command] 解析命令: cmd={cmd}, args_str长度={len(args_str)}")
-        try:
-            args = json.loads(args_str)
-            logger.debug(f"[_on_js_command] JSON解析成功: args={args}")
-        except json.JSONDecodeError as e:
-            logger.error(f"[_on_js_command] Failed to decode JSON from JS: {args_str}, error: {e}")
-            return
-        
-        # 命令路由表
+    def done(self, result: int) -> None:
+        """关闭对话框时取消仍在进行的预览、转写和回填任务，丢弃它们的结果"""
+        self.dispatcher.cancel_all()
+        super().done(result)
+
+    def _register_commands(self) -> None:
+        """注册 WebView 命令路由表（只构建一次）"""
         actions: Dict[str, Any] = {
             "generate_preview": self.generator_handler.generate_preview,
             "add_to_anki": self.card_manager.add_to_anki,
             "split_and_generate_cards": self.generator_handler.split_and_generate_cards,
-            "save_config": self._save_config,
             "fetch_deck_cards": self.deck_browser_handler.fetch_deck_cards,
             "fetch_card_details": self.deck_browser_handler.fetch_card_details,
             "asr_transcribe": self.asr_handler.asr_transcribe,
             "delete_deck_card": self.deck_browser_handler.delete_deck_card,
             "edit_deck_card": self.deck_browser_handler.edit_deck_card,
+            "backfill_deck_timestamps": self.deck_maintenance_handler.backfill_deck_timestamps,
+            "cancel_backfill": self.deck_maintenance_handler.cancel_backfill,
         }
+        for name, action in actions.items():
+            self.dispatcher.register(name, action)
+        # save_config 需要整个字典作为参数
+        self.dispatcher.register("save_config", self._save_config, spread_args=False)
+
+    def _on_js_command(self, command: str) -> None:
+        """
+        处理从 WebView 发送过来的命令
         
-        if cmd in actions:
-            logger.info(f"[_on_js_command] 执行命令: {cmd}")
-            try:
-                # save_config 需要整个字典作为参数，其他命令展开参数列表
-                if isinstance(args, list) and cmd not in ["save_config"]:
-                    actions[cmd](*args)
-                else:
-                    actions[cmd](args)
-                logger.info(f"[_on_js_command] 命令 {cmd} 执行完成")
-            except Exception as e:
-                logger.exception(f"[_on_js_command] 执行命令 {cmd} 时发生异常: {e}")
-        else:
-            logger.warning(f"[_on_js_command] Unhandled JS command: {cmd}")
+        Args:
+            command: 命令字符串，格式为 "command::[args]"
+        """
+        self.dispatcher.dispatch(command)
 
     def _save_config(self, new_config: Dict[str, Any]) -> None:
         """
@@ -0,0 +1,165 @@
+# dialog/dispatcher.py - JS 命令分发与后台任务跟踪
+
+import itertools
+import json
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional
+from aqt import mw
+from ..consts import ADDON_NAME
+from ..llm.interfaces import RequestCancelled
+
+logger = logging.getLogger(ADDON_NAME)
+
+
+class CancellationToken:
+    """后台任务的取消标记，任务在各阶段之间调用 raise_if_cancelled 检查"""
+
+    def __init__(self, request_id: int):
+        self.request_id = request_id
+        self._event = threading.Event()
+
+    def cancel(self) -> None:
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def raise_if_cancelled(self) -> None:
+        if self._event.is_set():
+            raise RequestCancelled(f"Request {self.request_id} was cancelled")
+
+
+class CommandDispatcher:
+    """
+    JS 命令分发器
+
+    命令路由表只在注册时构建一次。通过 run_in_background 提交的后台任务按 key
+    分配递增的请求 ID：同一 key 的新请求会取消仍在进行的旧请求（取代），
+    旧请求完成时的回调被丢弃，界面只会显示最新请求的结果。
+    """
+
+    def __init__(self):
+        self._actions: Dict[str, Callable[..., Any]] = {}
+        self._spread_args: Dict[str, bool] = {}
+        self._request_ids = itertools.count(1)
+        self._in_flight: Dict[str, CancellationToken] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, func: Callable[..., Any], spread_args: bool = True) -> None:
+        """
+        注册命令
+
+        Args:
+            name: 命令名称
+            func: 处理函数
+            spread_args: 为 True 时参数列表展开后传入，否则整个参数对象作为单个参数传入
+        """
+        self._actions[name] = func
+        self._spread_args[name] = spread_args
+
+    def dispatch(self, command: str) -> None:
+        """
+        处理从 WebView 发送过来的命令
+
+        Args:
+            command: 命令字符串，格式为 "command::[args]"
+        """
+        logger.info(f"[dispatch] 收到命令: {command[:100]}...")  # 只记录前100个字符
+        parts = command.split("::", 1)
+        cmd, args_str = parts[0], parts[1] if len(parts) > 1 else "[]"
+        try:
+            args = json.loads(args_str)
+        except json.JSONDecodeError as e:
+            logger.error(f"[dispatch] Failed to decode JSON from JS: {args_str}, error: {e}")
+            return
+
+        action = self._actions.get(cmd)
+        if action is None:
+            logger.warning(f"[dispatch] Unhandled JS command: {cmd}")
+            return
+        logger.info(f"[dispatch] 执行命令: {cmd}")
+        try:
+            if isinstance(args, list) and self._spread_args[cmd]:
+                action(*args)
+            else:
+                action(args)
+        except Exception as e:
+            logger.exception(f"[dispatch] 执行命令 {cmd} 时发生异常: {e}")
+
+    def begin(self, key: str, supersede: bool = True) -> CancellationToken:
+        """
+        登记一个新请求并返回其取消标记，不启动后台线程
+
+        用于等待外部回调的请求（例如 ASR 转写轮询），请求结束时调用 finish。
+
+        Args:
+            key: 任务类别，同类任务之间才会互相取代
+            supersede: 为 True 时取消同一 key 下仍在进行的旧任务
+
+        Returns:
+            本次请求的取消标记
+        """
+        token = CancellationToken(next(self._request_ids))
+        if supersede:
+            with self._lock:
+                previous = self._in_flight.get(key)
+                if previous is not None:
+                    logger.info(f"[dispatch] Request {token.request_id} supersedes '{key}' "
+                                f"request {previous.request_id}.")
+                    previous.cancel()
+                self._in_flight[key] = token
+        return token
+
+    def finish(self, key: str, token: CancellationToken) -> None:
+        """结束请求；token 仍是 key 下最新的请求时将其移除"""
+        with self._lock:
+            if self._in_flight.get(key) is token:
+                del self._in_flight[key]
+
+    def run_in_background(self, key: str, task: Callable[[CancellationToken], Any],
+                          on_done: Callable[[Any], None], supersede: bool = True,
+                          token: Optional[CancellationToken] = None) -> int:
+        """
+        提交后台任务
+
+        Args:
+            key: 任务类别（例如 "preview"），同类任务之间才会互相取代
+            task: 在后台线程中执行的函数，接收 CancellationToken
+            on_done: 主线程中的完成回调，接收 future；任务已被取代时不会调用
+            supersede: 为 True 时取消同一 key 下仍在进行的旧任务；为 False 时任务不会被取代或取消
+            token: 由 begin 登记的请求；提供时任务作为该请求的后续阶段执行，不再取代其他请求
+
+        Returns:
+            本次请求的 ID
+        """
+        if token is None:
+            token = self.begin(key, supersede)
+
+        def done(future) -> None:
+            self.finish(key, token)
+            if token.cancelled:
+                logger.info(f"[dispatch] Dropping result of stale '{key}' request {token.request_id}.")
+                return
+            on_done(future)
+
+        logger.debug(f"[dispatch] Starting '{key}' request {token.request_id}.")
+        mw.taskman.run_in_background(lambda: task(token), done)
+        return token.request_id
+
+    def cancel(self, key: str) -> None:
+        """取消 key 下正在进行的任务（其完成回调将被丢弃）"""
+        with self._lock:
+            token = self._in_flight.pop(key, None)
+        if token is not None:
+            logger.info(f"[dispatch] Cancelled '{key}' request {token.request_id}.")
+            token.cancel()
+
+    def cancel_all(self) -> None:
+        """取消所有正在进行的任务，例如对话框关闭时"""
+        with self._lock:
+            tokens = list(self._in_flight.values())
+            self._in_flight.clear()
+        for token in tokens:
+            token.cancel()
@@ -1,25 +1,36 @@
 # dialog/generator_handler.py - 生成器功能处理
 
+import itertools
 import os
 import json
-import base64
 import logging
-from typing import Dict, Any
+import time
+from typing import Dict, Any, Optional
 from aqt import mw
-from ..llm import get_anki_card_content_from_llm
-from ..utils import encode_audio_to_base64, get_audio_mime_type
+from ..llm import get_anki_card_content_from_llm, get_service_registry, CardPipeline
+from ..llm.alignment import align_timestamps
+from ..llm.interfaces import RequestCancelled
+from ..llm.utils import markdown_to_anki_html
+from ..utils import build_audio_payload
 from ..consts import ADDON_NAME
-from ..upload_to_anki import upload_anki
+from .bridge import send_to_webview
+from .dispatcher import CancellationToken, CommandDispatcher
+from ..upload_to_anki import upload_anki_bulk
 
 logger = logging.getLogger(ADDON_NAME)
 
+# 流式预览推送到 webview 的最小间隔（秒），避免每个 token 都触发一次重绘
+STREAM_PREVIEW_INTERVAL = 0.1
+
 
 class GeneratorHandler:
     """生成器功能处理器"""
     
-    def __init__(self, config: Dict[str, Any], webview):
+    def __init__(self, config: Dict[str, Any], webview, dispatcher: CommandDispatcher):
         self.config = config
         self.webview = webview
+        self.dispatcher = dispatcher
+        self._batch_ids = itertools.count(1)
     
     def generate_preview(self, text_input: str) -> None:
         """
@@ -34,13 +45,39 @@ class GeneratorHandler:
         if not api_key:
             self.webview.eval("displayTemporaryMessage('请先在\"设置\"页面中设置 API Key！', 'red', 5000);")
             return
+        streaming = self.config.get('streaming_preview_enabled', True)
         self.webview.eval("setLoading(true, '正在生成预览...');")
-        mw.taskman.run_in_background(
-            lambda: self._background_generate(text_input, api_key),
+        # 新的预览请求会取消仍在进行的旧请求，旧请求的结果不再显示
+        self.dispatcher.run_in_background(
+            "preview",
+            lambda token: self._background_generate(text_input, api_key, streaming, token),
             self._on_preview_generation_complete
         )
+
+    def _make_stream_callback(self, token: Optional[CancellationToken] = None):
+        """
+        创建 LLM 流式输出回调
+
+        回调在后台线程中被调用，按 STREAM_PREVIEW_INTERVAL 节流后，
+        将当前累计的 markdown 转为 HTML 并在主线程推送到预览面板。
+        请求被取代后回调抛出 RequestCancelled 以中止流式生成。
+        """
+        last_push = [0.0]
+
+        def on_partial(markdown_text: str) -> None:
+            if token:
+                token.raise_if_cancelled()
+            now = time.monotonic()
+            if now - last_push[0] < STREAM_PREVIEW_INTERVAL:
+                return
+            last_push[0] = now
+            html_json = json.dumps(markdown_to_anki_html(markdown_text))
+            mw.taskman.run_on_main(lambda: self.webview.eval(f"displayStreamingPreview({html_json});"))
+
+        return on_partial
     
-    def _background_generate(self, text_input: str, api_key: str) -> Dict[str, Any]:
+    def _background_generate(self, text_input: str, api_key: str, streaming: bool = False,
+                             token: Optional[CancellationToken] = None) -> Dict[str, Any]:
         """
         后台生成卡片内容
         
@@ -52,6 +89,8 @@ class GeneratorHandler:
         Args:
             text_input: 日文句子或单词（原文）
             api_key: DashScope API Key
+            streaming: 是否在 LLM 生成过程中将部分结果实时推送到预览面板
+            token: 请求的取消标记
         
         Returns:
             包含生成结果的字典，包含 success、frontContent、backContent 等字段
@@ -62,8 +101,11 @@ class GeneratorHandler:
                 japanese_sentence=text_input,
                 output_audio_dir=media_dir,
                 api_key=api_key,
-                config=self.config
+                config=self.config,
+                on_llm_partial=self._make_stream_callback(token) if streaming else None
             )
+            if token:
+                token.raise_if_cancelled()
             if not back_content: 
                 return {"success": False, "error": "LLM 未能生成卡片内容。"}
             
@@ -78,26 +120,26 @@ class GeneratorHandler:
                 )
                 logger.info(f"时间戳对齐完成: 原始 {len(timestamps)} 个，对齐后 {len(aligned_timestamps)} 个")
             
-            audio_base64 = ""
             audio_filename = ""
             if audio_path and os.path.exists(audio_path):
-                mime_type = get_audio_mime_type(audio_path)
-                audio_base64 = encode_audio_to_base64(audio_path, mime_type) or ""
                 audio_filename = os.path.basename(audio_path)
             return {
                 "success": True,
                 "isExistingCard": False,
                 "frontContent": text_input,  # 使用原文作为正面内容
                 "backContent": back_content,
-                "audioBase64": audio_base64,
+                **build_audio_payload(audio_path, self.config.get('audio_media_url_enabled', True)),
                 "audioFilename": audio_filename,
                 "timestamps": aligned_timestamps  # 对齐后的时间戳（基于原文）
             }
+        except RequestCancelled:
+            logger.info(f"Preview generation for '{text_input}' was superseded.")
+            return {"success": False, "error": "请求已取消"}
         except Exception as e:
             logger.exception(f"Exception in _background_generate: {e}")
             return {"success": False, "error": f"后台任务发生异常: {str(e)}"}
     
-    def _align_timestamps_to_original_text(self, original_text: str, kana_text: str, 
+    def _align_timestamps_to_original_text(self, original_text: str, kana_text: str,
                                            kana_timestamps: list) -> list:
         """
         将基于假名的时间戳对齐到原文
@@ -110,149 +152,15 @@ class GeneratorHandler:
         Returns:
             对齐后的时间戳列表（text字段为原文）
         """
-        try:
-            from typing import List, Dict, Any
-            import string
-            
-            # 移除标点符号，得到纯文本用于对齐
-            japanese_punctuation = '。、，？！：；'
-            all_punctuation = string.punctuation + japanese_punctuation + ' '
-            
-            def remove_punctuation(text: str) -> str:
-                """移除标点符号和空格"""
-                return ''.join(c for c in text if c not in all_punctuation)
-            
-            original_clean = remove_punctuation(original_text)
-            kana_clean = remove_punctuation(kana_text)
-            
-            # 构建假名文本的完整字符串（从时间戳）
-            kana_text_from_timestamps = ''.join(ts.get('text', '') for ts in kana_timestamps)
-            kana_clean_from_ts = remove_punctuation(kana_text_from_timestamps)
-            
-            # 如果纯文本相同，直接映射（这种情况很少，因为假名和汉字通常不同）
-            if original_clean == kana_clean or original_clean == kana_clean_from_ts:
-                logger.info("[_align_timestamps_to_original_text] 纯文本相同，直接映射时间戳")
-                aligned_timestamps = []
-                original_char_idx = 0
-                
-                # 构建字符到时间戳的映射（基于假名时间戳文本）
-                char_to_ts = {}
-                char_pos = 0
-                for ts in kana_timestamps:
-                    word_text = ts.get('text', '')
-                    for char in word_text:
-                        if char not in all_punctuation:
-                            char_to_ts[char_pos] = ts
-                            char_pos += 1
-                
-                for char in original_text:
-                    if char in all_punctuation:
-                        # 标点符号：使用前一个字符的时间戳
-                        if aligned_timestamps:
-                            last_ts = aligned_timestamps[-1]
-                            aligned_timestamps.append({
-                                'text': char,
-                                'begin_time': last_ts.get('begin_time', 0),
-                                'end_time': last_ts.get('end_time', last_ts.get('begin_time', 0))
-                            })
-                    else:
-                        # 字符：使用对应的假名时间戳
-                        if original_char_idx in char_to_ts:
-                            ts = char_to_ts[original_char_idx]
-                            aligned_timestamps.append({
-                                'text': char,
-                                'begin_time': ts.get('begin_time', 0),
-                                'end_time': ts.get('end_time', ts.get('begin_time', 0))
-                            })
-                            original_char_idx += 1
-                        else:
-                            # 如果找不到对应的时间戳，使用前一个
-                            if aligned_timestamps:
-                                last_ts = aligned_timestamps[-1]
-                                aligned_timestamps.append({
-                                    'text': char,
-                                    'begin_time': last_ts.get('begin_time', 0),
-                                    'end_time': last_ts.get('end_time', last_ts.get('begin_time', 0))
-                                })
-                            original_char_idx += 1
-                
-                return aligned_timestamps
-            
-            # 如果纯文本不同，使用简单的字符级对齐
-            # 由于假名和汉字通常长度不同，这里使用一个简化的方法：
-            # 将假名时间戳按比例分配到原文字符上
-            logger.info("[_align_timestamps_to_original_text] 纯文本不同，使用比例分配对齐")
-            aligned_timestamps = []
-            
-            # 计算假名文本的总时长
-            if kana_timestamps:
-                total_duration = kana_timestamps[-1].get('end_time', kana_timestamps[-1].get('begin_time', 0))
-                # 按原文字符数平均分配时间
-                original_chars = [c for c in original_text if c not in all_punctuation]
-                if len(original_chars) > 0:
-                    time_per_char = total_duration / len(original_chars)
-                    char_idx = 0
-                    for char in original_text:
-                        if char in all_punctuation:
-                            # 标点符号：使用前一个字符的时间戳
-                            if aligned_timestamps:
-                                last_ts = aligned_timestamps[-1]
-                                aligned_timestamps.append({
-                                    'text': char,
-                                    'begin_time': last_ts.get('end_time', last_ts.get('begin_time', 0)),
-                                    'end_time': last_ts.get('end_time', last_ts.get('begin_time', 0))
-                                })
-                        else:
-                            # 字符：按比例分配时间
-                            begin_time = int(char_idx * time_per_char)
-                            end_time = int((char_idx + 1) * time_per_char)
-                            aligned_timestamps.append({
-                                'text': char,
-                                'begin_time': begin_time,
-                                'end_time': end_time
-                            })
-                            char_idx += 1
-                else:
-                    # 如果原文只有标点符号，使用第一个时间戳
-                    first_ts = kana_timestamps[0] if kana_timestamps else {}
-                    for char in original_text:
-                        aligned_timestamps.append({
-                            'text': char,
-                            'begin_time': first_ts.get('begin_time', 0),
-                            'end_time': first_ts.get('end_time', first_ts.get('begin_time', 0))
-                        })
-            else:
-                # 如果没有时间戳，创建占位符
-                for char in original_text:
-                    aligned_timestamps.append({
-                        'text': char,
-                        'begin_time': 0,
-                        'end_time': 0
-                    })
-            
-            return aligned_timestamps
-            
-        except Exception as e:
-            logger.exception(f"[_align_timestamps_to_original_text] 对齐时间戳时发生异常: {e}")
-            # 如果对齐失败，返回基于原文的简单时间戳（时间可能不准确）
-            logger.warning("时间戳对齐失败，使用简化的时间戳（时间可能不准确）")
-            aligned_timestamps = []
-            for char in original_text:
-                aligned_timestamps.append({
-                    'text': char,
-                    'begin_time': 0,
-                    'end_time': 0
-                })
-            return aligned_timestamps
+        return align_timestamps(original_text, kana_timestamps)
     
+
     def _on_preview_generation_complete(self, future) -> None:
         """预览生成完成后的回调"""
         self.webview.eval("setLoading(false);")
         try:
             result = future.result()
-            result_json = json.dumps(result)
-            result_base64 = base64.b64encode(result_json.encode('utf-8')).decode('utf-8')
-            self.webview.eval(f"displayPreviewFromBase64('{result_base64}');")
+            send_to_webview(self.webview, "displayPreview", result)
         except Exception as e:
             logger.exception(f"Error processing preview result: {e}")
             self.webview.eval(f"displayTemporaryMessage('处理预览结果时出错: {e}', 'red', 5000);")
@@ -282,8 +190,11 @@ class GeneratorHandler:
         self.webview.eval(f"setLoading(true, '正在为 {len(sentences)} 个句子生成卡片...');")
         
         # 在后台批量生成和添加卡片
-        mw.taskman.run_in_background(
-            lambda: self._batch_generate_and_add(sentences, api_key, card_type, deck_name, include_pronunciation),
+        # 每个批量任务使用独立的 key：新的批量任务不会取代旧任务，但对话框关闭时（cancel_all）可以取消
+        self.dispatcher.run_in_background(
+            f"batch-{next(self._batch_ids)}",
+            lambda token: self._batch_generate(sentences, api_key, card_type, deck_name, include_pronunciation,
+                                               token),
             self._on_batch_generation_complete
         )
     
@@ -375,95 +286,151 @@ class GeneratorHandler:
         
         return cleaned_sentences
     
-    def _batch_generate_and_add(self, sentences: list, api_key: str, card_type: str, deck_name: str, include_pronunciation: bool) -> Dict[str, Any]:
+    def _get_batch_options(self) -> Dict[str, int]:
         """
-        批量生成卡片并添加到 Anki
-        
+        读取批量生成流水线的并发和队列配置
+
+        Returns:
+            包含 llm_workers、tts_workers、queue_size、llm_batch_size、write_batch_size 的字典
+        """
+        batch_options = self.config.get('batch_options', {})
+
+        def read_int(key: str, default: int) -> int:
+            try:
+                return max(1, int(batch_options.get(key, default)))
+            except (TypeError, ValueError):
+                return default
+
+        return {
+            "llm_workers": read_int('max_workers', 4),
+            "tts_workers": read_int('tts_workers', 2),
+            "queue_size": read_int('queue_size', 8),
+            "llm_batch_size": read_int('llm_batch_size', 1),
+            "write_batch_size": read_int('write_batch_size', 20),
+        }
+
+    def _batch_generate(self, sentences: list, api_key: str, card_type: str, deck_name: str,
+                        include_pronunciation: bool, token: CancellationToken) -> Dict[str, Any]:
+        """
+        批量生成卡片并添加到 Anki（在后台线程中执行）
+
+        句子依次流经 LLM → 假名提取 → TTS → 时间戳对齐 各阶段，每个阶段有独立的
+        有界队列和并发数。完成的条目按原始句子顺序攒批，每批调度到主线程一次性写入集合。
+
         Args:
             sentences: 句子列表
             api_key: DashScope API Key
             card_type: 卡片类型
             deck_name: 牌组名称
             include_pronunciation: 是否包含发音
-        
+            token: 取消标记，取消后流水线停止投料，尚未写入的条目被丢弃
+
         Returns:
-            包含成功和失败统计的字典
+            统计字典。写入在主线程中进行，完成回调执行时统计已是最终结果。
         """
-        success_count = 0
-        fail_count = 0
-        failed_sentences = []
-        media_dir = mw.col.media.dir()
         final_deck_name = deck_name.strip() or self.config.get('default_deck_name')
-        
-        for idx, sentence in enumerate(sentences, 1):
-            try:
-                logger.info(f"正在处理第 {idx}/{len(sentences)} 个句子: {sentence[:50]}...")
-                
-                # 生成卡片内容
-                back_content, audio_path, timestamps, kana_text = get_anki_card_content_from_llm(
-                    japanese_sentence=sentence,
-                    output_audio_dir=media_dir,
-                    api_key=api_key,
-                    config=self.config
-                )
-                
-                # 如果时间戳存在且假名与原文不同，将对齐时间戳到原文
-                aligned_timestamps = timestamps or []
-                if timestamps and kana_text and kana_text != sentence:
-                    logger.info(f"批量生成 - 假名与原文不同，对齐时间戳: 原文='{sentence}', 假名='{kana_text}'")
-                    aligned_timestamps = self._align_timestamps_to_original_text(
-                        original_text=sentence,
-                        kana_text=kana_text,
-                        kana_timestamps=timestamps
-                    )
-                else:
-                    aligned_timestamps = timestamps or []
-                
-                if not back_content:
-                    logger.warning(f"句子 {idx} 生成失败: LLM 未能生成内容")
-                    fail_count += 1
-                    failed_sentences.append(sentence)
-                    continue
-                
-                # 添加到 Anki
-                audio_file_path = audio_path if (include_pronunciation and audio_path and os.path.exists(audio_path)) else None
-                note_ids = upload_anki(
-                    word_or_sentence=sentence,
-                    back_content=back_content,
-                    card_type=card_type,
-                    audio_file_path=audio_file_path,
-                    deck_name=final_deck_name
-                )
-                
-                if note_ids:
-                    # 如果有对齐后的时间戳，更新笔记
-                    if aligned_timestamps:
-                        note_id = note_ids[0]
-                        note = mw.col.get_note(note_id)
-                        timestamps_field_name = "Timestamps"
-                        if note and timestamps_field_name in note.keys():
-                            note[timestamps_field_name] = json.dumps(aligned_timestamps)
-                            mw.col.update_note(note)
-                    success_count += 1
-                    logger.info(f"句子 {idx} 添加成功")
-                else:
-                    fail_count += 1
-                    failed_sentences.append(sentence)
-                    logger.warning(f"句子 {idx} 添加失败")
-            
-            except Exception as e:
-                logger.exception(f"处理句子 {idx} 时发生异常: {e}")
-                fail_count += 1
-                failed_sentences.append(sentence)
-        
-        return {
+        stats = {
             "success": True,
             "total": len(sentences),
-            "success_count": success_count,
-            "fail_count": fail_count,
-            "failed_sentences": failed_sentences,
+            "success_count": 0,
+            "fail_count": 0,
+            "failed_sentences": [],
             "deck_name": final_deck_name
         }
+
+        options = self._get_batch_options()
+        pipeline = CardPipeline(
+            card_generator=get_service_registry().get_card_generator(api_key, self.config),
+            output_audio_dir=mw.col.media.dir(),
+            align_func=self._align_timestamps_to_original_text,
+            llm_workers=min(options["llm_workers"], len(sentences)),
+            tts_workers=options["tts_workers"],
+            queue_size=options["queue_size"],
+            llm_batch_size=options["llm_batch_size"],
+            sink_capacity=options["write_batch_size"]
+        )
+
+        write_batch_size = options["write_batch_size"]
+        buffer: list = []
+        releases: list = []
+
+        def flush() -> None:
+            # 写入阶段：集合只能在主线程中修改，每批只写入并保存一次
+            batch, done_callbacks = list(buffer), list(releases)
+            buffer.clear()
+            releases.clear()
+
+            def write() -> None:
+                try:
+                    if token.cancelled:
+                        logger.info(f"批量任务已取消，丢弃 {len(batch)} 个未写入的句子")
+                        return
+                    self._add_generated_cards(batch, card_type, final_deck_name, include_pronunciation, stats)
+                finally:
+                    # 写入完成后才释放在途名额，主线程繁忙时流水线随之减速，积压的批次不会无限增长
+                    for done in done_callbacks:
+                        done()
+
+            mw.taskman.run_on_main(write)
+
+        def sink(item: Dict[str, Any], done) -> None:
+            if token.cancelled:
+                done()
+                return
+            buffer.append(item)
+            releases.append(done)
+            if len(buffer) >= write_batch_size:
+                flush()
+
+        pipeline.run(sentences, sink, is_cancelled=lambda: token.cancelled)
+        if buffer and not token.cancelled:
+            flush()
+        return stats
+
+    def _add_generated_cards(self, items: list, card_type: str, deck_name: str,
+                             include_pronunciation: bool, stats: Dict[str, Any]) -> None:
+        """
+        将流水线产出的一批条目写入 Anki 集合（必须在主线程中调用）
+
+        Args:
+            items: 按原始顺序排列的流水线条目
+            card_type: 卡片类型
+            deck_name: 牌组名称
+            include_pronunciation: 是否包含发音
+            stats: 统计字典，原地更新
+        """
+        cards = []
+        card_items = []
+        for item in items:
+            if item.get("error"):
+                logger.warning(f"句子 {item['index'] + 1} 生成失败: {item['error']}")
+                stats["fail_count"] += 1
+                stats["failed_sentences"].append(item["sentence"])
+                continue
+            audio_path = item.get("audio_path")
+            cards.append({
+                "front": item["sentence"],
+                "back": item["back_content"],
+                "audio_file_path": audio_path if (include_pronunciation and audio_path and os.path.exists(audio_path)) else None,
+                "timestamps": item.get("timestamps"),
+            })
+            card_items.append(item)
+        if not cards:
+            return
+
+        try:
+            note_ids = upload_anki_bulk(cards, card_type=card_type, deck_name=deck_name)
+        except Exception as e:
+            logger.exception(f"批量添加 {len(cards)} 个句子时发生异常: {e}")
+            note_ids = [None] * len(cards)
+        for item, note_id in zip(card_items, note_ids):
+            if note_id:
+                stats["success_count"] += 1
+            else:
+                stats["fail_count"] += 1
+                stats["failed_sentences"].append(item["sentence"])
+                logger.warning(f"句子 {item['index'] + 1} 添加失败")
+        logger.info(f"批量写入完成: {sum(1 for n in note_ids if n)}/{len(cards)} 张卡片")
     
     def _on_batch_generation_complete(self, future) -> None:
         """批量生成完成后的回调"""
@@ -1,25 +1,33 @@
 # 文件路径: anki-gpt20/llm/__init__.py
 
 import logging
+from typing import Callable
 # 相对导入
+from .audio import AudioPostProcessor
+from .cache import get_analysis_cache, get_tts_cache
 from .generator import AnkiCardGenerator
 from .providers.dashscope import DashScopeLLMService
 from .providers.cosyvoice_tts import CosyVoiceTTSService
 from .providers.qwen_tts import QwenTTSService
 from .providers.dashscope_asr import DashScopeASRService
+from .pipeline import CardPipeline
+from .registry import get_service_registry
 from .utils import estimate_timestamps  # <<< 核心修正：从 utils.py 导入 estimate_timestamps 函数
 
 from ..consts import ADDON_NAME
 
 # 定义此模块对外暴露的成员
 # <<< 优化建议：将 estimate_timestamps 加入 __all__ 列表，保持代码清晰
-__all__ = ["get_anki_card_content_from_llm", "estimate_timestamps", "DashScopeASRService"]
+__all__ = ["get_anki_card_content_from_llm", "create_card_generator", "estimate_timestamps", "DashScopeASRService",
+           "CardPipeline", "get_analysis_cache", "get_service_registry"]
 
 logger = logging.getLogger(ADDON_NAME)
 
 
 def get_anki_card_content_from_llm(japanese_sentence: str, output_audio_dir: str, api_key: str,
-                                   config: dict | None = None) -> tuple[str, str | None, list | None, str | None]:
+                                   config: dict | None = None,
+                                   on_llm_partial: Callable[[str], None] | None = None
+                                   ) -> tuple[str, str | None, list | None, str | None]:
     """
     使用大模型生成 Anki 卡片背面内容，并使用 TTS 生成语音及时间戳。
     此函数作为对外的统一接口，内部根据配置动态选择并协调所需的服务。
@@ -29,6 +37,7 @@ def get_anki_card_content_from_llm(japanese_sentence: str, output_audio_dir: str
         output_audio_dir (str): 音频文件保存的目录 (Anki 媒体目录)。
         api_key (str): DashScope API Key。
         config (dict | None): 插件的完整配置字典。
+        on_llm_partial (Callable | None): 可选的流式回调，LLM 生成过程中以累计的 markdown 文本调用。
 
     Returns:
         tuple[str, str | None, list | None, str | None]: 一个元组，包含：
@@ -48,8 +57,28 @@ def get_anki_card_content_from_llm(japanese_sentence: str, output_audio_dir: str
     if config is None:
         config = {}
 
+    card_generator = get_service_registry().get_card_generator(api_key, config)
+
+    # --- 执行生成任务 ---
+    return card_generator.generate_card_content(japanese_sentence, output_audio_dir, on_llm_partial)
+
+
+def create_card_generator(api_key: str, config: dict | None = None) -> AnkiCardGenerator:
+    """
+    根据配置创建 LLM 和 TTS 服务，并返回注入了这些服务的 AnkiCardGenerator。
+
+    Args:
+        api_key (str): DashScope API Key。
+        config (dict | None): 插件的完整配置字典。
+
+    Returns:
+        AnkiCardGenerator: 卡片生成协调器。
+    """
+    if config is None:
+        config = {}
+
     # --- 服务实例化（工厂部分）---
-    llm_provider = DashScopeLLMService(api_key=api_key)
+    llm_provider = DashScopeLLMService(api_key=api_key, cache=get_analysis_cache(config))
 
     tts_provider_name = config.get("tts_provider", "cosyvoice-v2")
     tts_provider = None
@@ -76,7 +105,10 @@ def get_anki_card_content_from_llm(japanese_sentence: str, output_audio_dir: str
             model=model,
             voice=voice,
             ssml_config=ssml_config,
-            timestamp_enabled=timestamp_enabled
+            timestamp_enabled=timestamp_enabled,
+            pool_enabled=cosyvoice_config.get("pool_enabled", True),
+            pool_size=cosyvoice_config.get("pool_size", 4),
+            task_timeout=cosyvoice_config.get("task_timeout", 60)
         )
     else:  # 兼容旧配置，默认为 cosyvoice-v2
         logger.warning(f"[llm] Unknown TTS provider '{tts_provider_name}', using default CosyVoice-v2.")
@@ -87,7 +119,5 @@ def get_anki_card_content_from_llm(japanese_sentence: str, output_audio_dir: str
         )
 
     # --- 实例化协调器并注入服务 ---
-    card_generator = AnkiCardGenerator(llm_service=llm_provider, tts_service=tts_provider)
-
-    # --- 执行生成任务 ---
-    return card_generator.generate_card_content(japanese_sentence, output_audio_dir)
\ No newline at end of file
+    return AnkiCardGenerator(llm_service=llm_provider, tts_service=tts_provider, tts_cache=get_tts_cache(config),
+                             audio_processor=AudioPostProcessor.from_config(config))
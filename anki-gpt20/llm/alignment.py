@@ -0,0 +1,195 @@
+# anki_gpt_addon/llm/alignment.py
+"""
+时间戳对齐
+把一段文本上的字级别时间戳映射到另一段相近的文本上，例如：
+- TTS 使用假名合成，时间戳需要映射回含汉字的原文；
+- ASR 原始转写经 LLM 重新加标点后，时间戳需要映射到优化后的文本。
+
+对去除标点后的两个字符序列做带状（banded）编辑距离对齐，相同的字符作为锚点直接继承时间，
+两个锚点之间未匹配的字符（汉字与假名、被改写的词）平分对应源字符的时间段。
+时间和内存都与 文本长度 × 带宽 成正比，不会随文本长度平方增长。
+"""
+import logging
+import string
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from ..consts import ADDON_NAME
+
+logger = logging.getLogger(ADDON_NAME)
+
+# 对齐时忽略的字符；它们在结果中继承前一个字符的结束时间，时长为 0
+PUNCTUATION = frozenset(string.punctuation + string.whitespace + '。、，．？！：；「」『』（）【】〈〉《》…‥・〜～　')
+# 带宽在两个序列长度比例对应的对角线两侧额外留出的余量
+BAND_MARGIN = 24
+
+# 回溯方向
+_DIAG, _UP, _LEFT = 0, 1, 2
+
+
+def _number(value: Any, default: float = 0) -> float:
+    return value if isinstance(value, (int, float)) else default
+
+
+def _flatten_timestamps(timestamps: Sequence[Dict[str, Any]]) -> Tuple[List[str], List[Tuple[float, float]]]:
+    """
+    把按词或按字的时间戳展开为逐字符序列，跳过标点
+
+    多字符的词（ASR 返回的词级时间戳）按字符数平分该词的时间段。
+    """
+    chars: List[str] = []
+    spans: List[Tuple[float, float]] = []
+    for ts in timestamps:
+        text = ts.get('text') or ''
+        begin = _number(ts.get('begin_time'))
+        end = max(begin, _number(ts.get('end_time'), begin))
+        kept = [char for char in text if char not in PUNCTUATION]
+        if not kept:
+            continue
+        step = (end - begin) / len(kept)
+        for k, char in enumerate(kept):
+            chars.append(char)
+            spans.append((begin + k * step, begin + (k + 1) * step))
+    return chars, spans
+
+
+def align_sequences(source: Sequence[str], target: Sequence[str], band_margin: int = BAND_MARGIN) -> List[int]:
+    """
+    带状编辑距离对齐
+
+    只在两个序列长度比例对应的对角线附近计算，共同前缀和后缀直接匹配。
+
+    Args:
+        source: 源字符序列
+        target: 目标字符序列
+        band_margin: 对角线两侧的余量
+
+    Returns:
+        长度与 target 相同的列表，元素为匹配的 source 下标，未匹配（替换或插入）为 -1
+    """
+    n, m = len(source), len(target)
+    mapping = [-1] * m
+
+    prefix = 0
+    while prefix < n and prefix < m and source[prefix] == target[prefix]:
+        mapping[prefix] = prefix
+        prefix += 1
+    suffix = 0
+    while suffix < n - prefix and suffix < m - prefix and source[n - 1 - suffix] == target[m - 1 - suffix]:
+        mapping[m - 1 - suffix] = n - 1 - suffix
+        suffix += 1
+
+    src = source[prefix:n - suffix]
+    tgt = target[prefix:m - suffix]
+    rows, cols = len(src), len(tgt)
+    if not rows or not cols:
+        return mapping
+
+    # 第 i 行只计算对角线 i * cols / rows 附近的列；半宽不小于每行对角线的位移，保证相邻行的窗口相连
+    half_width = band_margin + -(-cols // rows)
+    inf = float('inf')
+
+    def window(i: int) -> Tuple[int, int]:
+        center = i * cols // rows
+        return max(0, center - half_width), min(cols, center + half_width)
+
+    prev_lo, prev_hi = window(0)
+    prev = list(range(prev_lo, prev_hi + 1))  # 第 0 行：全部为插入
+    pointers: List[Tuple[int, bytearray]] = [(prev_lo, bytearray([_LEFT]) * (prev_hi - prev_lo + 1))]
+
+    for i in range(1, rows + 1):
+        lo, hi = window(i)
+        char = src[i - 1]
+        row = [inf] * (hi - lo + 1)
+        back = bytearray(hi - lo + 1)
+        for j in range(lo, hi + 1):
+            best, move = inf, _DIAG
+            if prev_lo <= j - 1 <= prev_hi:
+                best = prev[j - 1 - prev_lo] + (0 if tgt[j - 1] == char else 1)
+            if prev_lo <= j <= prev_hi:
+                cost = prev[j - prev_lo] + 1
+                if cost < best:
+                    best, move = cost, _UP
+            if j > lo:
+                cost = row[j - 1 - lo] + 1
+                if cost < best:
+                    best, move = cost, _LEFT
+            row[j - lo] = best
+            back[j - lo] = move
+        pointers.append((lo, back))
+        prev, prev_lo, prev_hi = row, lo, hi
+
+    i, j = rows, cols
+    while i > 0 and j > 0:
+        lo, back = pointers[i]
+        move = back[j - lo]
+        if move == _DIAG:
+            if src[i - 1] == tgt[j - 1]:
+                mapping[prefix + j - 1] = prefix + i - 1
+            i, j = i - 1, j - 1
+        elif move == _UP:
+            i -= 1
+        else:
+            j -= 1
+    return mapping
+
+
+def align_timestamps(target_text: str, source_timestamps: Sequence[Dict[str, Any]],
+                     band_margin: int = BAND_MARGIN) -> List[Dict[str, Any]]:
+    """
+    把源文本上的时间戳映射到目标文本的每个字符
+
+    Args:
+        target_text: 需要时间戳的文本（原文或优化后的文本）
+        source_timestamps: 源文本（假名或 ASR 原文）的时间戳，包含 text/begin_time/end_time（毫秒）
+        band_margin: 对齐带宽余量
+
+    Returns:
+        目标文本中每个字符一条的时间戳列表；标点的时长为 0，位于前一个字符的结束处
+    """
+    source_chars, source_spans = _flatten_timestamps(source_timestamps or [])
+    if not source_chars:
+        return [{'text': char, 'begin_time': 0, 'end_time': 0} for char in target_text]
+
+    positions = [k for k, char in enumerate(target_text) if char not in PUNCTUATION]
+    mapping = align_sequences(source_chars, [target_text[k] for k in positions], band_margin)
+
+    spans: List[Optional[Tuple[float, float]]] = [None] * len(positions)
+    run_start = 0
+    last_source = -1
+    for idx in range(len(positions) + 1):
+        matched = mapping[idx] if idx < len(positions) else len(source_chars)
+        if matched < 0:
+            continue
+        if idx < len(positions):
+            spans[idx] = source_spans[matched]
+        # 两个锚点之间未匹配的目标字符平分被跳过的源字符所占的时间段
+        run = idx - run_start
+        if run:
+            if matched - last_source > 1:
+                begin = source_spans[last_source + 1][0]
+                end = source_spans[matched - 1][1]
+            else:
+                begin = source_spans[last_source][1] if last_source >= 0 else source_spans[0][0]
+                end = source_spans[matched][0] if matched < len(source_chars) else begin
+                end = max(begin, end)
+            step = (end - begin) / run
+            for k in range(run):
+                spans[run_start + k] = (begin + k * step, begin + (k + 1) * step)
+        run_start = idx + 1
+        last_source = matched
+
+    aligned: List[Dict[str, Any]] = []
+    span_iter = iter(spans)
+    last_end = source_spans[0][0]
+    for char in target_text:
+        if char in PUNCTUATION:
+            aligned.append({'text': char, 'begin_time': int(last_end), 'end_time': int(last_end)})
+            continue
+        begin, end = next(span_iter)
+        aligned.append({'text': char, 'begin_time': int(round(begin)), 'end_time': int(round(end))})
+        last_end = round(end)
+
+    matched_count = sum(1 for k in mapping if k >= 0)
+    logger.debug(f"[alignment] Aligned {len(positions)} chars to {len(source_chars)} source chars, "
+                 f"{matched_count} exact matches.")
+    return aligned
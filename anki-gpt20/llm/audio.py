@@ -0,0 +1,252 @@
+# anki_gpt_addon/llm/audio.py
+"""
+音频后处理
+在 TTS 合成之后、写入媒体库之前对 WAV 音频进行处理：
+去除首尾静音（同步平移时间戳），并在系统中存在 ffmpeg 时转码为 MP3 / Opus 以减小媒体体积。
+"""
+import logging
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import wave
+from array import array
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .utils import AtomicFileWriter
+from ..consts import ADDON_NAME
+
+logger = logging.getLogger(ADDON_NAME)
+
+# 支持的输出格式：格式名 -> (ffmpeg 编码器, ffmpeg 容器, 文件后缀)
+OUTPUT_FORMATS = {
+    "mp3": ("libmp3lame", "mp3", "mp3"),
+    "opus": ("libopus", "ogg", "ogg"),
+}
+SILENCE_WINDOW_MS = 10  # 静音检测的窗口长度
+SILENCE_PADDING_MS = 60  # 裁剪后在语音前后保留的静音
+TRANSCODE_TIMEOUT = 60  # ffmpeg 转码超时（秒）
+
+
+def wav_header(data_size: int, sample_rate: int, channels: int, sample_width: int) -> bytes:
+    """构造 PCM WAV 文件头"""
+    byte_rate = sample_rate * channels * sample_width
+    return struct.pack('<4sI4s4sIHHIIHH4sI', b'RIFF', 36 + data_size, b'WAVE', b'fmt ', 16, 1, channels,
+                       sample_rate, byte_rate, channels * sample_width, sample_width * 8, b'data', data_size)
+
+
+def find_voiced_range(samples: array, channels: int, sample_rate: int, threshold: int) -> Optional[Tuple[int, int]]:
+    """
+    查找首个和最后一个超过阈值的窗口
+
+    Args:
+        samples: 16 位 PCM 采样（多声道交错排列）
+        channels: 声道数
+        sample_rate: 采样率
+        threshold: 振幅阈值
+
+    Returns:
+        (起始帧, 结束帧)，整段都是静音时返回 None
+    """
+    window = max(1, sample_rate * SILENCE_WINDOW_MS // 1000) * channels
+    total = len(samples)
+
+    def voiced(start: int) -> bool:
+        chunk = samples[start:start + window]
+        return max(chunk) > threshold or -min(chunk) > threshold
+
+    start = 0
+    while start < total and not voiced(start):
+        start += window
+    if start >= total:
+        return None
+    end = (total - 1) // window * window
+    while end > start and not voiced(end):
+        end -= window
+    return start // channels, min(total, end + window) // channels
+
+
+def shift_timestamps(timestamps: Optional[List[Dict[str, Any]]], offset_ms: int,
+                     duration_ms: int) -> Optional[List[Dict[str, Any]]]:
+    """把时间戳整体前移 offset_ms，并限制在 [0, duration_ms] 内"""
+    if not timestamps:
+        return timestamps
+    shifted = []
+    for ts in timestamps:
+        item = dict(ts)
+        for key in ("begin_time", "end_time"):
+            if isinstance(item.get(key), (int, float)):
+                item[key] = min(duration_ms, max(0, round(item[key] - offset_ms)))
+        shifted.append(item)
+    return shifted
+
+
+class AudioPostProcessor:
+    """
+    WAV 音频后处理器
+
+    只处理 WAV 输入（Qwen-TTS），CosyVoice 返回的 MP3 已经是压缩格式，原样返回。
+    """
+
+    def __init__(self, output_format: str = "mp3", bitrate: str = "64k", trim_silence: bool = True,
+                 silence_threshold_db: float = -45.0):
+        """
+        Args:
+            output_format: 转码格式，见 OUTPUT_FORMATS；为 "wav" 时只裁剪静音不转码
+            bitrate: ffmpeg 目标码率，例如 "64k"
+            trim_silence: 是否去除首尾静音
+            silence_threshold_db: 静音阈值（相对满幅的 dBFS）
+        """
+        self.output_format = output_format if output_format in OUTPUT_FORMATS else "wav"
+        self.bitrate = bitrate
+        self.trim_silence = trim_silence
+        self.silence_threshold_db = silence_threshold_db
+        self.ffmpeg_path = shutil.which("ffmpeg") if self.output_format != "wav" else None
+        if self.output_format != "wav" and not self.ffmpeg_path:
+            logger.warning(f"[{self.__class__.__name__}] ffmpeg not found, audio will be kept as WAV.")
+        logger.debug(f"[{self.__class__.__name__}] Initialized: format={self.output_format}, "
+                     f"bitrate={self.bitrate}, trim_silence={self.trim_silence}, ffmpeg={self.ffmpeg_path}")
+
+    @classmethod
+    def from_config(cls, config: dict | None) -> Optional["AudioPostProcessor"]:
+        """
+        根据配置创建后处理器
+
+        Returns:
+            AudioPostProcessor 实例；未启用时返回 None
+        """
+        options = (config or {}).get("audio_postprocess_options", {})
+        if not isinstance(options, dict) or not options.get("enabled", False):
+            return None
+        return cls(output_format=options.get("format", "mp3"), bitrate=options.get("bitrate", "64k"),
+                   trim_silence=options.get("trim_silence", True),
+                   silence_threshold_db=options.get("silence_threshold_db", -45.0))
+
+    @property
+    def fingerprint(self) -> dict:
+        """后处理参数，作为 TTS 缓存指纹的一部分"""
+        return {
+            "format": self.target_format("wav"),
+            "bitrate": self.bitrate,
+            "trim_silence": self.trim_silence,
+            "silence_threshold_db": self.silence_threshold_db,
+        }
+
+    def target_format(self, source_format: str) -> str:
+        """返回给定输入格式处理后的文件后缀"""
+        if source_format != "wav" or not self.ffmpeg_path:
+            return source_format
+        return OUTPUT_FORMATS[self.output_format][2]
+
+    @staticmethod
+    def source_path(output_path: str, source_format: str) -> str:
+        """返回 TTS 原始输出应写入的路径（与最终文件同名，后缀为原始格式）"""
+        return f"{os.path.splitext(output_path)[0]}.{source_format}"
+
+    def process(self, source_path: str, output_path: str, timestamps: Optional[List[Dict[str, Any]]],
+                reestimate: Optional[Callable[[str], Optional[List[Dict[str, Any]]]]] = None
+                ) -> Tuple[str, Optional[List[Dict[str, Any]]]]:
+        """
+        对合成的音频进行后处理
+
+        Args:
+            source_path: TTS 输出的原始音频
+            output_path: 期望的最终文件路径
+            timestamps: 字级别时间戳（毫秒）
+            reestimate: 可选，以裁剪后的 WAV 路径重新估算时间戳；时间戳是按未裁剪音频的时长估算时
+                        必须提供，否则静音被平均分给各字符，平移后开头的字符会被压缩到 0
+
+        Returns:
+            (实际音频路径, 调整后的时间戳)；任一步骤失败时保留上一步的结果
+        """
+        if not source_path.lower().endswith(".wav"):
+            return source_path, timestamps
+        if self.trim_silence:
+            try:
+                timestamps = self._trim_wav(source_path, timestamps, reestimate)
+            except (OSError, wave.Error, EOFError) as e:
+                logger.warning(f"[{self.__class__.__name__}] Failed to trim silence in '{source_path}': {e}")
+        if source_path == output_path or not self.ffmpeg_path:
+            return source_path, timestamps
+        if self._transcode(source_path, output_path):
+            try:
+                os.remove(source_path)
+            except OSError:
+                pass
+            return output_path, timestamps
+        return source_path, timestamps
+
+    def _trim_wav(self, path: str, timestamps: Optional[List[Dict[str, Any]]],
+                  reestimate: Optional[Callable[[str], Optional[List[Dict[str, Any]]]]] = None
+                  ) -> Optional[List[Dict[str, Any]]]:
+        """原地裁剪 WAV 首尾静音，返回重新估算或平移后的时间戳"""
+        with wave.open(path, "rb") as wav:
+            channels, sample_width, sample_rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+            frames = wav.readframes(wav.getnframes())
+        if sample_width != 2:
+            logger.debug(f"[{self.__class__.__name__}] Skipping silence trim for {sample_width * 8}-bit WAV.")
+            return timestamps
+
+        samples = array("h", frames)
+        if sys.byteorder == "big":
+            samples.byteswap()
+        threshold = int(32767 * 10 ** (self.silence_threshold_db / 20))
+        voiced = find_voiced_range(samples, channels, sample_rate, threshold)
+        if voiced is None:
+            return timestamps
+
+        padding = sample_rate * SILENCE_PADDING_MS // 1000
+        total_frames = len(samples) // channels
+        start = max(0, voiced[0] - padding)
+        end = min(total_frames, voiced[1] + padding)
+        if start == 0 and end == total_frames:
+            return timestamps
+
+        frame_size = channels * sample_width
+        data = frames[start * frame_size:end * frame_size]
+        with AtomicFileWriter(path) as writer:
+            writer.write(wav_header(len(data), sample_rate, channels, sample_width))
+            writer.write(data)
+            writer.commit()
+
+        offset_ms = start * 1000 // sample_rate
+        duration_ms = (end - start) * 1000 // sample_rate
+        logger.debug(f"[{self.__class__.__name__}] Trimmed {offset_ms}ms leading and "
+                     f"{(total_frames - end) * 1000 // sample_rate}ms trailing silence.")
+        if timestamps and reestimate:
+            estimated = reestimate(path)
+            if estimated:
+                return estimated
+        return shift_timestamps(timestamps, offset_ms, duration_ms)
+
+    def _transcode(self, source_path: str, output_path: str) -> bool:
+        """调用 ffmpeg 转码，先写入临时文件再替换目标文件"""
+        codec, container, _ = OUTPUT_FORMATS[self.output_format]
+        directory, name = os.path.split(os.path.abspath(output_path))
+        fd, temp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".part", dir=directory)
+        os.close(fd)
+        command = [self.ffmpeg_path, "-y", "-hide_banner", "-loglevel", "error", "-i", source_path,
+                   "-vn", "-c:a", codec, "-b:a", self.bitrate, "-f", container, temp_path]
+        try:
+            # Windows 上避免弹出控制台窗口
+            result = subprocess.run(command, capture_output=True, timeout=TRANSCODE_TIMEOUT,
+                                    creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0))
+            if result.returncode != 0 or os.path.getsize(temp_path) == 0:
+                logger.warning(f"[{self.__class__.__name__}] ffmpeg failed ({result.returncode}): "
+                               f"{result.stderr.decode('utf-8', 'replace').strip()[:500]}")
+                return False
+            os.replace(temp_path, output_path)
+            logger.info(f"[{self.__class__.__name__}] Transcoded '{os.path.basename(source_path)}' to "
+                        f"{self.output_format} ({os.path.getsize(output_path)} bytes).")
+            return True
+        except (OSError, subprocess.SubprocessError) as e:
+            logger.warning(f"[{self.__class__.__name__}] ffmpeg transcode failed: {e}")
+            return False
+        finally:
+            if os.path.exists(temp_path):
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
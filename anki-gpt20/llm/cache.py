@@ -0,0 +1,305 @@
+# anki_gpt_addon/llm/cache.py
+"""
+持久化缓存模块
+以内容哈希为键，将 LLM 分析结果保存在插件的 user_files 目录中，按总大小进行 LRU 淘汰；
+并记录媒体目录中已合成音频的元数据（合成参数指纹、文件大小、时间戳），用于跳过重复的 TTS 调用。
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import unicodedata
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..consts import ADDON_NAME
+
+logger = logging.getLogger(ADDON_NAME)
+
+# 插件根目录（llm 的父目录）；user_files 目录在插件更新时会被 Anki 保留
+addon_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CACHE_DIR = os.path.join(addon_dir, "user_files", "cache")
+
+DEFAULT_ANALYSIS_CACHE_MAX_MB = 50
+# 音频文件锁的分段数：按文件名哈希映射到固定数量的锁，锁的数量不随文件数增长
+TTS_LOCK_STRIPES = 64
+
+
+def normalize_sentence(text: str) -> str:
+    """规范化句子用于生成缓存键：NFKC 归一化、合并空白、去掉首尾空白"""
+    text = unicodedata.normalize("NFKC", text or "")
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class AnalysisCache:
+    """
+    LLM 分析结果的磁盘缓存
+
+    键由模型名、提示词变体（普通 / ASR）和规范化后的句子共同决定。
+    每个条目保存为一个 JSON 文件，内存中维护按访问顺序排列的索引，
+    总大小超过上限时淘汰最久未使用的条目。
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index: "OrderedDict[str, int]" = OrderedDict()  # key -> 文件大小
+        self._total_bytes = 0
+        self._load_index()
+
+    @staticmethod
+    def make_key(model: str, variant: str, sentence: str) -> str:
+        payload = json.dumps([model, variant, normalize_sentence(sentence)], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path_for(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _load_index(self) -> None:
+        """扫描缓存目录，按文件修改时间（即最近访问时间）重建 LRU 索引"""
+        entries = []
+        if os.path.isdir(self.cache_dir):
+            for root, _dirs, files in os.walk(self.cache_dir):
+                for name in files:
+                    if not name.endswith(".json"):
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, name[:-5], stat.st_size))
+        for _mtime, key, size in sorted(entries):
+            self._index[key] = size
+            self._total_bytes += size
+        logger.debug(f"[{self.__class__.__name__}] Loaded {len(self._index)} entries "
+                     f"({self._total_bytes} bytes) from '{self.cache_dir}'.")
+
+    def get(self, model: str, variant: str, sentence: str) -> Optional[str]:
+        """
+        读取缓存的分析结果
+
+        Returns:
+            缓存的 markdown 内容，未命中时返回 None
+        """
+        key = self.make_key(model, variant, sentence)
+        path = self._path_for(key)
+        with self._lock:
+            if key in self._index:
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        content = json.load(f)["content"]
+                    # 更新访问顺序和文件时间，以便重启后仍保持 LRU 顺序
+                    self._index.move_to_end(key)
+                    os.utime(path, None)
+                    self.hits += 1
+                    return content
+                except (OSError, ValueError, KeyError) as e:
+                    logger.warning(f"[{self.__class__.__name__}] Dropping unreadable cache entry {key}: {e}")
+                    self._remove(key)
+            self.misses += 1
+            return None
+
+    def put(self, model: str, variant: str, sentence: str, content: str) -> None:
+        """写入分析结果，必要时淘汰最久未使用的条目"""
+        key = self.make_key(model, variant, sentence)
+        path = self._path_for(key)
+        data = json.dumps({"model": model, "variant": variant, "sentence": sentence, "content": content},
+                          ensure_ascii=False).encode("utf-8")
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                logger.warning(f"[{self.__class__.__name__}] Failed to write cache entry {key}: {e}")
+                return
+            self._total_bytes -= self._index.pop(key, 0)
+            self._index[key] = len(data)
+            self._total_bytes += len(data)
+            self._evict()
+
+    def _evict(self) -> None:
+        while self._total_bytes > self.max_bytes and len(self._index) > 1:
+            oldest_key = next(iter(self._index))
+            self._remove(oldest_key)
+
+    def _remove(self, key: str) -> None:
+        self._total_bytes -= self._index.pop(key, 0)
+        try:
+            os.remove(self._path_for(key))
+        except OSError:
+            pass
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """返回命中/未命中计数和当前缓存大小"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._index),
+                "bytes": self._total_bytes,
+            }
+
+
+class TTSResultCache:
+    """
+    TTS 结果缓存
+
+    音频文件本身保存在 Anki 媒体目录中（文件名为假名文本的 md5），
+    此缓存只在 user_files 中为每个音频文件保存一份元数据：
+    合成参数指纹（音色/模型/SSML 规则等）、文件大小和时间戳。
+    只有文件存在、大小一致且指纹匹配时才视为命中。
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._key_locks = [threading.Lock() for _ in range(TTS_LOCK_STRIPES)]
+
+    @staticmethod
+    def make_fingerprint(text: str, params: Dict[str, Any]) -> str:
+        payload = json.dumps([text, params], ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _meta_path(self, audio_path: str) -> str:
+        return os.path.join(self.cache_dir, f"{os.path.basename(audio_path)}.json")
+
+    def lock_for(self, audio_path: str) -> threading.Lock:
+        """
+        返回某个音频文件的锁（按文件名哈希分段，不同文件可能共用同一把锁）。
+        并发合成同一文本时，后到者等待先到者完成后直接命中缓存，而不是重复合成并覆盖文件。
+        """
+        name = os.path.basename(audio_path)
+        return self._key_locks[zlib.crc32(name.encode("utf-8")) % TTS_LOCK_STRIPES]
+
+    def get(self, output_path: str, text: str, params: Dict[str, Any]) -> Optional[Tuple[str, Optional[List]]]:
+        """
+        查询缓存
+
+        Args:
+            output_path: 期望的音频路径，作为缓存键
+            text: 合成的文本
+            params: 合成参数
+
+        Returns:
+            命中时返回 (实际音频路径, timestamps)；后处理失败时实际文件可能与 output_path 后缀不同。未命中返回 None
+        """
+        try:
+            with open(self._meta_path(output_path), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            audio_path = os.path.join(os.path.dirname(output_path),
+                                      meta.get("filename") or os.path.basename(output_path))
+            valid = (meta.get("fingerprint") == self.make_fingerprint(text, params)
+                     and os.path.getsize(audio_path) == meta.get("size", -1) > 0)
+        except (OSError, ValueError):
+            valid = False
+        with self._lock:
+            if valid:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if not valid:
+            return None
+        return audio_path, meta.get("timestamps")
+
+    def put(self, output_path: str, text: str, params: Dict[str, Any], timestamps: Optional[List],
+            audio_path: Optional[str] = None) -> None:
+        """
+        记录一次成功合成的结果
+
+        Args:
+            output_path: 期望的音频路径，作为缓存键
+            text: 合成的文本
+            params: 合成参数
+            timestamps: 时间戳
+            audio_path: 实际写入的音频路径（与 output_path 在同一目录），默认为 output_path
+        """
+        audio_path = audio_path or output_path
+        try:
+            size = os.path.getsize(audio_path)
+            meta = {
+                "fingerprint": self.make_fingerprint(text, params),
+                "filename": os.path.basename(audio_path),
+                "size": size,
+                "timestamps": timestamps,
+            }
+            meta_path = self._meta_path(output_path)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{meta_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False)
+            os.replace(tmp_path, meta_path)
+        except OSError as e:
+            logger.warning(f"[{self.__class__.__name__}] Failed to record TTS cache entry for '{audio_path}': {e}")
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+_analysis_cache: Optional[AnalysisCache] = None
+_analysis_cache_lock = threading.Lock()
+
+
+def get_analysis_cache(config: dict | None) -> Optional[AnalysisCache]:
+    """
+    根据配置返回进程内共享的分析缓存实例
+
+    Args:
+        config: 插件的完整配置字典
+
+    Returns:
+        AnalysisCache 实例；缓存被禁用时返回 None
+    """
+    global _analysis_cache
+    options = (config or {}).get("llm_cache_options", {})
+    if not options.get("enabled", True):
+        return None
+    try:
+        max_bytes = int(float(options.get("max_size_mb", DEFAULT_ANALYSIS_CACHE_MAX_MB)) * 1024 * 1024)
+    except (TypeError, ValueError):
+        max_bytes = DEFAULT_ANALYSIS_CACHE_MAX_MB * 1024 * 1024
+    with _analysis_cache_lock:
+        if _analysis_cache is None:
+            _analysis_cache = AnalysisCache(os.path.join(DEFAULT_CACHE_DIR, "llm"), max_bytes)
+        elif _analysis_cache.max_bytes != max_bytes:
+            with _analysis_cache._lock:
+                _analysis_cache.max_bytes = max_bytes
+                _analysis_cache._evict()
+        return _analysis_cache
+
+
+_tts_cache: Optional[TTSResultCache] = None
+
+
+def get_tts_cache(config: dict | None) -> Optional[TTSResultCache]:
+    """
+    根据配置返回进程内共享的 TTS 结果缓存实例
+
+    Args:
+        config: 插件的完整配置字典
+
+    Returns:
+        TTSResultCache 实例；缓存被禁用时返回 None
+    """
+    global _tts_cache
+    options = (config or {}).get("tts_cache_options", {})
+    if not options.get("enabled", True):
+        return None
+    with _analysis_cache_lock:
+        if _tts_cache is None:
+            _tts_cache = TTSResultCache(os.path.join(DEFAULT_CACHE_DIR, "tts"))
+        return _tts_cache
@@ -3,26 +3,91 @@ import hashlib
 import os
 import logging
 import re
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
 
-from .interfaces import LLMService, TTSService
+from .audio import AudioPostProcessor
+from .cache import TTSResultCache
+from .interfaces import LLMService, RequestCancelled, TTSService
 from .utils import markdown_to_anki_html
 from ..consts import ADDON_NAME
 
 logger = logging.getLogger(ADDON_NAME)
 
 
+class StreamingKanaExtractor:
+    """
+    在 LLM 流式输出过程中增量检测句子读法中的假名行
+
+    只在假名行完整输出（出现换行）后才返回结果，避免用截断的读音合成音频。
+    """
+
+    def __init__(self):
+        self.kana_text: str | None = None
+        self._done = False
+        self._section_start = -1
+
+    def feed(self, markdown_content: str) -> str | None:
+        """
+        传入当前累计的 markdown 文本
+
+        Returns:
+            首次检测到完整的假名行时返回假名文本，其余情况返回 None
+        """
+        if self._done:
+            return None
+        if self._section_start < 0:
+            self._section_start = markdown_content.find('句子读法')
+            if self._section_start < 0:
+                return None
+        # 只检查已经完整输出的行，第一行是标题本身
+        complete = markdown_content[self._section_start:markdown_content.rfind('\n') + 1]
+        for line in complete.split('\n')[1:]:
+            stripped = line.strip()
+            if stripped.startswith('-'):
+                kana_text = stripped[1:].strip()
+                if kana_text:
+                    self._done = True
+                    self.kana_text = kana_text
+                    return kana_text
+            elif stripped.startswith('**') and '**' in stripped[2:]:
+                # 已经进入下一个小节，交给完整结果的提取逻辑处理
+                self._done = True
+                return None
+        return None
+
+
 class AnkiCardGenerator:
-    def __init__(self, llm_service: LLMService, tts_service: TTSService):
+    def __init__(self, llm_service: LLMService, tts_service: TTSService, tts_cache: TTSResultCache | None = None,
+                 audio_processor: AudioPostProcessor | None = None):
         self.llm_service = llm_service
         self.tts_service = tts_service
+        self.tts_cache = tts_cache
+        self.audio_processor = audio_processor
         logger.debug(
             f"AnkiCardGenerator initialized with {llm_service.__class__.__name__} and {tts_service.__class__.__name__}.")
 
-    def generate_card_content(self, japanese_sentence: str, output_audio_dir: str) -> tuple[
+    def close(self) -> None:
+        """关闭注入的 LLM 和 TTS 服务（服务注册表丢弃此生成器时调用）"""
+        for service in (self.llm_service, self.tts_service):
+            if service is None:
+                continue
+            try:
+                service.close()
+            except Exception as e:
+                logger.warning(f"Failed to close {service.__class__.__name__}: {e}")
+
+    def generate_card_content(self, japanese_sentence: str, output_audio_dir: str,
+                              on_llm_partial: Callable[[str], None] | None = None) -> tuple[
         str, str | None, list | None, str | None]:
         """
         生成卡片内容
         
+        Args:
+            japanese_sentence: 日文句子
+            output_audio_dir: 音频文件保存目录
+            on_llm_partial: 可选的流式回调，LLM 生成过程中以累计的 markdown 文本调用
+        
         Returns:
             tuple: (back_content_html, audio_path, timestamps, kana_text)
             - back_content_html: 卡片背面内容（HTML格式）
@@ -32,57 +97,176 @@ class AnkiCardGenerator:
         """
         logger.info(f"Starting card generation for: '{japanese_sentence}'")
 
+        if on_llm_partial:
+            return self._generate_card_content_streaming(japanese_sentence, output_audio_dir, on_llm_partial)
+
         # 先调用 LLM 生成内容
-        back_content_html = None
-        back_content_md = None
+        back_content_html, back_content_md = self.generate_analysis(japanese_sentence)
+
+        # 如果 LLM 生成失败，直接返回
+        if not back_content_html or not back_content_md:
+            return back_content_html, None, None, None
+
+        # 从 LLM 结果中提取句子读法的假名部分
+        kana_text = self.extract_kana(back_content_md, japanese_sentence)
+
+        # 调用 TTS 生成音频
+        audio_path, timestamps = self.synthesize(kana_text, output_audio_dir)
+
+        return back_content_html, audio_path, timestamps, kana_text
+
+    def _generate_card_content_streaming(self, japanese_sentence: str, output_audio_dir: str,
+                                         on_llm_partial: Callable[[str], None]) -> tuple[
+        str, str | None, list | None, str | None]:
+        """
+        流式生成卡片内容
+
+        句子读法的假名行通常紧跟在翻译之后输出，一旦在流中检测到完整的假名行，
+        就在后台线程中立即开始 TTS，与 LLM 输出单词和语法解释并行进行，
+        预览耗时约为 max(LLM, TTS) 而不是 LLM + TTS。
+        """
+        extractor = StreamingKanaExtractor()
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"{ADDON_NAME}-early-tts")
+        early_tts: Future | None = None
+
+        def on_partial(markdown_content: str) -> None:
+            nonlocal early_tts
+            kana_text = extractor.feed(markdown_content)
+            if kana_text and self.tts_service:
+                logger.info(f"在流式输出中检测到假名，提前开始 TTS: '{kana_text}'")
+                early_tts = executor.submit(self.synthesize, kana_text, output_audio_dir)
+            on_llm_partial(markdown_content)
+
+        try:
+            back_content_html, back_content_md = self.generate_analysis(japanese_sentence, on_partial)
+            if not back_content_html or not back_content_md:
+                return back_content_html, None, None, None
+
+            kana_text = self.extract_kana(back_content_md, japanese_sentence)
+            if early_tts is not None:
+                early_audio_path, early_timestamps = early_tts.result()
+                # 完整结果中的读法与流中检测到的一致时直接复用提前合成的音频
+                if kana_text == extractor.kana_text:
+                    return back_content_html, early_audio_path, early_timestamps, kana_text
+                logger.warning(f"完整结果中的假名与流式检测结果不一致，重新合成: "
+                               f"'{extractor.kana_text}' -> '{kana_text}'")
+            audio_path, timestamps = self.synthesize(kana_text, output_audio_dir)
+            return back_content_html, audio_path, timestamps, kana_text
+        finally:
+            executor.shutdown(wait=False)
+
+    def generate_analysis(self, japanese_sentence: str,
+                          on_partial: Callable[[str], None] | None = None) -> tuple[str | None, str | None]:
+        """
+        LLM 阶段：生成分析内容
+
+        Args:
+            japanese_sentence: 日文句子
+            on_partial: 提供时使用流式输出，并以累计的 markdown 文本回调
+
+        Returns:
+            tuple: (back_content_html, back_content_md)，失败时均为 None
+        """
         try:
-            back_content_md = self.llm_service.generate_analysis(japanese_sentence)
+            if on_partial:
+                back_content_md = self.llm_service.stream_analysis(japanese_sentence, on_partial)
+            else:
+                back_content_md = self.llm_service.generate_analysis(japanese_sentence)
             back_content_html = markdown_to_anki_html(back_content_md)
             logger.info("LLM content generation completed.")
+            return back_content_html, back_content_md
+        except RequestCancelled:
+            raise
         except Exception as e:
             logger.exception(f"LLM generation failed: {e}")
-            back_content_html = None
-            back_content_md = None
+            return None, None
 
-        # 如果 LLM 生成失败，直接返回
-        if not back_content_html or not back_content_md:
-            return back_content_html, None, None, None
+    def generate_analyses(self, japanese_sentences: list[str]) -> list[tuple[str | None, str | None]]:
+        """
+        LLM 阶段（批量）：在尽量少的请求中为多个句子生成分析内容
 
-        # 从 LLM 结果中提取句子读法的假名部分
+        Returns:
+            与输入顺序一致的 (back_content_html, back_content_md) 列表
+        """
+        if len(japanese_sentences) == 1:
+            return [self.generate_analysis(japanese_sentences[0])]
+        try:
+            markdowns = self.llm_service.generate_batch_analysis(japanese_sentences)
+            logger.info(f"LLM batch content generation completed for {len(japanese_sentences)} sentences.")
+        except Exception as e:
+            logger.exception(f"LLM batch generation failed, falling back to per-sentence calls: {e}")
+            return [self.generate_analysis(sentence) for sentence in japanese_sentences]
+        return [(markdown_to_anki_html(md), md) if md else (None, None) for md in markdowns]
+
+    def extract_kana(self, back_content_md: str, japanese_sentence: str) -> str:
+        """
+        假名提取阶段：从 LLM 结果中提取句子读法，未提取到时使用原句作为后备
+
+        Returns:
+            用于 TTS 的文本
+        """
         kana_text = self._extract_kana_from_llm_result(back_content_md)
-        
+
         # 如果没有提取到假名，使用原始日文句子作为后备
         if not kana_text:
             logger.warning("未能从 LLM 结果中提取假名，使用原始日文句子作为 TTS 输入")
-            kana_text = japanese_sentence
-        else:
-            logger.info(f"从 LLM 结果中提取到假名: '{kana_text}'")
+            return japanese_sentence
+        logger.info(f"从 LLM 结果中提取到假名: '{kana_text}'")
+        return kana_text
 
-        # 准备 TTS 输出路径
-        audio_path = None
-        timestamps = None
-        
-        if self.tts_service:
-            # 使用提取的假名生成音频文件名（基于假名内容）
-            audio_format = self.tts_service.audio_format
-            filename = f"{hashlib.md5(kana_text.encode('utf-8')).hexdigest()}.{audio_format}"
-            output_path = os.path.join(output_audio_dir, filename)
-            
-            # 调用 TTS 生成音频
-            try:
-                logger.info(f"Attempting to generate TTS audio with kana text: '{kana_text}'")
-                success, timestamps = self.tts_service.synthesize_speech(kana_text, output_path)
-                if success:
-                    audio_path = output_path
-                    logger.info(f"TTS generation successful. Timestamps received: {'Yes' if timestamps else 'No'}")
-                else:
-                    logger.warning("TTS generation failed.")
-            except Exception as e:
-                logger.exception(f"TTS generation failed with exception: {e}")
-                audio_path = None
-                timestamps = None
+    def synthesize(self, kana_text: str, output_audio_dir: str) -> tuple[str | None, list | None]:
+        """
+        TTS 阶段：使用假名文本生成音频文件
 
-        return back_content_html, audio_path, timestamps, kana_text
+        Returns:
+            tuple: (audio_path, timestamps)，失败时均为 None
+        """
+        if not self.tts_service:
+            return None, None
+
+        # 使用提取的假名生成音频文件名（基于假名内容）
+        audio_format = self.tts_service.audio_format
+        if self.audio_processor:
+            audio_format = self.audio_processor.target_format(audio_format)
+        filename = f"{hashlib.md5(kana_text.encode('utf-8')).hexdigest()}.{audio_format}"
+        output_path = os.path.join(output_audio_dir, filename)
+
+        fingerprint = self.tts_service.cache_fingerprint if self.tts_cache else {}
+        if fingerprint and self.audio_processor:
+            fingerprint = {**fingerprint, "postprocess": self.audio_processor.fingerprint}
+        if not fingerprint:
+            return self._synthesize_uncached(kana_text, output_path)
+
+        with self.tts_cache.lock_for(output_path):
+            cached = self.tts_cache.get(output_path, kana_text, fingerprint)
+            if cached:
+                logger.info(f"Reusing cached TTS audio '{os.path.basename(cached[0])}' ({self.tts_cache.stats}).")
+                return cached
+            audio_path, timestamps = self._synthesize_uncached(kana_text, output_path)
+            if audio_path:
+                # 转码失败时实际文件仍是 WAV；缓存仍以 output_path 为键，后续查询才能命中
+                self.tts_cache.put(output_path, kana_text, fingerprint, timestamps, audio_path=audio_path)
+            return audio_path, timestamps
+
+    def _synthesize_uncached(self, kana_text: str, output_path: str) -> tuple[str | None, list | None]:
+        """调用 TTS 服务实际合成音频"""
+        try:
+            logger.info(f"Attempting to generate TTS audio with kana text: '{kana_text}'")
+            source_path = output_path
+            if self.audio_processor:
+                source_path = self.audio_processor.source_path(output_path, self.tts_service.audio_format)
+            success, timestamps = self.tts_service.synthesize_speech(kana_text, source_path)
+            if success:
+                logger.info(f"TTS generation successful. Timestamps received: {'Yes' if timestamps else 'No'}")
+                if self.audio_processor:
+                    return self.audio_processor.process(
+                        source_path, output_path, timestamps,
+                        reestimate=lambda path: self.tts_service.reestimate_timestamps(kana_text, path))
+                return source_path, timestamps
+            logger.warning("TTS generation failed.")
+        except Exception as e:
+            logger.exception(f"TTS generation failed with exception: {e}")
+        return None, None
     
     def _extract_kana_from_llm_result(self, markdown_content: str) -> str | None:
         """
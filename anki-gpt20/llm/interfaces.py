@@ -1,12 +1,38 @@
 # anki_gpt_addon/llm/interfaces.py
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional, List
+from typing import Callable, Dict, Any, Optional, List
+
+
+class RequestCancelled(Exception):
+    """请求已被取消或被更新的请求取代；流式回调抛出该异常时会中止生成"""
+
 
 class LLMService(ABC):
     @abstractmethod
     def generate_analysis(self, japanese_sentence: str) -> str:
         pass
 
+    def stream_analysis(self, japanese_sentence: str, on_delta: Callable[[str], None]) -> str:
+        """
+        流式生成分析内容：每收到新内容时以当前累计的完整文本调用 on_delta，最后返回完整文本。
+        on_delta 抛出 RequestCancelled 时应中止生成并向上传播。
+        默认实现不支持增量输出，只在生成完成后回调一次。
+        """
+        content = self.generate_analysis(japanese_sentence)
+        on_delta(content)
+        return content
+
+    def generate_batch_analysis(self, japanese_sentences: List[str]) -> List[str]:
+        """
+        批量生成分析内容，返回与输入顺序一致的 markdown 列表。
+        默认逐句调用 generate_analysis，支持单次请求处理多句的服务可以重写此方法。
+        """
+        return [self.generate_analysis(sentence) for sentence in japanese_sentences]
+
+    def close(self) -> None:
+        """释放服务持有的连接等资源；服务注册表按新配置重建服务时调用，默认无需处理"""
+        pass
+
 class TTSService(ABC):
     @property
     @abstractmethod
@@ -14,10 +40,29 @@ class TTSService(ABC):
         """返回此服务生成的音频格式后缀 (例如 'mp3' 或 'wav')。"""
         pass
 
+    @property
+    def cache_fingerprint(self) -> Dict[str, Any]:
+        """
+        返回影响合成结果的参数（模型、音色、SSML 规则等）。
+        TTS 结果缓存用它判断已存在的音频文件能否被复用；返回空字典表示不可缓存。
+        """
+        return {}
+
     @abstractmethod
     def synthesize_speech(self, text: str, output_path: str) -> tuple[bool, list | None]:
         pass
 
+    def reestimate_timestamps(self, text: str, audio_path: str) -> list | None:
+        """
+        按处理后的音频（例如去除首尾静音后）重新估算时间戳。
+        只有时间戳由本地估算而非 API 返回的服务需要实现；返回 None 表示沿用平移后的原时间戳。
+        """
+        return None
+
+    def close(self) -> None:
+        """释放服务持有的连接等资源；服务注册表按新配置重建服务时调用，默认无需处理"""
+        pass
+
 class ASRService(ABC):
     """音频转文字服务抽象基类"""
     
@@ -0,0 +1,251 @@
+# anki_gpt_addon/llm/pipeline.py
+"""
+分阶段卡片生成流水线
+将 AnkiCardGenerator 的同步调用链拆分为 LLM → 假名提取 → TTS → 时间戳对齐 → 写入 五个阶段，
+每个阶段拥有独立的有界队列和并发数，慢速的 TTS 会话不会阻塞 LLM 的吞吐。
+"""
+import logging
+import queue
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from .generator import AnkiCardGenerator
+from ..consts import ADDON_NAME
+
+logger = logging.getLogger(ADDON_NAME)
+
+# 工作线程退出信号
+_STOP = object()
+# 投料线程和重排循环检查停止/取消的间隔（秒）
+STOP_POLL_INTERVAL = 0.2
+
+
+def _release_once(semaphore: threading.Semaphore) -> Callable[[], None]:
+    """返回只释放一次 semaphore 的回调"""
+    released = threading.Event()
+
+    def done() -> None:
+        if not released.is_set():
+            released.set()
+            semaphore.release()
+
+    return done
+
+
+class PipelineStage:
+    """流水线中的单个阶段：一个有界输入队列和若干工作线程"""
+
+    def __init__(self, name: str, func: Callable[[Any], None], workers: int, queue_size: int,
+                 batched: bool = False):
+        """
+        Args:
+            name: 阶段名称（用于日志和线程名）
+            func: 阶段处理函数，原地更新条目字典
+            workers: 工作线程数
+            queue_size: 输入队列容量（队列满时上游阻塞，形成背压）
+            batched: 为 True 时队列中的元素是条目列表，func 接收整个列表，完成后逐条向下游转发
+        """
+        self.name = name
+        self.func = func
+        self.batched = batched
+        self.workers = max(1, workers)
+        self.queue: queue.Queue = queue.Queue(maxsize=max(1, queue_size))
+        self.next_queue: Optional[queue.Queue] = None
+        # 返回 True 时不再处理新条目，只标记为已取消并透传，使下游尽快排空
+        self.should_stop: Callable[[], bool] = lambda: False
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"{ADDON_NAME}-{self.name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self) -> None:
+        for _ in self._threads:
+            self.queue.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _worker(self) -> None:
+        while True:
+            element = self.queue.get()
+            if element is _STOP:
+                return
+            items = element if self.batched else [element]
+            # 前面阶段已失败的条目直接透传，不再处理
+            active = [item for item in items if not item.get("error")]
+            if active and self.should_stop():
+                for item in active:
+                    item["error"] = "已取消"
+                active = []
+            if active:
+                try:
+                    self.func(active if self.batched else active[0])
+                except Exception as e:
+                    logger.exception(f"[CardPipeline] Stage '{self.name}' failed for items "
+                                     f"{[item.get('index') for item in active]}: {e}")
+                    for item in active:
+                        item["error"] = str(e)
+            for item in items:
+                self.next_queue.put(item)
+
+
+class CardPipeline:
+    """
+    分阶段并发的卡片生成流水线
+
+    每个句子作为一个条目字典依次流经各阶段：
+    {"index", "sentence", "back_content", "back_content_md", "kana_text", "audio_path", "timestamps", "error"}
+    最终由调用线程按原始句子顺序交给 sink（写入阶段）。sink 写入完成后调用 done 释放该条目的在途名额，
+    写入在主线程中异步进行时，主线程积压的条目同样计入在途上限。
+    is_cancelled 返回 True 或调用线程异常退出时，投料线程停止投料，各阶段不再处理剩余条目。
+    """
+
+    def __init__(self, card_generator: AnkiCardGenerator, output_audio_dir: str,
+                 align_func: Optional[Callable[[str, str, list], list]] = None,
+                 llm_workers: int = 4, tts_workers: int = 2, queue_size: int = 8, llm_batch_size: int = 1,
+                 sink_capacity: int = 1):
+        """
+        Args:
+            card_generator: 注入了 LLM 和 TTS 服务的卡片生成器
+            output_audio_dir: 音频文件保存目录
+            align_func: 时间戳对齐函数 (original_text, kana_text, kana_timestamps) -> timestamps
+            llm_workers: LLM 阶段并发数
+            tts_workers: TTS 阶段并发数
+            queue_size: 每个阶段的队列容量
+            llm_batch_size: 每次 LLM 请求打包的句子数，1 表示逐句请求
+            sink_capacity: sink 在调用 done 之前最多攒下的条目数（例如写入批大小）
+        """
+        self.card_generator = card_generator
+        self.output_audio_dir = output_audio_dir
+        self.align_func = align_func
+        self.queue_size = max(1, queue_size)
+        self.llm_batch_size = max(1, llm_batch_size)
+        self.stages = [
+            PipelineStage("llm", self._llm_stage, llm_workers, self.queue_size, batched=True),
+            PipelineStage("kana", self._kana_stage, 1, self.queue_size),
+            PipelineStage("tts", self._tts_stage, tts_workers, self.queue_size),
+            PipelineStage("align", self._align_stage, 1, self.queue_size),
+        ]
+        # 同时在途的条目上限：所有队列容量加上所有工作线程和 sink 攒批的容量，
+        # 再限制乱序完成时重排缓冲区的大小，使内存占用与输入长度无关
+        self.max_in_flight = (sum(stage.workers for stage in self.stages) + self.queue_size * 2
+                              + self.stages[0].workers * self.llm_batch_size + max(1, sink_capacity))
+
+    def run(self, sentences: List[str], sink: Callable[[Dict[str, Any], Callable[[], None]], None],
+            is_cancelled: Optional[Callable[[], bool]] = None) -> bool:
+        """
+        处理所有句子，并在调用线程中按原始顺序将每个条目交给 sink
+
+        Args:
+            sentences: 句子列表
+            sink: 写入阶段回调 sink(item, done)，按顺序对每个完成的条目调用一次；
+                条目写入后（可以在其他线程中）调用 done 一次。sink 抛出异常时由流水线释放名额
+            is_cancelled: 返回 True 时停止投料并丢弃尚未交给 sink 的条目
+
+        Returns:
+            是否所有条目都已交给 sink；被取消时为 False
+        """
+        total = len(sentences)
+        if total == 0:
+            return True
+        stop = threading.Event()
+
+        def should_stop() -> bool:
+            return stop.is_set() or bool(is_cancelled and is_cancelled())
+
+        output_queue: queue.Queue = queue.Queue()
+        for stage, next_stage in zip(self.stages, self.stages[1:]):
+            stage.next_queue = next_stage.queue
+        self.stages[-1].next_queue = output_queue
+
+        in_flight = threading.Semaphore(self.max_in_flight)
+
+        def feed():
+            chunk = []
+            for index, sentence in enumerate(sentences):
+                # 定时等待名额，调用线程退出或任务取消后不会永远阻塞在这里
+                while not in_flight.acquire(timeout=STOP_POLL_INTERVAL):
+                    if should_stop():
+                        return
+                if should_stop():
+                    return
+                chunk.append({"index": index, "sentence": sentence})
+                if len(chunk) >= self.llm_batch_size:
+                    # 队列满时 put 会阻塞，实现背压
+                    self.stages[0].queue.put(chunk)
+                    chunk = []
+            if chunk:
+                self.stages[0].queue.put(chunk)
+
+        for stage in self.stages:
+            stage.should_stop = should_stop
+            stage.start()
+        feeder = threading.Thread(target=feed, name=f"{ADDON_NAME}-pipeline-feeder", daemon=True)
+        feeder.start()
+
+        logger.info(f"[CardPipeline] Started for {total} sentences "
+                    f"(stages: {', '.join(f'{s.name}x{s.workers}' for s in self.stages)}, "
+                    f"llm batch size: {self.llm_batch_size}, "
+                    f"max in flight: {self.max_in_flight}).")
+        pending: Dict[int, Dict[str, Any]] = {}
+        next_index = 0
+        try:
+            while next_index < total:
+                if should_stop():
+                    break
+                try:
+                    item = output_queue.get(timeout=STOP_POLL_INTERVAL)
+                except queue.Empty:
+                    continue
+                pending[item["index"]] = item
+                # 重排缓冲：只按原始顺序交付
+                while next_index in pending:
+                    ready = pending.pop(next_index)
+                    done = _release_once(in_flight)
+                    try:
+                        sink(ready, done)
+                    except Exception as e:
+                        logger.exception(f"[CardPipeline] Sink failed for item {next_index}: {e}")
+                        done()
+                    next_index += 1
+        finally:
+            stop.set()
+            feeder.join()
+            for stage in self.stages:
+                stage.stop()
+        if next_index < total:
+            logger.info(f"[CardPipeline] Cancelled after {next_index}/{total} sentences.")
+            return False
+        logger.info(f"[CardPipeline] Finished {total} sentences.")
+        return True
+
+    def _llm_stage(self, items: List[Dict[str, Any]]) -> None:
+        results = self.card_generator.generate_analyses([item["sentence"] for item in items])
+        for item, (back_content, back_content_md) in zip(items, results):
+            if not back_content or not back_content_md:
+                item["error"] = "LLM 未能生成内容"
+                continue
+            item["back_content"] = back_content
+            item["back_content_md"] = back_content_md
+
+    def _kana_stage(self, item: Dict[str, Any]) -> None:
+        item["kana_text"] = self.card_generator.extract_kana(item["back_content_md"], item["sentence"])
+        # 后续阶段不再需要原始 markdown，尽早释放
+        item.pop("back_content_md", None)
+
+    def _tts_stage(self, item: Dict[str, Any]) -> None:
+        audio_path, timestamps = self.card_generator.synthesize(item["kana_text"], self.output_audio_dir)
+        item["audio_path"] = audio_path
+        item["timestamps"] = timestamps
+
+    def _align_stage(self, item: Dict[str, Any]) -> None:
+        timestamps = item.get("timestamps")
+        kana_text = item.get("kana_text")
+        sentence = item["sentence"]
+        if self.align_func and timestamps and kana_text and kana_text != sentence:
+            item["timestamps"] = self.align_func(sentence, kana_text, timestamps)
+        else:
+            item["timestamps"] = timestamps or []
@@ -1,15 +1,21 @@
 # anki_gpt_addon/llm/providers/cosyvoice_tts.py
+import inspect
 import logging
 import html
 import json
-from io import BytesIO
 import threading
+from contextlib import contextmanager
 import dashscope
 from dashscope.audio.tts_v2 import SpeechSynthesizer, AudioFormat, ResultCallback
 
+try:
+    from dashscope.audio.tts_v2 import SpeechSynthesizerObjectPool
+except ImportError:  # 旧版 SDK 没有连接池
+    SpeechSynthesizerObjectPool = None
+
 # 相对导入
 from ..interfaces import TTSService
-from ..utils import estimate_timestamps
+from ..utils import AtomicFileWriter, estimate_timestamps
 from ...consts import ADDON_NAME
 
 logger = logging.getLogger(ADDON_NAME)
@@ -18,6 +24,201 @@ logger = logging.getLogger(ADDON_NAME)
 COSYVOICE_TTS_MODEL = "cosyvoice-v2"
 COSYVOICE_TTS_VOICE = "loongyuuna_v2"  # 默认音色
 COSYVOICE_TTS_AUDIO_FORMAT = AudioFormat.MP3_44100HZ_MONO_256KBPS
+COSYVOICE_POOL_SIZE = 4  # 每个 API Key 保持的常驻连接数
+COSYVOICE_TASK_TIMEOUT = 60.0  # 单次合成任务的超时时间（秒）
+
+# 旧版 tts_v2 的 SpeechSynthesizer 没有 api_key 参数，只在构造时读取全局 dashscope.api_key；
+# 连接池同样只读取全局凭据。这些调用需要在 _scoped_api_key 中串行执行，结束后恢复原值。
+# 注意锁只能串行化本插件的写入：SDK 在锁外读取全局凭据（例如连接池在后台重连）时仍可能读到其他值，
+# 因此构造函数支持 api_key 参数时优先按对象传入凭据。
+_credential_lock = threading.Lock()
+
+
+def _accepts_api_key(cls) -> bool:
+    try:
+        return "api_key" in inspect.signature(cls.__init__).parameters
+    except (TypeError, ValueError):
+        return False
+
+
+_SYNTHESIZER_ACCEPTS_API_KEY = _accepts_api_key(SpeechSynthesizer)
+
+
+@contextmanager
+def _scoped_api_key(api_key: str):
+    """在 with 块内把全局 dashscope.api_key 设为 api_key，退出时恢复原值；多个调用方串行执行"""
+    with _credential_lock:
+        previous = dashscope.api_key
+        dashscope.api_key = api_key
+        try:
+            yield
+        finally:
+            dashscope.api_key = previous
+
+
+def _create_synthesizer(api_key: str, **kwargs) -> SpeechSynthesizer:
+    """
+    使用指定的 API Key 构造 SpeechSynthesizer，SDK 支持时按对象传入凭据，否则只在构造期间修改全局凭据
+
+    Args:
+        api_key: DashScope API Key
+        **kwargs: 传给 SpeechSynthesizer 的参数
+
+    Returns:
+        SpeechSynthesizer 实例
+    """
+    if _SYNTHESIZER_ACCEPTS_API_KEY:
+        return SpeechSynthesizer(api_key=api_key, **kwargs)
+    with _scoped_api_key(api_key):
+        return SpeechSynthesizer(**kwargs)
+
+
+def _close_synthesizer(synthesizer: SpeechSynthesizer) -> None:
+    """
+    中止超时或出错的任务并关闭其 WebSocket 连接，避免连接保持打开、回调在任务放弃后继续触发
+    """
+    for method in ("streaming_cancel", "close"):
+        func = getattr(synthesizer, method, None)
+        if func is None:
+            continue
+        try:
+            func()
+        except Exception as e:
+            logger.warning(f"[CosyVoiceTTS] Failed to {method} abandoned synthesizer: {e}")
+
+
+class _SynthesizerPool:
+    """
+    复用 WebSocket 连接的 SpeechSynthesizer 池
+
+    SDK 提供 SpeechSynthesizerObjectPool 时，借出的合成器保持已建立的连接，顺序执行的合成任务
+    无需重复握手和鉴权；旧版 SDK 没有连接池时退化为每次任务新建合成器。
+    两种情况下同时进行的任务数都不超过池大小。
+    """
+
+    def __init__(self, api_key: str, max_size: int):
+        self.api_key = api_key
+        self.max_size = max(1, max_size)
+        self._slots = threading.BoundedSemaphore(self.max_size)
+        self._state_lock = threading.Lock()
+        self._active = 0  # 已借出的合成器数
+        self._closed = False
+        self.users = 0  # 使用此池的服务实例数，由 _get_pool / _release_pool 维护
+        self._sdk_pool = None
+        if SpeechSynthesizerObjectPool is not None:
+            try:
+                with _scoped_api_key(api_key):
+                    self._sdk_pool = SpeechSynthesizerObjectPool(max_size=self.max_size)
+            except Exception as e:
+                logger.warning(f"[CosyVoiceTTS] Failed to create synthesizer pool, "
+                               f"falling back to per-task connections: {e}")
+        logger.debug(f"[CosyVoiceTTS] Synthesizer pool ready (size={self.max_size}, "
+                     f"sdk_pool={'yes' if self._sdk_pool else 'no'}).")
+
+    def acquire(self, timeout: float, **kwargs) -> SpeechSynthesizer:
+        """
+        借出一个合成器
+
+        Args:
+            timeout: 等待空闲连接的最长时间（秒）
+            **kwargs: 合成器参数（model、voice、format、callback、additional_params）
+
+        Returns:
+            SpeechSynthesizer 实例，使用完毕后必须调用 release
+        """
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError(f"等待 CosyVoice 连接超时（{timeout:g} 秒）")
+        with self._state_lock:
+            self._active += 1
+            sdk_pool = None if self._closed else self._sdk_pool
+        try:
+            if sdk_pool is None:
+                return _create_synthesizer(self.api_key, **kwargs)
+            # 池中没有空闲连接时 SDK 会新建连接，同样需要读取全局凭据
+            with _scoped_api_key(self.api_key):
+                return sdk_pool.borrow_synthesizer(**kwargs)
+        except Exception:
+            self._finish_task()
+            raise
+
+    def release(self, synthesizer: SpeechSynthesizer, reusable: bool) -> None:
+        """
+        归还合成器
+
+        Args:
+            synthesizer: acquire 借出的合成器
+            reusable: 任务是否正常结束；超时或出错的连接状态未知，取消任务并关闭连接后丢弃
+        """
+        with self._state_lock:
+            sdk_pool = self._sdk_pool
+            closed = self._closed
+        try:
+            if not reusable or (sdk_pool is not None and closed):
+                # 池已关闭时借出的常驻连接也不再归还，直接关闭
+                _close_synthesizer(synthesizer)
+            elif sdk_pool is not None:
+                sdk_pool.return_synthesizer(synthesizer)
+        except Exception as e:
+            logger.warning(f"[CosyVoiceTTS] Failed to return synthesizer to pool: {e}")
+        finally:
+            self._finish_task()
+
+    def close(self) -> None:
+        """关闭池中的常驻连接；仍在进行的任务结束后再关闭，之后借出的合成器不再复用连接"""
+        with self._state_lock:
+            if self._closed:
+                return
+            self._closed = True
+            idle = self._active == 0
+        if idle:
+            self._shutdown_sdk_pool()
+
+    def _finish_task(self) -> None:
+        with self._state_lock:
+            self._active -= 1
+            shutdown = self._closed and self._active == 0
+        self._slots.release()
+        if shutdown:
+            self._shutdown_sdk_pool()
+
+    def _shutdown_sdk_pool(self) -> None:
+        with self._state_lock:
+            sdk_pool, self._sdk_pool = self._sdk_pool, None
+        shutdown = getattr(sdk_pool, "shutdown", None)
+        if shutdown is None:
+            return
+        try:
+            shutdown()
+            logger.debug(f"[CosyVoiceTTS] Synthesizer pool (size={self.max_size}) shut down.")
+        except Exception as e:
+            logger.warning(f"[CosyVoiceTTS] Failed to shut down synthesizer pool: {e}")
+
+
+_pools: dict[tuple[str, int], _SynthesizerPool] = {}
+_pools_lock = threading.Lock()
+
+
+def _get_pool(api_key: str, max_size: int) -> _SynthesizerPool:
+    """返回按 API Key 和池大小共享的合成器池，使用完毕后调用 _release_pool"""
+    key = (api_key, max_size)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = _SynthesizerPool(api_key, max_size)
+        pool.users += 1
+        return pool
+
+
+def _release_pool(pool: _SynthesizerPool) -> None:
+    """服务不再使用合成器池；没有其他服务使用时移出共享表并关闭连接"""
+    with _pools_lock:
+        pool.users -= 1
+        if pool.users > 0:
+            return
+        key = (pool.api_key, pool.max_size)
+        if _pools.get(key) is pool:
+            del _pools[key]
+    pool.close()
 
 
 class CosyVoiceTTSService(TTSService):
@@ -28,17 +229,26 @@ class CosyVoiceTTSService(TTSService):
 
     def __init__(self, api_key: str, model: str = COSYVOICE_TTS_MODEL, voice: str = COSYVOICE_TTS_VOICE,
                  audio_format: str = COSYVOICE_TTS_AUDIO_FORMAT, ssml_config: dict | None = None,
-                 timestamp_enabled: bool = False):
+                 timestamp_enabled: bool = False, pool_enabled: bool = True,
+                 pool_size: int = COSYVOICE_POOL_SIZE, task_timeout: float = COSYVOICE_TASK_TIMEOUT):
         self.api_key = api_key
         self.model = model
         self.voice = voice
         self._audio_format = audio_format  # 存储为私有变量，因为 audio_format 是只读 property
         self.ssml_config = ssml_config if ssml_config is not None else {}
         self.timestamp_enabled = timestamp_enabled
-        dashscope.api_key = self.api_key
+        self.task_timeout = task_timeout
+        self._pool = _get_pool(api_key, pool_size) if pool_enabled else None
         logger.debug(
             f"[{self.__class__.__name__}] Initialized with model='{self.model}', voice='{self.voice}'. "
-            f"SSML: {self.ssml_config.get('enabled', False)}, Timestamps: {self.timestamp_enabled}")
+            f"SSML: {self.ssml_config.get('enabled', False)}, Timestamps: {self.timestamp_enabled}, "
+            f"Pool: {pool_size if pool_enabled else 'disabled'}, Timeout: {self.task_timeout}s")
+
+    def close(self) -> None:
+        """释放共享的合成器池；重复调用无副作用"""
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            _release_pool(pool)
 
     def _plain_text_to_ssml(self, text: str) -> str:
         """将普通文本根据规则转换为 SSML 格式的文本。"""
@@ -62,6 +272,17 @@ class CosyVoiceTTSService(TTSService):
         """返回音频格式后缀"""
         return "mp3"
 
+    @property
+    def cache_fingerprint(self) -> dict:
+        return {
+            "provider": "cosyvoice",
+            "model": self.model,
+            "voice": self.voice,
+            "format": str(self._audio_format),
+            "ssml": self.ssml_config if self.ssml_config.get("enabled", False) else None,
+            "timestamps": self.timestamp_enabled,
+        }
+
     def synthesize_speech(self, text: str, output_path: str) -> tuple[bool, list | None]:
         """
         调用 CosyVoice-v2 API 合成语音。如果 API 未返回时间戳，则调用共享工具进行估算。
@@ -71,8 +292,8 @@ class CosyVoiceTTSService(TTSService):
             final_text_for_api = self._plain_text_to_ssml(text)
 
         class TtsCallback(ResultCallback):
-            def __init__(self):
-                self.audio_buffer = BytesIO()
+            def __init__(self, writer: AtomicFileWriter):
+                self.writer = writer
                 self.timestamps = []
                 self.error_message = None
                 self.finished_event = threading.Event()
@@ -81,10 +302,12 @@ class CosyVoiceTTSService(TTSService):
                 logger.debug("CosyVoice TTS WebSocket connection opened.")
 
             def on_data(self, data: bytes):
-                self.audio_buffer.write(data)
+                self.writer.write(data)
 
             def on_complete(self):
                 logger.debug("CosyVoice TTS synthesis stream completed.")
+                # 池化的连接在任务结束后不会关闭，因此完成事件也要结束等待
+                self.finished_event.set()
 
             def on_error(self, message: str):
                 logger.error(f"CosyVoice TTS synthesis error: {message}")
@@ -106,38 +329,52 @@ class CosyVoiceTTSService(TTSService):
                 except Exception as e:
                     logger.error(f"Error processing timestamp event: {e}")
 
-        callback = TtsCallback()
-
         additional_params = {'word_timestamp_enabled': self.timestamp_enabled}
         if self.ssml_config.get("enabled", False):
             additional_params['enable_ssml'] = True
 
+        try:
+            writer = AtomicFileWriter(output_path)
+        except OSError as e:
+            logger.exception(f"Failed to create temp file for CosyVoice-v2 audio: {e}")
+            return False, None
+
+        callback = TtsCallback(writer)
         try:
             logger.debug(
                 f"[{self.__class__.__name__}] Synthesizing speech with CosyVoice-v2. "
                 f"Timestamps: {self.timestamp_enabled}, SSML: {additional_params.get('enable_ssml', False)}")
 
-            synthesizer = SpeechSynthesizer(
-                model=self.model, voice=self.voice, format=self._audio_format,
-                callback=callback, additional_params=additional_params
-            )
+            synthesizer_params = dict(model=self.model, voice=self.voice, format=self._audio_format,
+                                      callback=callback, additional_params=additional_params)
+            pool = self._pool  # close() 可能在任务进行中把 self._pool 置空
+            if pool is not None:
+                synthesizer = pool.acquire(self.task_timeout, **synthesizer_params)
+            else:
+                synthesizer = _create_synthesizer(self.api_key, **synthesizer_params)
 
-            synthesizer.call(final_text_for_api)
+            finished = False
+            try:
+                synthesizer.call(final_text_for_api)
 
-            logger.debug("Waiting for CosyVoice TTS callback to finish...")
-            callback.finished_event.wait()
+                logger.debug("Waiting for CosyVoice TTS callback to finish...")
+                finished = callback.finished_event.wait(self.task_timeout)
+            finally:
+                reusable = finished and not callback.error_message
+                if pool is not None:
+                    pool.release(synthesizer, reusable=reusable)
+                elif not reusable:
+                    _close_synthesizer(synthesizer)
+            if not finished:
+                raise TimeoutError(f"CosyVoice TTS 合成超时（{self.task_timeout:g} 秒）")
             logger.debug("CosyVoice TTS callback finished.")
 
             if callback.error_message:
                 raise Exception(f"CosyVoice TTS service returned an error: {callback.error_message}")
 
-            audio_data = callback.audio_buffer.getvalue()
             timestamps = callback.timestamps if self.timestamp_enabled and callback.timestamps else None
 
-            if audio_data:
-                with open(output_path, 'wb') as f:
-                    f.write(audio_data)
-
+            if writer.commit():
                 # 如果 API 未返回时间戳，则调用共享的估算函数
                 if self.timestamp_enabled and not timestamps:
                     timestamps = estimate_timestamps(text, output_path, self.ssml_config, logger)
@@ -153,4 +390,7 @@ class CosyVoiceTTSService(TTSService):
         except Exception as e:
             logger.exception(f"Failed to generate or save CosyVoice-v2 audio: {e}")
             return False, None
+        finally:
+            # 出错或超时时删除临时文件；已提交时为空操作
+            writer.discard()
 
@@ -1,10 +1,12 @@
 # anki_gpt_addon/llm/providers/dashscope.py
 import logging
-import dashscope
+import re
+from typing import Callable
 from dashscope import Generation
 
 # 相对导入
-from ..interfaces import LLMService
+from ..cache import AnalysisCache
+from ..interfaces import LLMService, RequestCancelled
 from ...consts import ADDON_NAME
 
 logger = logging.getLogger(ADDON_NAME)
@@ -12,14 +14,25 @@ logger = logging.getLogger(ADDON_NAME)
 # --- DashScope LLM 模型常量 ---
 DASHSCOPE_LLM_MODEL = "qwen-plus"
 
+# 批量分析时每个句子结果前的分隔行，例如 "===== [3] ====="
+BATCH_DELIMITER_TEMPLATE = "===== [{index}] ====="
+BATCH_DELIMITER_PATTERN = re.compile(r'^\s*=+\s*[\[【]?\s*(\d+)\s*[\]】]?\s*=+\s*$', re.MULTILINE)
+# 批量提示词产出的分析使用单独的缓存变体，不会被单句预览当作单句提示词的结果复用
+BATCH_PROMPT_VARIANT = "batch"
+
 
 class DashScopeLLMService(LLMService):
-    # 此类保持不变，无需修改
-    def __init__(self, api_key: str, model: str = DASHSCOPE_LLM_MODEL):
+    def __init__(self, api_key: str, model: str = DASHSCOPE_LLM_MODEL, cache: AnalysisCache | None = None):
         self.api_key = api_key
         self.model = model
-        dashscope.api_key = self.api_key
-        logger.debug(f"[{self.__class__.__name__}] Initialized with model '{self.model}'.")
+        self.cache = cache
+        logger.debug(f"[{self.__class__.__name__}] Initialized with model '{self.model}', "
+                     f"cache: {'enabled' if self.cache else 'disabled'}.")
+
+    @staticmethod
+    def _prompt_variant(is_asr_text: bool) -> str:
+        """返回提示词变体名称，作为缓存键的一部分"""
+        return "asr" if is_asr_text else "normal"
 
     def generate_analysis(self, japanese_sentence: str, is_asr_text: bool = False) -> str:
         """
@@ -32,12 +45,24 @@ class DashScopeLLMService(LLMService):
         Returns:
             分析内容的markdown文本
         """
+        variant = self._prompt_variant(is_asr_text)
+        if self.cache:
+            cached = self.cache.get(self.model, variant, japanese_sentence)
+            if cached is not None:
+                logger.debug(f"[{self.__class__.__name__}] Analysis cache hit ({self.cache.stats}).")
+                return cached
+
         prompt = self._build_prompt(japanese_sentence, is_asr_text=is_asr_text)
         try:
             logger.debug(f"[{self.__class__.__name__}] Calling LLM for analysis... (is_asr_text={is_asr_text})")
-            response = Generation.call(model=self.model, messages=prompt, result_format="message")
+            response = Generation.call(model=self.model, messages=prompt, result_format="message",
+                                       api_key=self.api_key)
             if response.status_code == 200:
-                return response.output.choices[0].message.content
+                content = response.output.choices[0].message.content
+                # 只缓存成功的结果，失败信息不能被当作分析内容复用
+                if self.cache and content:
+                    self.cache.put(self.model, variant, japanese_sentence, content)
+                return content
             else:
                 error_msg = f"LLM API call failed. Status: {response.status_code}, Code: {response.code}, Message: {response.message}"
                 logger.error(f"[{self.__class__.__name__}] {error_msg}")
@@ -46,6 +71,168 @@ class DashScopeLLMService(LLMService):
             logger.exception(f"[{self.__class__.__name__}] An exception occurred during LLM call: {e}")
             return f"大模型分析时发生异常：{e}"
 
+    def stream_analysis(self, japanese_sentence: str, on_delta: Callable[[str], None],
+                        is_asr_text: bool = False) -> str:
+        """
+        流式生成分析内容
+
+        使用 Generation.call 的增量输出模式，每收到一段新内容就以累计的完整 markdown 调用 on_delta，
+        以便界面在模型生成过程中逐步显示。缓存命中时直接回调一次完整内容。
+
+        Args:
+            japanese_sentence: 日文句子
+            on_delta: 增量回调，参数为当前累计的 markdown 文本
+            is_asr_text: 是否为ASR转写的文本（可能缺少标点符号）
+
+        Returns:
+            完整的分析内容 markdown 文本
+        """
+        variant = self._prompt_variant(is_asr_text)
+        if self.cache:
+            cached = self.cache.get(self.model, variant, japanese_sentence)
+            if cached is not None:
+                logger.debug(f"[{self.__class__.__name__}] Analysis cache hit ({self.cache.stats}).")
+                on_delta(cached)
+                return cached
+
+        prompt = self._build_prompt(japanese_sentence, is_asr_text=is_asr_text)
+        chunks: list[str] = []
+        try:
+            logger.debug(f"[{self.__class__.__name__}] Streaming LLM analysis... (is_asr_text={is_asr_text})")
+            responses = Generation.call(model=self.model, messages=prompt, result_format="message",
+                                        stream=True, incremental_output=True, api_key=self.api_key)
+            for response in responses:
+                if response.status_code != 200:
+                    error_msg = f"LLM API stream failed. Status: {response.status_code}, Code: {response.code}, Message: {response.message}"
+                    logger.error(f"[{self.__class__.__name__}] {error_msg}")
+                    return f"大模型分析失败：{response.message}"
+                delta = response.output.choices[0].message.content
+                if delta:
+                    chunks.append(delta)
+                    on_delta("".join(chunks))
+        except RequestCancelled:
+            logger.info(f"[{self.__class__.__name__}] LLM stream cancelled.")
+            raise
+        except Exception as e:
+            logger.exception(f"[{self.__class__.__name__}] An exception occurred during LLM stream: {e}")
+            return f"大模型分析时发生异常：{e}"
+
+        content = "".join(chunks)
+        if self.cache and content:
+            self.cache.put(self.model, variant, japanese_sentence, content)
+        return content
+
+    def generate_batch_analysis(self, japanese_sentences: list[str]) -> list[str]:
+        """
+        在一次请求中为多个句子生成分析内容
+
+        先查询缓存（批量结果和单句结果都可使用），只把未命中的句子打包进一个结构化提示词，
+        要求模型按分隔行逐句输出，再拆分回每个句子的 markdown。拆分失败或缺失的句子回退为逐句调用。
+        批量结果缓存在 BATCH_PROMPT_VARIANT 下，单句分析不会读取。
+
+        Args:
+            japanese_sentences: 日文句子列表
+
+        Returns:
+            与输入顺序一致的分析内容列表
+        """
+        results: list[str | None] = [None] * len(japanese_sentences)
+        pending: list[int] = []
+        for i, sentence in enumerate(japanese_sentences):
+            cached = None
+            if self.cache:
+                cached = self.cache.get(self.model, BATCH_PROMPT_VARIANT, sentence)
+                if cached is None:
+                    cached = self.cache.get(self.model, self._prompt_variant(False), sentence)
+            if cached is not None:
+                results[i] = cached
+            else:
+                pending.append(i)
+
+        if len(pending) > 1:
+            pending_sentences = [japanese_sentences[i] for i in pending]
+            logger.debug(f"[{self.__class__.__name__}] Calling LLM for batch analysis of {len(pending)} sentences...")
+            analyses = self._split_batch_response(self._call_batch(pending_sentences), len(pending))
+            for i, analysis in zip(pending, analyses):
+                if analysis:
+                    results[i] = analysis
+                    if self.cache:
+                        self.cache.put(self.model, BATCH_PROMPT_VARIANT, japanese_sentences[i], analysis)
+            missing = [i for i in pending if results[i] is None]
+            if missing:
+                logger.warning(f"[{self.__class__.__name__}] Batch response missing {len(missing)}/{len(pending)} "
+                               f"analyses, falling back to per-sentence calls.")
+            pending = missing
+
+        for i in pending:
+            results[i] = self.generate_analysis(japanese_sentences[i])
+        return results
+
+    def _call_batch(self, japanese_sentences: list[str]) -> str | None:
+        """发起批量分析请求，失败时返回 None"""
+        try:
+            response = Generation.call(model=self.model, messages=self._build_batch_prompt(japanese_sentences),
+                                       result_format="message", api_key=self.api_key)
+            if response.status_code == 200:
+                return response.output.choices[0].message.content
+            logger.error(f"[{self.__class__.__name__}] Batch LLM API call failed. Status: {response.status_code}, "
+                         f"Code: {response.code}, Message: {response.message}")
+        except Exception as e:
+            logger.exception(f"[{self.__class__.__name__}] An exception occurred during batch LLM call: {e}")
+        return None
+
+    @staticmethod
+    def _split_batch_response(content: str | None, count: int) -> list[str | None]:
+        """
+        按分隔行拆分批量响应
+
+        Returns:
+            长度为 count 的列表，无法解析的句子位置为 None
+        """
+        analyses: list[str | None] = [None] * count
+        if not content:
+            return analyses
+        matches = list(BATCH_DELIMITER_PATTERN.finditer(content))
+        for n, match in enumerate(matches):
+            index = int(match.group(1)) - 1
+            end = matches[n + 1].start() if n + 1 < len(matches) else len(content)
+            body = content[match.end():end].strip()
+            # 只接受编号有效、内容非空且包含句子读法的结果，避免把截断的输出当作完整分析
+            if 0 <= index < count and analyses[index] is None and body and '句子读法' in body:
+                analyses[index] = body
+        return analyses
+
+    def _build_batch_prompt(self, japanese_sentences: list[str]) -> list[dict]:
+        """
+        构建批量分析的提示词
+
+        Args:
+            japanese_sentences: 日文句子列表
+        """
+        system_content = "你是一个有帮助的助手，擅长将日文翻译成中文，并能对日文句子进行详细的语言分析，包括单词的假名读音、罗马文读音、中文解释和语法点解释。"
+        numbered = "\n".join(f"{i}. {sentence}" for i, sentence in enumerate(japanese_sentences, 1))
+        user_content = f"""下面有 {len(japanese_sentences)} 个编号的日文句子。请逐句将其翻译成中文，并对句子中的主要单词和语法点进行详细解释。
+每个句子的结果必须以单独一行的分隔符开头，分隔符格式为 {BATCH_DELIMITER_TEMPLATE.format(index="编号")}，例如 {BATCH_DELIMITER_TEMPLATE.format(index=1)}。
+不要合并或省略任何句子，不要输出分隔符以外的额外说明。每个句子的结果请按照以下格式输出：
+**中文翻译：**
+[翻译结果]
+**句子读法：**
+- [句子假名读音]
+- [句子罗马文读音]
+**单词解释：**
+- [日文单词]（[假名读音]）（[罗马文读音]）：[中文意思]
+... (列出句子中的主要单词及其假名读音和中文解释)
+**语法点解释：**
+- [日文语法点]（[假名读音]）（[罗马文读音]）：[解释]
+... (列出句子中的主要语法点及其解释)
+日文句子：
+{numbered}
+"""
+        return [
+            {"role": "system", "content": system_content},
+            {"role": "user", "content": user_content},
+        ]
+
     def _build_prompt(self, japanese_sentence: str, is_asr_text: bool = False) -> list[dict]:
         """
         构建LLM提示词
@@ -1,13 +1,16 @@
 # anki_gpt_addon/llm/providers/dashscope_asr.py
+import heapq
+import itertools
 import logging
 import json
+import threading
 import urllib.request
 import urllib.error
 import time
+from concurrent.futures import ThreadPoolExecutor
 from http import HTTPStatus
-from typing import Dict, Any, Optional, List
+from typing import Callable, Dict, Any, Optional, List, Tuple
 
-import dashscope
 from dashscope.audio.asr import Transcription
 
 # 相对导入
@@ -20,6 +23,190 @@ logger = logging.getLogger(ADDON_NAME)
 DASHSCOPE_ASR_MODEL = "paraformer-v2"
 DEFAULT_LANGUAGE_HINTS = ["ja"]  # 默认日语
 
+# --- 转写任务轮询 ---
+POLL_INITIAL_INTERVAL = 0.5  # 首次查询前的等待（秒）
+POLL_BACKOFF = 1.5  # 每次查询后间隔的增长倍数
+POLL_MAX_INTERVAL = 5.0  # 查询间隔上限（秒）
+TRANSCRIPTION_TIMEOUT = 300  # 单个任务从提交到完成的最长时间（秒）
+MAX_FETCH_ERRORS = 5  # 连续查询失败次数上限
+MANAGER_WORKERS = 2  # 提交任务和下载结果的工作线程数
+SCHEDULER_IDLE_TIMEOUT = 30  # 调度线程空闲多久后退出（秒），有新任务时重新启动
+# 仍在进行中的任务状态，其余状态视为已结束
+PENDING_TASK_STATUSES = ("PENDING", "RUNNING")
+
+
+class _TranscriptionJob:
+    """调度器跟踪的一个转写任务"""
+
+    def __init__(self, task_id: str, api_key: str, finalize: Callable[[Any], Dict[str, Any]],
+                 on_complete: Optional[Callable[[Dict[str, Any]], None]],
+                 is_cancelled: Optional[Callable[[], bool]]):
+        self.task_id = task_id
+        self.api_key = api_key
+        self.finalize = finalize
+        self.on_complete = on_complete
+        self.is_cancelled = is_cancelled
+        self.deadline = time.monotonic() + TRANSCRIPTION_TIMEOUT
+        self.interval = POLL_INITIAL_INTERVAL
+        self.polls = 0
+        self.errors = 0
+
+
+class TranscriptionManager:
+    """
+    异步转写任务管理器
+
+    单个调度线程按各任务的下次查询时间跟踪所有未完成的 task_id，到期时调用
+    Transcription.fetch 查询状态：刚提交时查询较频繁，之后间隔按 POLL_BACKOFF 逐渐拉长。
+    任务提交和结果下载在少量工作线程中进行，不阻塞调度线程，也不占用 Anki 的后台线程。
+    """
+
+    def __init__(self, workers: int = MANAGER_WORKERS):
+        self._condition = threading.Condition()
+        self._schedule: List[Tuple[float, int, _TranscriptionJob]] = []
+        self._sequence = itertools.count()
+        self._thread: Optional[threading.Thread] = None
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{ADDON_NAME}-asr")
+
+    @property
+    def pending_count(self) -> int:
+        """正在跟踪的任务数"""
+        with self._condition:
+            return len(self._schedule)
+
+    def execute(self, func: Callable[[], Optional[Dict[str, Any]]],
+                on_complete: Optional[Callable[[Dict[str, Any]], None]] = None) -> None:
+        """
+        在工作线程中执行 func，并以其返回的结果字典调用 on_complete
+
+        Args:
+            func: 要执行的函数；返回 None 时不调用 on_complete，抛出异常时以失败结果调用
+            on_complete: 任务的完成回调
+        """
+        def run() -> None:
+            try:
+                result = func()
+            except Exception as e:
+                logger.exception(f"[{self.__class__.__name__}] Transcription worker failed: {e}")
+                result = {"success": False, "error": f"转写过程中发生异常: {str(e)}"}
+            if result is not None:
+                self._notify(on_complete, result)
+
+        self._executor.submit(run)
+
+    def track(self, task_id: str, api_key: str, finalize: Callable[[Any], Dict[str, Any]],
+              on_complete: Optional[Callable[[Dict[str, Any]], None]] = None,
+              is_cancelled: Optional[Callable[[], bool]] = None) -> None:
+        """
+        开始跟踪已提交的转写任务
+
+        Args:
+            task_id: Transcription.async_call 返回的任务 ID
+            api_key: 查询使用的 API Key
+            finalize: 任务结束后把查询响应转换为结果字典的函数（在工作线程中调用）
+            on_complete: 完成回调，接收结果字典
+            is_cancelled: 返回 True 时停止跟踪该任务
+        """
+        job = _TranscriptionJob(task_id, api_key, finalize, on_complete, is_cancelled)
+        with self._condition:
+            self._push(job, POLL_INITIAL_INTERVAL)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"{ADDON_NAME}-asr-scheduler", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        logger.info(f"[{self.__class__.__name__}] Tracking task {task_id} ({self.pending_count} pending).")
+
+    def _push(self, job: _TranscriptionJob, delay: float) -> None:
+        """按下次查询时间加入调度队列（调用方持有 _condition）"""
+        heapq.heappush(self._schedule, (time.monotonic() + delay, next(self._sequence), job))
+
+    def _run(self) -> None:
+        """调度线程：等待最早到期的任务并查询其状态"""
+        while True:
+            with self._condition:
+                if not self._schedule:
+                    self._condition.wait(SCHEDULER_IDLE_TIMEOUT)
+                    if not self._schedule:
+                        self._thread = None
+                        return
+                    continue
+                due, _, job = self._schedule[0]
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+                heapq.heappop(self._schedule)
+            self._poll(job)
+
+    def _poll(self, job: _TranscriptionJob) -> None:
+        """查询一次任务状态，未结束时按退避间隔重新排队"""
+        if job.is_cancelled and job.is_cancelled():
+            logger.info(f"[{self.__class__.__name__}] Task {job.task_id} cancelled, stop polling.")
+            return
+        if time.monotonic() >= job.deadline:
+            logger.error(f"[{self.__class__.__name__}] Task {job.task_id} timed out after {TRANSCRIPTION_TIMEOUT}s.")
+            self._finish(job, lambda: {"success": False, "error": f"转写超时（{TRANSCRIPTION_TIMEOUT} 秒）"})
+            return
+
+        job.polls += 1
+        try:
+            response = Transcription.fetch(task=job.task_id, api_key=job.api_key)
+        except Exception as e:
+            job.errors += 1
+            logger.warning(f"[{self.__class__.__name__}] Fetch failed for task {job.task_id} "
+                           f"({job.errors}/{MAX_FETCH_ERRORS}): {e}")
+            if job.errors >= MAX_FETCH_ERRORS:
+                error = {"success": False, "error": f"查询转写状态失败: {str(e)}"}
+                self._finish(job, lambda: error)
+            else:
+                self._reschedule(job)
+            return
+
+        job.errors = 0
+        output = getattr(response, 'output', None)
+        task_status = getattr(output, 'task_status', None) if output else None
+        if getattr(response, 'status_code', None) == HTTPStatus.OK and task_status in PENDING_TASK_STATUSES:
+            self._reschedule(job)
+            return
+        logger.info(f"[{self.__class__.__name__}] Task {job.task_id} finished with status {task_status} "
+                    f"after {job.polls} polls.")
+        self._finish(job, lambda: job.finalize(response))
+
+    def _reschedule(self, job: _TranscriptionJob) -> None:
+        with self._condition:
+            self._push(job, job.interval)
+        job.interval = min(POLL_MAX_INTERVAL, job.interval * POLL_BACKOFF)
+
+    def _finish(self, job: _TranscriptionJob, build_result: Callable[[], Dict[str, Any]]) -> None:
+        """在工作线程中生成结果并调用完成回调"""
+        def run() -> Optional[Dict[str, Any]]:
+            if job.is_cancelled and job.is_cancelled():
+                return None
+            return build_result()
+
+        self.execute(run, job.on_complete)
+
+    def _notify(self, on_complete: Optional[Callable[[Dict[str, Any]], None]], result: Dict[str, Any]) -> None:
+        if on_complete is None:
+            return
+        try:
+            on_complete(result)
+        except Exception as e:
+            logger.exception(f"[{self.__class__.__name__}] Transcription callback failed: {e}")
+
+
+_manager: Optional[TranscriptionManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_transcription_manager() -> TranscriptionManager:
+    """返回进程内共享的转写任务管理器"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = TranscriptionManager()
+        return _manager
+
 
 class DashScopeASRService(ASRService):
     """
@@ -36,12 +223,13 @@ class DashScopeASRService(ASRService):
         """
         self.api_key = api_key
         self.model = model
-        dashscope.api_key = self.api_key
         logger.debug(f"[{self.__class__.__name__}] Initialized with model '{self.model}'.")
     
     def transcribe(self, audio_url: str, language_hints: Optional[List[str]] = None) -> Dict[str, Any]:
         """
-        将音频转换为文字
+        将音频转换为文字（阻塞直到转写完成）
+        
+        内部通过 transcribe_async 提交任务，由调度线程轮询结果，本方法只等待完成回调。
         
         Args:
             audio_url: 音频文件的URL地址
@@ -50,48 +238,91 @@ class DashScopeASRService(ASRService):
         Returns:
             包含转写结果的字典
         """
+        finished = threading.Event()
+        outcome: Dict[str, Any] = {}
+
+        def on_complete(result: Dict[str, Any]) -> None:
+            outcome.update(result)
+            finished.set()
+
+        self.transcribe_async(audio_url, language_hints, on_complete)
+        # 调度器自身会在 TRANSCRIPTION_TIMEOUT 后报告超时，这里多留一些余量
+        if not finished.wait(TRANSCRIPTION_TIMEOUT + 30):
+            return {"success": False, "error": "等待转写完成超时"}
+        return outcome
+    
+    def transcribe_async(self, audio_url: str, language_hints: Optional[List[str]] = None,
+                         on_complete: Optional[Callable[[Dict[str, Any]], None]] = None,
+                         is_cancelled: Optional[Callable[[], bool]] = None) -> None:
+        """
+        提交转写任务并立即返回，不占用调用方线程
+        
+        任务提交和结果下载在转写管理器的工作线程中进行，状态由调度线程轮询。
+        
+        Args:
+            audio_url: 音频文件的URL地址
+            language_hints: 语言提示列表，默认为日语
+            on_complete: 完成回调，在管理器的工作线程中以结果字典（格式同 transcribe）调用
+            is_cancelled: 返回 True 时停止轮询并丢弃该任务，不再调用 on_complete
+        """
+        manager = get_transcription_manager()
+
+        def submit() -> Optional[Dict[str, Any]]:
+            if is_cancelled and is_cancelled():
+                return None
+            task_id, error = self._submit_task(audio_url, language_hints or DEFAULT_LANGUAGE_HINTS)
+            if error:
+                return {"success": False, "error": error}
+            manager.track(task_id, self.api_key, self._build_result, on_complete, is_cancelled)
+            return None
+
+        manager.execute(submit, on_complete)
+    
+    def _submit_task(self, audio_url: str, language_hints: List[str]) -> Tuple[Optional[str], Optional[str]]:
+        """
+        调用 Transcription.async_call 提交转写任务
+        
+        Returns:
+            (task_id, 错误信息)，成功时错误信息为 None
+        """
         logger.info(f"[{self.__class__.__name__}] 开始转写任务，音频URL: {audio_url}")
+        try:
+            task_response = Transcription.async_call(
+                model=self.model,
+                file_urls=[audio_url],
+                language_hints=language_hints,
+                api_key=self.api_key
+            )
+            logger.info(f"[{self.__class__.__name__}] async_call返回: status_code={task_response.status_code if hasattr(task_response, 'status_code') else 'N/A'}")
+        except Exception as e:
+            logger.exception(f"[{self.__class__.__name__}] async_call调用失败: {e}")
+            return None, f"调用转写API失败: {str(e)}"
+        
+        if not task_response:
+            logger.error(f"[{self.__class__.__name__}] task_response为空")
+            return None, "转写任务提交失败，响应为空"
+        if not task_response.output:
+            logger.error(f"[{self.__class__.__name__}] task_response.output为空")
+            return None, "转写任务提交失败，output为空"
+        if not task_response.output.task_id:
+            logger.error(f"[{self.__class__.__name__}] task_id为空")
+            return None, "转写任务提交失败，未获取到任务ID"
         
-        if language_hints is None:
-            language_hints = DEFAULT_LANGUAGE_HINTS
+        task_id = task_response.output.task_id
+        logger.info(f"[{self.__class__.__name__}] ASR任务已提交，task_id: {task_id}")
+        return task_id, None
+    
+    def _build_result(self, transcribe_response) -> Dict[str, Any]:
+        """
+        根据已结束任务的查询响应生成转写结果：检查状态、下载结果 JSON 并提取文本和时间戳
         
+        Args:
+            transcribe_response: Transcription.fetch 的响应
+        
+        Returns:
+            包含转写结果的字典
+        """
         try:
-            # 调用异步转写API
-            logger.info(f"[{self.__class__.__name__}] 调用Transcription.async_call")
-            try:
-                task_response = Transcription.async_call(
-                    model=self.model,
-                    file_urls=[audio_url],
-                    language_hints=language_hints
-                )
-                logger.info(f"[{self.__class__.__name__}] async_call返回: status_code={task_response.status_code if hasattr(task_response, 'status_code') else 'N/A'}")
-            except Exception as e:
-                logger.exception(f"[{self.__class__.__name__}] async_call调用失败: {e}")
-                return {"success": False, "error": f"调用转写API失败: {str(e)}"}
-            
-            if not task_response:
-                logger.error(f"[{self.__class__.__name__}] task_response为空")
-                return {"success": False, "error": "转写任务提交失败，响应为空"}
-            if not task_response.output:
-                logger.error(f"[{self.__class__.__name__}] task_response.output为空")
-                return {"success": False, "error": "转写任务提交失败，output为空"}
-            if not task_response.output.task_id:
-                logger.error(f"[{self.__class__.__name__}] task_id为空")
-                return {"success": False, "error": "转写任务提交失败，未获取到任务ID"}
-            
-            task_id = task_response.output.task_id
-            logger.info(f"[{self.__class__.__name__}] ASR任务已提交，task_id: {task_id}")
-            
-            # 等待转写完成
-            logger.info(f"[{self.__class__.__name__}] 开始等待转写完成，task_id: {task_id}")
-            try:
-                # Transcription.wait 可能会阻塞，需要设置超时
-                transcribe_response = Transcription.wait(task=task_id, timeout=300)  # 5分钟超时
-                logger.info(f"[{self.__class__.__name__}] 转写完成，status_code: {transcribe_response.status_code if hasattr(transcribe_response, 'status_code') else 'N/A'}")
-            except Exception as e:
-                logger.exception(f"[{self.__class__.__name__}] 等待转写完成时发生异常: {e}")
-                return {"success": False, "error": f"等待转写完成失败: {str(e)}"}
-            
             if not transcribe_response:
                 logger.error(f"[{self.__class__.__name__}] transcribe_response为空")
                 return {"success": False, "error": "转写响应为空"}
@@ -168,7 +399,7 @@ class DashScopeASRService(ASRService):
             }
             
         except Exception as e:
-            logger.exception(f"[{self.__class__.__name__}] 转写过程中发生异常: {e}")
+            logger.exception(f"[{self.__class__.__name__}] 处理转写结果时发生异常: {e}")
             return {"success": False, "error": f"转写过程中发生异常: {str(e)}"}
     
     def _download_transcription_json(self, transcription_url: str) -> Optional[Dict[str, Any]]:
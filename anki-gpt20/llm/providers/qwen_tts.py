@@ -1,17 +1,122 @@
 # anki_gpt_addon/llm/providers/qwen_tts.py
+import base64
+import http.client
 import logging
-import urllib.request
-import urllib.error
+import threading
 import time
+import urllib.parse
 import dashscope
 
 # 相对导入
+from ..audio import wav_header
 from ..interfaces import TTSService
-from ..utils import estimate_timestamps
+from ..utils import AtomicFileWriter, estimate_timestamps
 from ...consts import ADDON_NAME
 
 logger = logging.getLogger(ADDON_NAME)
 
+# --- 下载参数 ---
+DOWNLOAD_READ_SIZE = 64 * 1024  # 每次读取 64KB
+DOWNLOAD_DEADLINE = 20.0  # 下载（含重试）的总时限（秒）
+DOWNLOAD_RETRY_DELAY = 0.2  # 首次重试前的等待时间，之后翻倍，但不超过剩余时限
+MAX_IDLE_CONNECTIONS = 4  # 每个主机保留的空闲 keep-alive 连接数
+USER_AGENT = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
+
+# --- 流式返回的内联音频格式（Base64 编码的 PCM） ---
+INLINE_SAMPLE_RATE = 24000
+INLINE_CHANNELS = 1
+INLINE_SAMPLE_WIDTH = 2
+
+
+class HTTPConnectionPool:
+    """
+    按主机复用的 keep-alive HTTP 连接池
+    音频 URL 通常指向同一个 OSS 主机，复用连接可以省去每次下载的 TCP 和 TLS 握手。
+    """
+
+    def __init__(self, max_idle: int = MAX_IDLE_CONNECTIONS):
+        self.max_idle = max_idle
+        self._idle: dict[tuple[str, str, int | None], list[http.client.HTTPConnection]] = {}
+        self._lock = threading.Lock()
+
+    def _acquire(self, key: tuple[str, str, int | None], timeout: float) -> tuple[http.client.HTTPConnection, bool]:
+        """取出空闲连接或新建连接，返回 (连接, 是否为复用的连接)"""
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                conn = idle.pop()
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                return conn, True
+        return self._acquire_new(key, timeout)
+
+    def _release(self, key: tuple[str, str, int | None], conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def download(self, url: str, writer: AtomicFileWriter, timeout: float) -> int:
+        """
+        以流式方式下载 URL 内容到 writer
+
+        Args:
+            url: 下载地址
+            writer: 接收数据的原子写入器（不在这里提交）
+            timeout: 单次连接和读取的超时时间（秒）
+
+        Returns:
+            HTTP 状态码
+        """
+        parsed = urllib.parse.urlsplit(url)
+        key = (parsed.scheme, parsed.hostname, parsed.port)
+        path = urllib.parse.urlunsplit(("", "", parsed.path or "/", parsed.query, ""))
+        headers = {"User-Agent": USER_AGENT, "Connection": "keep-alive"}
+
+        conn, reused = self._acquire(key, timeout)
+        try:
+            try:
+                conn.request("GET", path, headers=headers)
+                response = conn.getresponse()
+            except (http.client.HTTPException, OSError):
+                if not reused:
+                    raise
+                # 复用的连接可能已被服务端关闭，换一个新连接重试一次
+                conn.close()
+                conn, reused = self._acquire_new(key, timeout)
+                conn.request("GET", path, headers=headers)
+                response = conn.getresponse()
+
+            if response.status == 200:
+                while True:
+                    chunk = response.read(DOWNLOAD_READ_SIZE)
+                    if not chunk:
+                        break
+                    writer.write(chunk)
+            else:
+                response.read()
+        except BaseException:
+            conn.close()
+            raise
+
+        if response.will_close:
+            conn.close()
+        else:
+            self._release(key, conn)
+        return response.status
+
+    @staticmethod
+    def _acquire_new(key: tuple[str, str, int | None], timeout: float) -> tuple[http.client.HTTPConnection, bool]:
+        scheme, host, port = key
+        conn_class = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return conn_class(host, port, timeout=timeout), False
+
+
+_http_pool = HTTPConnectionPool()
+
 
 class QwenTTSService(TTSService):
     """
@@ -25,9 +130,10 @@ class QwenTTSService(TTSService):
         self.model = config.get("model", "qwen3-tts-flash")
         self.voice = config.get("voice", "Cherry")
         self.language_type = config.get("language_type", "Japanese")
+        self.inline_audio = config.get("inline_audio", False)
+        self.download_deadline = config.get("download_deadline", DOWNLOAD_DEADLINE)
         self.ssml_config = ssml_config
         self.timestamp_enabled = timestamp_enabled
-        dashscope.api_key = self.api_key
         logger.debug(
             f"[{self.__class__.__name__}] Initialized with model='{self.model}', "
             f"voice='{self.voice}', estimation_enabled='{self.timestamp_enabled}'."
@@ -38,122 +144,134 @@ class QwenTTSService(TTSService):
     def audio_format(self) -> str:
         return "wav"
 
+    @property
+    def cache_fingerprint(self) -> dict:
+        return {
+            "provider": "qwen-tts",
+            "model": self.model,
+            "voice": self.voice,
+            "language_type": self.language_type,
+            # SSML 规则只影响时间戳估算，但缓存的时间戳依赖它
+            "ssml": self.ssml_config,
+            "timestamps": self.timestamp_enabled,
+        }
+
     def synthesize_speech(self, text: str, output_path: str) -> tuple[bool, list | None]:
         """
-        调用 API 合成语音，下载并保存 WAV 文件，然后估算时间戳。
+        调用 API 合成语音并保存 WAV 文件，然后估算时间戳。
+        启用 inline_audio 时通过流式接口直接接收音频数据，否则下载 API 返回的音频 URL。
         """
         try:
             logger.debug(f"[{self.__class__.__name__}] Calling Qwen-TTS for text: '{text[:30]}...'")
-
-            response = dashscope.MultiModalConversation.call(
-                model=self.model,
-                text=text,
-                voice=self.voice,
-                language_type=self.language_type,
-                api_key=self.api_key
-            )
-
-            if response.status_code == 200 and response.output and response.output.audio and response.output.audio.url:
-                audio_url = response.output.audio.url
-                logger.info(f"[{self.__class__.__name__}] Qwen-TTS API call successful. Audio URL received.")
-
-                # 使用 urllib 下载音频文件（在 Anki 环境中更稳定）
-                logger.debug(f"Downloading WAV audio from: {audio_url}")
-                
-                max_retries = 5  # 增加重试次数
-                timeout = 30  # 30秒超时
-                base_delay = 0.5  # 基础延迟（秒）
-                
-                for attempt in range(max_retries):
-                    try:
-                        # 在重试前添加延迟（指数退避）
-                        if attempt > 0:
-                            delay = base_delay * (2 ** (attempt - 1))  # 0.5s, 1s, 2s, 4s
-                            logger.debug(f"Waiting {delay:.1f}s before retry...")
-                            time.sleep(delay)
-                        
-                        logger.debug(f"Attempting download (attempt {attempt + 1}/{max_retries})")
-                        
-                        # 使用 urllib.request 下载文件
-                        req = urllib.request.Request(audio_url)
-                        req.add_header('User-Agent', 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36')
-                        
-                        # 确保每次重试都创建新的连接
-                        http_response = None
-                        try:
-                            http_response = urllib.request.urlopen(req, timeout=timeout)
-                            
-                            # 检查响应状态
-                            if http_response.status == 200:
-                                # 使用流式下载以处理大文件
-                                with open(output_path, 'wb') as f:
-                                    while True:
-                                        chunk = http_response.read(8192)  # 8KB chunks
-                                        if not chunk:
-                                            break
-                                        f.write(chunk)
-                                
-                                logger.info(f"WAV audio successfully saved to: {output_path}")
-                                
-                                timestamps = None
-                                if self.timestamp_enabled:
-                                    # 我们的估算器已经支持 WAV，所以这里可以无缝工作
-                                    timestamps = estimate_timestamps(text, output_path, self.ssml_config, logger)
-                                
-                                return True, timestamps
-                            else:
-                                logger.error(f"Failed to download audio. HTTP Status: {http_response.status}")
-                                if attempt == max_retries - 1:
-                                    return False, None
-                        finally:
-                            # 确保连接被正确关闭
-                            if http_response:
-                                try:
-                                    http_response.close()
-                                except Exception:
-                                    pass
-                                
-                    except urllib.error.URLError as e:
-                        error_msg = str(e)
-                        logger.warning(f"URL error (attempt {attempt + 1}/{max_retries}): {error_msg}")
-                        
-                        # 对于 Bad file descriptor 错误，增加更长的延迟
-                        if "Bad file descriptor" in error_msg or "Errno 9" in error_msg:
-                            if attempt < max_retries - 1:
-                                extra_delay = 1.0 * (attempt + 1)  # 额外延迟：1s, 2s, 3s...
-                                logger.debug(f"Bad file descriptor detected, adding extra delay: {extra_delay:.1f}s")
-                                time.sleep(extra_delay)
-                        
-                        if attempt == max_retries - 1:
-                            logger.error(f"Failed to download audio after {max_retries} attempts: {e}")
-                            return False, None
-                    except OSError as e:
-                        error_msg = str(e)
-                        logger.warning(f"OS error during download (attempt {attempt + 1}/{max_retries}): {error_msg}")
-                        
-                        # 对于文件描述符相关的错误，增加延迟
-                        if "Bad file descriptor" in error_msg or "Errno 9" in error_msg:
-                            if attempt < max_retries - 1:
-                                extra_delay = 1.0 * (attempt + 1)
-                                logger.debug(f"File descriptor error detected, adding extra delay: {extra_delay:.1f}s")
-                                time.sleep(extra_delay)
-                        
-                        if attempt == max_retries - 1:
-                            logger.error(f"Failed to download audio after {max_retries} attempts: {e}")
-                            return False, None
-                    except Exception as e:
-                        logger.warning(f"Unexpected error during download (attempt {attempt + 1}/{max_retries}): {e}")
-                        if attempt == max_retries - 1:
-                            logger.error(f"Failed to download audio after {max_retries} attempts: {e}")
-                            return False, None
-                
-                logger.error("Failed to download audio after all retries")
-                return False, None
+            if self.inline_audio:
+                saved = self._synthesize_inline(text, output_path)
             else:
-                error_msg = f"Qwen-TTS API call failed. Status: {response.status_code}, Code: {response.code}, Message: {response.message}"
-                logger.error(f"[{self.__class__.__name__}] {error_msg}")
+                saved = self._synthesize_via_url(text, output_path)
+            if not saved:
                 return False, None
 
+            logger.info(f"WAV audio successfully saved to: {output_path}")
+            timestamps = None
+            if self.timestamp_enabled:
+                # 我们的估算器已经支持 WAV，所以这里可以无缝工作
+                timestamps = estimate_timestamps(text, output_path, self.ssml_config, logger)
+            return True, timestamps
+
         except Exception as e:
             logger.exception(f"An unexpected exception occurred during Qwen-TTS process: {e}")
-            return False, None
\ No newline at end of file
+            return False, None
+
+    def reestimate_timestamps(self, text: str, audio_path: str) -> list | None:
+        """时间戳是按音频时长估算的，裁剪静音后按新的时长重新估算"""
+        if not self.timestamp_enabled:
+            return None
+        return estimate_timestamps(text, audio_path, self.ssml_config, logger)
+
+    def _call_api(self, text: str, stream: bool = False):
+        return dashscope.MultiModalConversation.call(
+            model=self.model,
+            text=text,
+            voice=self.voice,
+            language_type=self.language_type,
+            api_key=self.api_key,
+            stream=stream
+        )
+
+    def _synthesize_via_url(self, text: str, output_path: str) -> bool:
+        """调用非流式接口获取音频 URL 并下载"""
+        response = self._call_api(text)
+        if response.status_code == 200 and response.output and response.output.audio and response.output.audio.url:
+            logger.info(f"[{self.__class__.__name__}] Qwen-TTS API call successful. Audio URL received.")
+            return self._download(response.output.audio.url, output_path)
+        error_msg = f"Qwen-TTS API call failed. Status: {response.status_code}, Code: {response.code}, Message: {response.message}"
+        logger.error(f"[{self.__class__.__name__}] {error_msg}")
+        return False
+
+    def _synthesize_inline(self, text: str, output_path: str) -> bool:
+        """
+        调用流式接口，把每个分片中 Base64 编码的 PCM 数据拼接为 WAV 文件
+        流中没有音频数据时，回退为下载最后一个分片给出的 URL。
+        """
+        pcm_chunks: list[bytes] = []
+        audio_url = None
+        for response in self._call_api(text, stream=True):
+            if response.status_code != 200:
+                logger.error(f"[{self.__class__.__name__}] Qwen-TTS stream failed. Status: {response.status_code}, "
+                             f"Code: {response.code}, Message: {response.message}")
+                return False
+            audio = response.output.audio if response.output else None
+            if not audio:
+                continue
+            if audio.data:
+                pcm_chunks.append(base64.b64decode(audio.data))
+            if audio.url:
+                audio_url = audio.url
+
+        if not pcm_chunks:
+            if audio_url:
+                logger.debug(f"[{self.__class__.__name__}] No inline audio in stream, downloading URL instead.")
+                return self._download(audio_url, output_path)
+            logger.error(f"[{self.__class__.__name__}] Qwen-TTS stream returned no audio.")
+            return False
+
+        data_size = sum(len(chunk) for chunk in pcm_chunks)
+        with AtomicFileWriter(output_path) as writer:
+            writer.write(wav_header(data_size, INLINE_SAMPLE_RATE, INLINE_CHANNELS, INLINE_SAMPLE_WIDTH))
+            for chunk in pcm_chunks:
+                writer.write(chunk)
+            return writer.commit()
+
+    def _download(self, audio_url: str, output_path: str) -> bool:
+        """
+        通过 keep-alive 连接池下载音频，失败时在总时限内按指数退避重试
+
+        Returns:
+            是否成功保存
+        """
+        logger.debug(f"Downloading WAV audio from: {audio_url}")
+        deadline = time.monotonic() + self.download_deadline
+        delay = DOWNLOAD_RETRY_DELAY
+        attempt = 0
+        while True:
+            attempt += 1
+            remaining = deadline - time.monotonic()
+            try:
+                with AtomicFileWriter(output_path) as writer:
+                    status = _http_pool.download(audio_url, writer, timeout=max(remaining, 1.0))
+                    if status == 200 and writer.commit():
+                        return True
+                logger.warning(f"Audio download attempt {attempt} failed: HTTP {status}"
+                               f"{' (empty body)' if status == 200 else ''}")
+                # 客户端错误（签名过期等）重试也无济于事
+                if 400 <= status < 500:
+                    return False
+            except (http.client.HTTPException, OSError) as e:
+                logger.warning(f"Audio download attempt {attempt} failed: {e}")
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.error(f"Failed to download audio after {attempt} attempts "
+                             f"within {self.download_deadline:g}s")
+                return False
+            time.sleep(min(delay, remaining))
+            delay *= 2
@@ -0,0 +1,111 @@
+# anki_gpt_addon/llm/registry.py
+"""
+服务注册表
+按配置指纹缓存 LLM / TTS / ASR 服务实例和卡片生成器，在预览、批量生成和 ASR 流程之间复用，
+只有与服务相关的配置（API Key、TTS 提供商及其选项、SSML、缓存选项等）变化时才重新创建。
+"""
+import hashlib
+import json
+import logging
+import threading
+from typing import Optional
+
+from .generator import AnkiCardGenerator
+from .providers.dashscope import DashScopeLLMService
+from .providers.dashscope_asr import DashScopeASRService
+from ..consts import ADDON_NAME
+
+logger = logging.getLogger(ADDON_NAME)
+
+# 影响服务实例的配置项；其他配置（牌组、界面选项等）变化时不需要重建服务
+SERVICE_CONFIG_KEYS = (
+    "tts_provider",
+    "qwen_tts_options",
+    "cosyvoice_tts_options",
+    "ssml_options",
+    "interactive_player_enabled",
+    "llm_cache_options",
+    "tts_cache_options",
+    "audio_postprocess_options",
+)
+
+
+def config_fingerprint(api_key: str, config: dict | None) -> str:
+    """计算 API Key 和服务相关配置的指纹"""
+    config = config or {}
+    relevant = {key: config.get(key) for key in SERVICE_CONFIG_KEYS}
+    payload = json.dumps([api_key, relevant], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ServiceRegistry:
+    """进程内共享的服务实例注册表"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fingerprint: Optional[str] = None
+        self._card_generator: Optional[AnkiCardGenerator] = None
+        self._asr_key: Optional[str] = None
+        self._asr_service: Optional[DashScopeASRService] = None
+
+    def get_card_generator(self, api_key: str, config: dict | None) -> AnkiCardGenerator:
+        """
+        返回注入了 LLM 和 TTS 服务的卡片生成器，配置未变化时复用已有实例
+
+        Args:
+            api_key: DashScope API Key
+            config: 插件的完整配置字典
+
+        Returns:
+            AnkiCardGenerator 实例
+        """
+        fingerprint = config_fingerprint(api_key, config)
+        with self._lock:
+            if self._card_generator is None or self._fingerprint != fingerprint:
+                # 延迟导入，避免与 llm/__init__.py 循环导入
+                from . import create_card_generator
+                logger.info(f"[{self.__class__.__name__}] Building services for config {fingerprint[:8]}.")
+                self._close_card_generator()
+                self._card_generator = create_card_generator(api_key, config)
+                self._fingerprint = fingerprint
+            return self._card_generator
+
+    def get_llm_service(self, api_key: str, config: dict | None) -> DashScopeLLMService:
+        """返回与卡片生成器共享的 LLM 服务实例"""
+        return self.get_card_generator(api_key, config).llm_service
+
+    def get_asr_service(self, api_key: str) -> DashScopeASRService:
+        """返回 ASR 服务实例，API Key 未变化时复用"""
+        with self._lock:
+            if self._asr_service is None or self._asr_key != api_key:
+                self._asr_service = DashScopeASRService(api_key=api_key)
+                self._asr_key = api_key
+            return self._asr_service
+
+    def refresh(self, api_key: str, config: dict | None) -> None:
+        """
+        配置保存后调用：服务相关配置发生变化时丢弃旧实例，下次使用时按新配置创建
+        """
+        fingerprint = config_fingerprint(api_key, config)
+        with self._lock:
+            if self._fingerprint is not None and self._fingerprint != fingerprint:
+                logger.info(f"[{self.__class__.__name__}] Service config changed, services will be rebuilt.")
+                self._close_card_generator()
+                self._fingerprint = None
+            if self._asr_key is not None and self._asr_key != api_key:
+                self._asr_service = None
+                self._asr_key = None
+
+    def _close_card_generator(self) -> None:
+        """关闭并丢弃当前的卡片生成器（调用方持有 _lock）"""
+        if self._card_generator is not None:
+            self._card_generator.close()
+            self._card_generator = None
+
+
+_registry = ServiceRegistry()
+
+
+def get_service_registry() -> ServiceRegistry:
+    """返回进程内共享的服务注册表"""
+    return _registry
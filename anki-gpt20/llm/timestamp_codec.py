@@ -0,0 +1,152 @@
+# anki_gpt_addon/llm/timestamp_codec.py
+"""
+Timestamps 字段的紧凑编码
+旧格式是逐字符的 JSON 对象列表，每个字符都重复 text/begin_time/end_time 三个键，
+长篇 ASR 卡片的字段因此很大，拖慢集合同步和读取。
+
+紧凑格式（版本 1）为 "ts1:" 前缀加 base64 编码的二进制数据，依次为：
+    条目数 n
+    n 个文本长度（按 Unicode 字符计）
+    n 个开始时间增量（相对上一条的结束时间，zigzag 编码，毫秒）
+    n 个时长（结束时间 - 开始时间，zigzag 编码，毫秒）
+    所有条目的文本拼接成的 UTF-8 字符串
+整数均为 LEB128 变长编码。前端的 decodeTimestamps（webview_interactive_player.js）实现同样的解码。
+"""
+import base64
+import binascii
+import json
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..consts import ADDON_NAME
+
+logger = logging.getLogger(ADDON_NAME)
+
+COMPACT_PREFIX = "ts1:"
+# 紧凑格式只保存这三个键，包含其他键的时间戳保持 JSON 格式以免丢失数据
+COMPACT_KEYS = frozenset(("text", "begin_time", "end_time"))
+
+
+def _write_varint(buffer: bytearray, value: int) -> None:
+    """写入无符号 LEB128 整数"""
+    while value >= 0x80:
+        buffer.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    """读取无符号 LEB128 整数，返回 (值, 新位置)"""
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def _zigzag(value: int) -> int:
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def _unzigzag(value: int) -> int:
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+
+def _millis(value: Any) -> Optional[int]:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return int(round(value))
+
+
+def is_compact_timestamps(value: Any) -> bool:
+    """判断字段内容是否为紧凑格式"""
+    return isinstance(value, str) and value.startswith(COMPACT_PREFIX)
+
+
+def encode_timestamps(timestamps: Optional[List[Dict[str, Any]]]) -> str:
+    """
+    把时间戳列表编码为 Timestamps 字段内容
+
+    时间会取整到毫秒；条目包含额外的键或缺少时间时回退到 JSON，保证可以无损读回。
+
+    Args:
+        timestamps: [{"text", "begin_time", "end_time"}]，时间单位为毫秒
+
+    Returns:
+        字段字符串；空列表返回空字符串
+    """
+    if not timestamps:
+        return ""
+    lengths = bytearray()
+    begins = bytearray()
+    durations = bytearray()
+    texts = []
+    previous_end = 0
+    for ts in timestamps:
+        begin, end = _millis(ts.get("begin_time")), _millis(ts.get("end_time"))
+        text = ts.get("text")
+        if begin is None or end is None or not isinstance(text, str) or not COMPACT_KEYS.issuperset(ts):
+            return json.dumps(timestamps)
+        texts.append(text)
+        _write_varint(lengths, len(text))
+        _write_varint(begins, _zigzag(begin - previous_end))
+        _write_varint(durations, _zigzag(end - begin))
+        previous_end = end
+
+    payload = bytearray()
+    _write_varint(payload, len(texts))
+    payload += lengths + begins + durations
+    payload += "".join(texts).encode("utf-8")
+    return COMPACT_PREFIX + base64.b64encode(bytes(payload)).decode("ascii")
+
+
+def decode_timestamps(value: Optional[str]) -> Optional[List[Dict[str, Any]]]:
+    """
+    解析 Timestamps 字段，同时支持紧凑格式和旧的 JSON 格式
+
+    Args:
+        value: 字段内容
+
+    Returns:
+        时间戳列表；字段为空或内容无效时返回 None
+    """
+    if not value or not value.strip():
+        return None
+    if not is_compact_timestamps(value):
+        try:
+            timestamps = json.loads(value)
+        except (ValueError, TypeError):
+            logger.warning("[timestamp_codec] Invalid JSON in Timestamps field.")
+            return None
+        return timestamps if isinstance(timestamps, list) else None
+
+    try:
+        data = base64.b64decode(value[len(COMPACT_PREFIX):].strip(), validate=True)
+        count, pos = _read_varint(data, 0)
+        columns = []
+        for _ in range(3):
+            column = []
+            for _ in range(count):
+                item, pos = _read_varint(data, pos)
+                column.append(item)
+            columns.append(column)
+        text = data[pos:].decode("utf-8")
+    except (binascii.Error, IndexError, UnicodeDecodeError) as e:
+        logger.warning(f"[timestamp_codec] Invalid compact Timestamps field: {e}")
+        return None
+
+    lengths, begins, durations = columns
+    if sum(lengths) != len(text):
+        logger.warning("[timestamp_codec] Compact Timestamps field text length mismatch.")
+        return None
+    timestamps = []
+    offset = previous_end = 0
+    for length, begin_delta, duration in zip(lengths, begins, durations):
+        begin = previous_end + _unzigzag(begin_delta)
+        previous_end = begin + _unzigzag(duration)
+        timestamps.append({"text": text[offset:offset + length], "begin_time": begin, "end_time": previous_end})
+        offset += length
+    return timestamps
@@ -4,10 +4,36 @@ import logging
 import html
 import re
 import os
-import mutagen
-from mutagen.wave import WAVE
-from mutagen.mp3 import MP3
-from mutagen.flac import FLAC
+import struct
+import tempfile
+import threading
+from functools import lru_cache
+from itertools import accumulate
+from operator import add
+from typing import Iterable
+
+# --- 音频时长探测 ---
+DURATION_CACHE_SIZE = 1024  # 缓存的文件数上限
+MP3_SYNC_SEARCH_BYTES = 64 * 1024  # 在标签之后查找首个帧同步字的范围
+# Layer III 比特率表（kbps），按 MPEG 版本区分：MPEG1 / MPEG2 与 MPEG2.5
+MP3_BITRATES = {
+    1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+MP3_SAMPLE_RATES = {1: (44100, 48000, 32000), 2: (22050, 24000, 16000), 25: (11025, 12000, 8000)}
+
+# --- 时间戳估算 ---
+DEFAULT_CHAR_WEIGHT = 1.0
+# 促音、长音和拗音的小写假名发音较短
+CHAR_WEIGHTS = {
+    **dict.fromkeys('っッ', 0.7),
+    'ー': 0.8,
+    **dict.fromkeys('ゃゅょャュョ', 0.3),
+}
+PAUSE_VALUE_PATTERN = re.compile(r'(\d+)')
+
+_duration_cache: dict[str, tuple[int, int, float]] = {}
+_duration_cache_lock = threading.Lock()
 
 def markdown_to_anki_html(markdown_text: str) -> str:
     """
@@ -17,10 +43,272 @@ def markdown_to_anki_html(markdown_text: str) -> str:
     html_text = html_text.replace('\n', '<br>')
     return html_text
 
+class AtomicFileWriter:
+    """
+    分块写入音频文件：数据先追加到目标目录下的临时 .part 文件，完成后原子地重命名为目标文件。
+    出错或未提交时删除临时文件，目标路径上永远不会出现写了一半的文件。
+    write 可以在 SDK 的回调线程中调用，提交或丢弃之后到达的数据会被忽略。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory, name = os.path.split(os.path.abspath(path))
+        fd, self.temp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".part", dir=directory)
+        self._file = os.fdopen(fd, "wb")
+        self._lock = threading.Lock()
+        self.bytes_written = 0
+
+    def write(self, data: bytes) -> None:
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(data)
+            self.bytes_written += len(data)
+
+    def commit(self) -> bool:
+        """
+        关闭临时文件并替换目标文件
+
+        Returns:
+            是否写入了数据；没有数据时不替换目标文件并删除临时文件
+        """
+        with self._lock:
+            if self._file is None:
+                return False
+            self._file.close()
+            self._file = None
+            if self.bytes_written == 0:
+                self._remove_temp()
+                return False
+            try:
+                os.replace(self.temp_path, self.path)
+            except OSError:
+                self._remove_temp()
+                raise
+            return True
+
+    def discard(self) -> None:
+        """放弃写入并删除临时文件"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                self._remove_temp()
+
+    def _remove_temp(self) -> None:
+        try:
+            os.remove(self.temp_path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self) -> "AtomicFileWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        # 正常路径需要显式 commit，其余情况一律丢弃
+        self.discard()
+
+
+def _probe_wav_duration(f) -> float | None:
+    """遍历 RIFF 块，根据 fmt 块的字节率和 data 块的大小计算时长"""
+    header = f.read(12)
+    if len(header) < 12 or header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+        return None
+    byte_rate = None
+    while True:
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            return None
+        chunk_id, chunk_size = struct.unpack('<4sI', chunk)
+        if chunk_id == b'fmt ':
+            fmt = f.read(chunk_size)
+            if len(fmt) < 12:
+                return None
+            byte_rate = struct.unpack_from('<I', fmt, 8)[0]
+            if chunk_size % 2:
+                f.seek(1, os.SEEK_CUR)
+        elif chunk_id == b'data':
+            if not byte_rate:
+                return None
+            # 流式写入的 WAV 可能把 data 大小留为 0 或 0xFFFFFFFF，此时以文件剩余长度为准
+            remaining = os.fstat(f.fileno()).st_size - f.tell()
+            if chunk_size == 0 or chunk_size == 0xFFFFFFFF or chunk_size > remaining:
+                chunk_size = remaining
+            return chunk_size / byte_rate
+        else:
+            f.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+
+
+def _probe_mp3_duration(f) -> float | None:
+    """
+    读取首个 Layer III 帧头：有 Xing/Info 或 VBRI 头时按总帧数计算，否则按 CBR 比特率和文件大小估算
+    """
+    file_size = os.fstat(f.fileno()).st_size
+    audio_start = 0
+    header = f.read(10)
+    if len(header) == 10 and header[:3] == b'ID3':
+        tag_size = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+        audio_start = 10 + tag_size + (10 if header[5] & 0x10 else 0)
+    f.seek(audio_start)
+    data = f.read(MP3_SYNC_SEARCH_BYTES)
+
+    pos = data.find(b'\xff')
+    while 0 <= pos <= len(data) - 4:
+        b1, b2, b3 = data[pos + 1], data[pos + 2], data[pos + 3]
+        version_bits, layer_bits = (b1 >> 3) & 0x3, (b1 >> 1) & 0x3
+        bitrate_index, rate_index = b2 >> 4, (b2 >> 2) & 0x3
+        if (b1 & 0xE0) == 0xE0 and version_bits != 1 and layer_bits == 1 \
+                and 0 < bitrate_index < 15 and rate_index < 3:
+            break
+        pos = data.find(b'\xff', pos + 1)
+    else:
+        return None
+
+    version = {3: 1, 2: 2, 0: 25}[version_bits]
+    sample_rate = MP3_SAMPLE_RATES[version][rate_index]
+    bitrate = MP3_BITRATES[1 if version == 1 else 2][bitrate_index] * 1000
+    samples_per_frame = 1152 if version == 1 else 576
+    mono = (b3 >> 6) == 3
+    frame = data[pos:pos + 200]
+
+    side_info = (17 if mono else 32) if version == 1 else (9 if mono else 17)
+    xing = frame[4 + side_info:4 + side_info + 12]
+    if len(xing) == 12 and xing[:4] in (b'Xing', b'Info'):
+        flags = struct.unpack('>I', xing[4:8])[0]
+        if flags & 0x1:
+            frames = struct.unpack('>I', xing[8:12])[0]
+            return frames * samples_per_frame / sample_rate
+    vbri = frame[36:36 + 18]
+    if len(vbri) == 18 and vbri[:4] == b'VBRI':
+        frames = struct.unpack('>I', vbri[14:18])[0]
+        return frames * samples_per_frame / sample_rate
+
+    audio_bytes = file_size - (audio_start + pos)
+    if file_size >= 128:
+        f.seek(file_size - 128)
+        if f.read(3) == b'TAG':
+            audio_bytes -= 128
+    return audio_bytes * 8 / bitrate if audio_bytes > 0 else None
+
+
+def _mutagen_duration(audio_path: str) -> float | None:
+    """未知格式的后备方案：按需导入 mutagen 解析"""
+    try:
+        import mutagen
+    except ImportError:
+        return None
+    audio = mutagen.File(audio_path)
+    return audio.info.length if audio and audio.info else None
+
+
+def probe_audio_duration(audio_path: str) -> float | None:
+    """
+    读取音频时长（秒），只解析文件头
+
+    WAV 读取 RIFF 块，MP3 读取首帧的 Xing/VBRI 头（或按 CBR 估算），其他格式回退到 mutagen。
+    结果按路径、修改时间和文件大小缓存。
+
+    Args:
+        audio_path: 音频文件路径
+
+    Returns:
+        时长（秒），无法识别时返回 None
+    """
+    stat = os.stat(audio_path)
+    with _duration_cache_lock:
+        cached = _duration_cache.get(audio_path)
+    if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return cached[2]
+
+    duration = None
+    file_ext = os.path.splitext(audio_path)[1].lower()
+    if file_ext in ('.wav', '.mp3'):
+        with open(audio_path, 'rb') as f:
+            duration = _probe_wav_duration(f) if file_ext == '.wav' else _probe_mp3_duration(f)
+    if duration is None:
+        duration = _mutagen_duration(audio_path)
+    if duration is None:
+        return None
+
+    with _duration_cache_lock:
+        if len(_duration_cache) >= DURATION_CACHE_SIZE:
+            _duration_cache.pop(next(iter(_duration_cache)))
+        _duration_cache[audio_path] = (stat.st_mtime_ns, stat.st_size, duration)
+    return duration
+
+
+def _pause_table_key(ssml_config: dict | None) -> tuple:
+    """把 SSML 规则转换为可哈希的缓存键；只有单个字符的规则会在文本中单独出现"""
+    rules = (ssml_config or {}).get("rules")
+    if not rules or not isinstance(rules, dict):
+        return ()
+    return tuple(sorted((k, v if isinstance(v, str) else None) for k, v in rules.items()
+                        if isinstance(k, str) and len(k) == 1))
+
+
+@lru_cache(maxsize=32)
+def _compile_pause_table(rules_key: tuple) -> dict[str, int]:
+    """
+    预先解析每条 SSML 规则的停顿时长
+
+    Returns:
+        规则字符 -> 停顿毫秒数（无法解析的规则为 0，该字符仍不计入发音）
+    """
+    table = {}
+    for char, value in rules_key:
+        match = PAUSE_VALUE_PATTERN.match(value) if value is not None else None
+        table[char] = int(match.group(1)) if match else 0
+    return table
+
+
+def timestamps_for_duration(text: str, total_duration_ms: float,
+                            ssml_config: dict | None) -> tuple[list | None, float, float]:
+    """
+    按字符权重把音频总时长分配给每个字符
+
+    Args:
+        text: 合成音频所用的文本
+        total_duration_ms: 音频总时长（毫秒）
+        ssml_config: SSML 配置，规则字符按设定的停顿时长计时，不生成时间戳
+
+    Returns:
+        (时间戳列表, 总停顿毫秒数, 总发音权重)；无法估算时时间戳列表为 None
+    """
+    pauses = _compile_pause_table(_pause_table_key(ssml_config))
+    weight_of = CHAR_WEIGHTS.get
+    chars: list[str] = []
+    steps: list[float] = []  # 每个字符之前的停顿，稍后加上该字符的时长
+    weights: list[float] = []
+    pending_pause = 0
+    total_pause_ms = 0
+    for char in text:
+        pause = pauses.get(char)
+        if pause is not None:
+            pending_pause += pause
+            total_pause_ms += pause
+            continue
+        chars.append(char)
+        weights.append(weight_of(char, DEFAULT_CHAR_WEIGHT))
+        steps.append(pending_pause)
+        pending_pause = 0
+
+    total_speech_weight = sum(weights)
+    net_speech_duration_ms = total_duration_ms - total_pause_ms
+    if net_speech_duration_ms <= 0 or total_speech_weight == 0:
+        return None, total_pause_ms, total_speech_weight
+
+    time_per_weight_unit = net_speech_duration_ms / total_speech_weight
+    durations = [weight * time_per_weight_unit for weight in weights]
+    ends = accumulate(map(add, steps, durations))
+    timestamps = [{"text": char, "begin_time": round(end - duration), "end_time": round(end)}
+                  for char, duration, end in zip(chars, durations, ends)]
+    return timestamps, total_pause_ms, total_speech_weight
+
+
 def estimate_timestamps(text: str, audio_path: str, ssml_config: dict, logger: logging.Logger) -> list | None:
     """
     根据音频总时长和文本内容，估算每个字符的时间戳。
-    此版本使用基于文件后缀的精确解析器，以避免自动检测失败。
+    时长由 probe_audio_duration 只读取文件头获得。
     """
     logger.info("API did not return timestamps. Attempting to estimate them.")
     if not os.path.exists(audio_path):
@@ -28,81 +316,52 @@ def estimate_timestamps(text: str, audio_path: str, ssml_config: dict, logger: l
         return None
 
     try:
-        file_ext = os.path.splitext(audio_path)[1].lower()
-        if file_ext == '.wav':
-            audio = WAVE(audio_path)
-        elif file_ext == '.mp3':
-            audio = MP3(audio_path)
-        elif file_ext == '.flac':
-            audio = FLAC(audio_path)
-        else:
-            logger.warning(f"Unknown extension '{file_ext}'. Attempting generic load.")
-            audio = mutagen.File(audio_path)
-            if not audio:
-                raise mutagen.MutagenError(f"Could not recognize format for unknown extension file: {audio_path}")
-        total_duration_ms = audio.info.length * 1000
+        duration = probe_audio_duration(audio_path)
     except Exception as e:
-        logger.error(f"Failed to read audio duration with mutagen: {e}")
+        logger.error(f"Failed to read audio duration: {e}")
         return None
+    if duration is None:
+        logger.error(f"Failed to read audio duration: unrecognized format '{audio_path}'.")
+        return None
+    total_duration_ms = duration * 1000
 
-    char_weights = {'sokuon': 0.7, 'long_vowel': 0.8, 'yoon': 0.3, 'kana': 1.0}
-    total_pause_ms = 0
-    total_speech_weight = 0
-    ssml_rules = ssml_config.get("rules", {})
-    tokens = [text]
+    timestamps, total_pause_ms, total_speech_weight = timestamps_for_duration(text, total_duration_ms, ssml_config)
+    if timestamps is None:
+        logger.warning(
+            f"Cannot estimate timestamps: Invalid net speech duration ({total_duration_ms - total_pause_ms:.2f}ms) or total speech weight ({total_speech_weight:.2f}).")
+        return None
 
-    if ssml_rules:
-        split_pattern = f"([{''.join(re.escape(k) for k in ssml_rules.keys())}])"
-        tokens = [t for t in re.split(split_pattern, text) if t]
+    logger.info(f"Successfully estimated {len(timestamps)} timestamps for audio of {total_duration_ms:.2f}ms.")
+    return timestamps
 
-    for token in tokens:
-        if token in ssml_rules:
-            try:
-                match = re.match(r'(\d+)', ssml_rules[token])
-                if match: total_pause_ms += int(match.group(1))
-            except (ValueError, TypeError):
-                continue
-        else:
-            for char in token:
-                weight = char_weights['kana']
-                if char in 'っッ':
-                    weight = char_weights['sokuon']
-                elif char == 'ー':
-                    weight = char_weights['long_vowel']
-                elif char in 'ゃゅょャュョ':
-                    weight = char_weights['yoon']
-                total_speech_weight += weight
 
-    net_speech_duration_ms = total_duration_ms - total_pause_ms
-    if net_speech_duration_ms <= 0 or total_speech_weight == 0:
-        logger.warning(
-            f"Cannot estimate timestamps: Invalid net speech duration ({net_speech_duration_ms:.2f}ms) or total speech weight ({total_speech_weight:.2f}).")
-        return None
+def estimate_timestamps_bulk(items: Iterable[tuple[str, str]], ssml_config: dict,
+                             logger: logging.Logger) -> list[list | None]:
+    """
+    批量估算时间戳，例如为整个牌组回填 Timestamps 字段
 
-    time_per_weight_unit = net_speech_duration_ms / total_speech_weight
-    timestamps = []
-    current_time_ms = 0.0
+    与逐条调用 estimate_timestamps 相比，共享同一份预编译的规则表，并只在结束时汇总记录一次日志。
 
-    for token in tokens:
-        if token in ssml_rules:
-            try:
-                match = re.match(r'(\d+)', ssml_rules[token])
-                if match: current_time_ms += int(match.group(1))
-            except (ValueError, TypeError):
-                continue
-        else:
-            for char in token:
-                weight = char_weights['kana']
-                if char in 'っッ':
-                    weight = char_weights['sokuon']
-                elif char == 'ー':
-                    weight = char_weights['long_vowel']
-                elif char in 'ゃゅょャュョ':
-                    weight = char_weights['yoon']
-                char_duration = weight * time_per_weight_unit
-                timestamps.append({"text": char, "begin_time": round(current_time_ms),
-                                   "end_time": round(current_time_ms + char_duration)})
-                current_time_ms += char_duration
+    Args:
+        items: (文本, 音频路径) 序列
+        ssml_config: SSML 配置
+        logger: 日志记录器
 
-    logger.info(f"Successfully estimated {len(timestamps)} timestamps for audio of {total_duration_ms:.2f}ms.")
-    return timestamps
\ No newline at end of file
+    Returns:
+        与输入顺序一致的时间戳列表，无法估算的条目为 None
+    """
+    results: list[list | None] = []
+    failed = 0
+    for text, audio_path in items:
+        timestamps = None
+        try:
+            duration = probe_audio_duration(audio_path)
+            if duration is not None:
+                timestamps = timestamps_for_duration(text, duration * 1000, ssml_config)[0]
+        except OSError:
+            pass
+        if timestamps is None:
+            failed += 1
+        results.append(timestamps)
+    logger.info(f"Estimated timestamps for {len(results) - failed}/{len(results)} items.")
+    return results
@@ -0,0 +1,122 @@
+# anki_gpt_addon/tests/test_alignment.py
+"""
+时间戳对齐的单元测试
+检查假名到汉字的映射、词级时间戳展开、标点处理以及长文本和极不对称序列下的带状对齐
+"""
+import logging
+import random
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from anki_gpt20.llm.alignment import align_sequences, align_timestamps
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+
+def _char_timestamps(text: str, step: int = 100) -> list:
+    return [{'text': char, 'begin_time': i * step, 'end_time': (i + 1) * step} for i, char in enumerate(text)]
+
+
+def _spans(aligned: list) -> list:
+    return [(ts['text'], ts['begin_time'], ts['end_time']) for ts in aligned]
+
+
+def test_kana_to_kanji():
+    """汉字平分对应假名的时间段，相同的假名直接继承时间"""
+    aligned = align_timestamps('今日はいい天気です。', _char_timestamps('きょうはいいてんきです'))
+    assert _spans(aligned) == [
+        ('今', 0, 150), ('日', 150, 300),  # きょう
+        ('は', 300, 400), ('い', 400, 500), ('い', 500, 600),
+        ('天', 600, 750), ('気', 750, 900),  # てんき
+        ('で', 900, 1000), ('す', 1000, 1100),
+        ('。', 1100, 1100),
+    ]
+
+
+def test_word_level_spans_split_across_chars():
+    timestamps = [
+        {'text': '今日は', 'begin_time': 0, 'end_time': 300},
+        {'text': '晴れ', 'begin_time': 300, 'end_time': 500},
+    ]
+    aligned = align_timestamps('今日は、晴れ。', timestamps)
+    assert _spans(aligned) == [
+        ('今', 0, 100), ('日', 100, 200), ('は', 200, 300), ('、', 300, 300),
+        ('晴', 300, 400), ('れ', 400, 500), ('。', 500, 500),
+    ]
+
+
+def test_zero_length_punctuation_and_newlines():
+    """源时间戳中的标点和换行被跳过，目标中的标点和换行时长为 0"""
+    timestamps = [
+        {'text': 'あ', 'begin_time': 0, 'end_time': 100},
+        {'text': '。', 'begin_time': 100, 'end_time': 100},
+        {'text': '\n', 'begin_time': 100, 'end_time': 100},
+        {'text': 'い', 'begin_time': 200, 'end_time': 300},
+        {'text': '', 'begin_time': 300, 'end_time': 300},
+    ]
+    aligned = align_timestamps('あ\n「い」', timestamps)
+    assert _spans(aligned) == [('あ', 0, 100), ('\n', 100, 100), ('「', 100, 100), ('い', 200, 300), ('」', 300, 300)]
+
+
+def test_empty_and_all_punctuation_targets():
+    timestamps = _char_timestamps('あい', step=100)
+    timestamps[0]['begin_time'] = 50
+    assert align_timestamps('', timestamps) == []
+    aligned = align_timestamps('。、\n', timestamps)
+    assert _spans(aligned) == [('。', 50, 50), ('、', 50, 50), ('\n', 50, 50)]
+    # 没有可用的源时间戳时全部为 0
+    assert _spans(align_timestamps('あ。', [])) == [('あ', 0, 0), ('。', 0, 0)]
+    assert _spans(align_timestamps('あ', [{'text': '。', 'begin_time': 10, 'end_time': 10}])) == [('あ', 0, 0)]
+
+
+def test_long_text_with_inserted_punctuation_is_monotonic():
+    rng = random.Random(20)
+    source_text = ''.join(rng.choice('あいうえおかきくけこさしすせそ') for _ in range(5000))
+    target_chars = []
+    for k, char in enumerate(source_text):
+        if k % 97 == 0:
+            char = '漢'  # 少量改写
+        target_chars.append(char)
+        if k % 7 == 6:
+            target_chars.append(rng.choice('。、！？\n'))
+    target_text = ''.join(target_chars)
+
+    aligned = align_timestamps(target_text, _char_timestamps(source_text, step=50))
+    assert [ts['text'] for ts in aligned] == list(target_text)
+    begins = [ts['begin_time'] for ts in aligned]
+    assert begins == sorted(begins)
+    assert all(ts['end_time'] >= ts['begin_time'] for ts in aligned)
+    assert aligned[-1]['end_time'] == 5000 * 50
+    # 未改写的字符直接继承对应源字符的时间
+    kept = [ts for ts in aligned if ts['text'] not in '。、！？\n']
+    for k in (1, 500, 2501, 4999):
+        assert (kept[k]['begin_time'], kept[k]['end_time']) == (k * 50, (k + 1) * 50)
+
+
+def test_band_with_many_more_rows_than_cols():
+    """源序列远长于目标序列时，目标字符仍能在带内找到正确的匹配"""
+    source = ['x'] * 2000
+    for k in range(20):
+        source[k * 100 + 50] = chr(0x4e00 + k)
+    target = [chr(0x4e00 + k) for k in range(20)]
+    assert align_sequences(source, target) == [k * 100 + 50 for k in range(20)]
+    assert align_sequences(target, source) == [target.index(c) if c != 'x' else -1 for c in source]
+
+    assert align_sequences(list('a' * 200 + 'b' + 'c' * 200), ['b']) == [200]
+    assert align_sequences(list('abc' * 300), list('xyz')) == [-1, -1, -1]
+    assert align_sequences([], list('ab')) == [-1, -1]
+    assert align_sequences(list('ab'), []) == []
+
+
+if __name__ == "__main__":
+    test_kana_to_kanji()
+    test_word_level_spans_split_across_chars()
+    test_zero_length_punctuation_and_newlines()
+    test_empty_and_all_punctuation_targets()
+    test_long_text_with_inserted_punctuation_is_monotonic()
+    test_band_with_many_more_rows_than_cols()
+    print("✓ 时间戳对齐测试通过")
@@ -0,0 +1,131 @@
+# anki_gpt_addon/tests/test_audio.py
+"""
+音频后处理的单元测试
+检查静音检测、时间戳平移、WAV 首尾静音裁剪以及裁剪后重新估算时间戳（不依赖 ffmpeg）
+"""
+import logging
+import os
+import sys
+import tempfile
+import wave
+from array import array
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from anki_gpt20.llm.audio import SILENCE_PADDING_MS, AudioPostProcessor, find_voiced_range, shift_timestamps
+from anki_gpt20.llm.providers.qwen_tts import QwenTTSService
+from anki_gpt20.llm.utils import estimate_timestamps
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+SAMPLE_RATE = 1000  # 每个 10ms 窗口 10 帧，便于计算
+
+
+def _samples(silent_before: int, voiced: int, silent_after: int, channels: int = 1) -> array:
+    frames = [0] * silent_before + [8000] * voiced + [0] * silent_after
+    return array("h", [value for value in frames for _ in range(channels)])
+
+
+def test_find_voiced_range_mono():
+    samples = _samples(100, 50, 100)
+    assert find_voiced_range(samples, 1, SAMPLE_RATE, 1000) == (100, 150)
+    # 语音不在窗口边界上时扩展到所在窗口
+    assert find_voiced_range(_samples(105, 10, 95), 1, SAMPLE_RATE, 1000) == (100, 120)
+
+
+def test_find_voiced_range_stereo_and_negative_peaks():
+    samples = _samples(40, 20, 40, channels=2)
+    assert find_voiced_range(samples, 2, SAMPLE_RATE, 1000) == (40, 60)
+    negative = array("h", [0] * 30 + [-9000] * 10 + [0] * 30)
+    assert find_voiced_range(negative, 1, SAMPLE_RATE, 1000) == (30, 40)
+
+
+def test_find_voiced_range_silence_and_edges():
+    assert find_voiced_range(_samples(200, 0, 0), 1, SAMPLE_RATE, 1000) is None
+    assert find_voiced_range(array("h", [500] * 50), 1, SAMPLE_RATE, 1000) is None
+    # 没有首尾静音，末尾不足一个窗口时不越界
+    assert find_voiced_range(_samples(0, 55, 0), 1, SAMPLE_RATE, 1000) == (0, 55)
+
+
+def test_shift_timestamps():
+    timestamps = [
+        {"text": "あ", "begin_time": 50, "end_time": 250},
+        {"text": "い", "begin_time": 250.6, "end_time": 900},
+        {"text": "。"},
+    ]
+    shifted = shift_timestamps(timestamps, 100, 700)
+    assert shifted == [
+        {"text": "あ", "begin_time": 0, "end_time": 150},
+        {"text": "い", "begin_time": 151, "end_time": 700},
+        {"text": "。"},
+    ]
+    assert timestamps[0]["begin_time"] == 50  # 不修改输入
+    assert shift_timestamps(None, 100, 700) is None
+    assert shift_timestamps([], 100, 700) == []
+
+
+def _write_wav(path: str, samples: array) -> None:
+    if sys.byteorder == "big":
+        samples = array("h", samples)
+        samples.byteswap()
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(samples.tobytes())
+
+
+def test_trim_wav_shifts_timestamps():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "a.wav")
+        _write_wav(path, _samples(500, 200, 500))
+        processor = AudioPostProcessor(output_format="wav")
+        timestamps = [{"text": "あ", "begin_time": 500, "end_time": 700}]
+        audio_path, trimmed = processor.process(path, path, timestamps)
+        assert audio_path == path
+        padding = SILENCE_PADDING_MS
+        with wave.open(path, "rb") as wav:
+            assert wav.getnframes() == 200 + 2 * padding
+        assert trimmed == [{"text": "あ", "begin_time": padding, "end_time": padding + 200}]
+
+        # 已经没有多余静音时保持原样
+        assert processor.process(path, path, trimmed) == (path, trimmed)
+
+
+def test_trim_wav_reestimates_estimated_timestamps():
+    """按未裁剪音频估算的时间戳包含首尾静音，裁剪后应按新的时长重新估算而不是平移"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "a.wav")
+        _write_wav(path, _samples(500, 1000, 500))
+        service = QwenTTSService("key", {}, {}, timestamp_enabled=True)
+        text = "あいうえお"
+        estimated = estimate_timestamps(text, path, {}, logging.getLogger(__name__))
+        assert estimated[-1]["end_time"] == 2000
+
+        processor = AudioPostProcessor(output_format="wav")
+        _, trimmed = processor.process(path, path, estimated,
+                                       reestimate=lambda wav_path: service.reestimate_timestamps(text, wav_path))
+        duration_ms = 1000 + 2 * SILENCE_PADDING_MS
+        assert [ts["text"] for ts in trimmed] == list(text)
+        assert trimmed[0]["begin_time"] == 0 and trimmed[-1]["end_time"] == duration_ms
+        # 每个假名分到相近的时长，开头的字符不会被压缩到 0
+        widths = [ts["end_time"] - ts["begin_time"] for ts in trimmed]
+        assert min(widths) > 0 and max(widths) - min(widths) <= 1
+
+        # 没有提供 reestimate 时沿用平移（适用于 API 返回的时间戳）
+        _write_wav(path, _samples(500, 1000, 500))
+        _, shifted = processor.process(path, path, estimated)
+        assert shifted == shift_timestamps(estimated, 500 - SILENCE_PADDING_MS, duration_ms)
+
+
+if __name__ == "__main__":
+    test_find_voiced_range_mono()
+    test_find_voiced_range_stereo_and_negative_peaks()
+    test_find_voiced_range_silence_and_edges()
+    test_shift_timestamps()
+    test_trim_wav_shifts_timestamps()
+    test_trim_wav_reestimates_estimated_timestamps()
+    print("✓ 音频后处理测试通过")
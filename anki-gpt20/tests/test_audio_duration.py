@@ -0,0 +1,117 @@
+# anki_gpt_addon/tests/test_audio_duration.py
+"""
+音频时长探测的单元测试
+检查 WAV / MP3 文件头解析（含流式写入的 WAV）以及按路径和修改时间失效的缓存
+"""
+import logging
+import os
+import struct
+import sys
+import tempfile
+import wave
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from anki_gpt20.llm import utils
+from anki_gpt20.llm.utils import _probe_mp3_duration, probe_audio_duration
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+MP3_FIXTURE = Path(__file__).parent / "MP3_01.mp3"
+MP3_FIXTURE_DURATION = 23.954  # 917 帧 × 1152 / 44100
+
+
+def _write_wav(path: str, frames: int, sample_rate: int = 16000, channels: int = 1) -> None:
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(b"\x00\x00" * channels * frames)
+
+
+def _set_data_size(path: str, data_size: int) -> None:
+    """模拟流式写入：把 data 块的长度字段改写为 data_size"""
+    with open(path, "r+b") as f:
+        content = f.read()
+        f.seek(content.index(b"data") + 4)
+        f.write(struct.pack("<I", data_size))
+
+
+def test_wav_duration():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "a.wav")
+        _write_wav(path, 24000)
+        assert probe_audio_duration(path) == 1.5
+        stereo = os.path.join(temp_dir, "b.wav")
+        _write_wav(stereo, 44100, sample_rate=44100, channels=2)
+        assert probe_audio_duration(stereo) == 1.0
+
+
+def test_streaming_wav_duration():
+    """data 大小为 0 或 0xFFFFFFFF 时以文件剩余长度为准"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for index, data_size in enumerate((0, 0xFFFFFFFF)):
+            path = os.path.join(temp_dir, f"stream{index}.wav")
+            _write_wav(path, 8000)
+            _set_data_size(path, data_size)
+            assert probe_audio_duration(path) == 0.5
+
+
+def test_mp3_fixture_duration():
+    with open(MP3_FIXTURE, "rb") as f:
+        assert abs(_probe_mp3_duration(f) - MP3_FIXTURE_DURATION) < 0.05
+    assert abs(probe_audio_duration(str(MP3_FIXTURE)) - MP3_FIXTURE_DURATION) < 0.05
+
+
+def test_mp3_xing_header_and_garbage():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # MPEG-1 Layer III, 128kbps, 44100Hz, 立体声；Xing 头位于帧头和 32 字节边信息之后
+        frame = b"\xff\xfb\x90\x64" + b"\x00" * 32 + b"Xing" + struct.pack(">II", 1, 100)
+        path = os.path.join(temp_dir, "vbr.mp3")
+        with open(path, "wb") as f:
+            f.write(frame + b"\x00" * 400)
+        with open(path, "rb") as f:
+            assert abs(_probe_mp3_duration(f) - 100 * 1152 / 44100) < 1e-9
+
+        garbage = os.path.join(temp_dir, "garbage.mp3")
+        with open(garbage, "wb") as f:
+            f.write(b"\x00\xff\x00" * 100)
+        with open(garbage, "rb") as f:
+            assert _probe_mp3_duration(f) is None
+
+
+def test_duration_cache_invalidation():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "a.wav")
+        _write_wav(path, 16000)
+        assert probe_audio_duration(path) == 1.0
+
+        # 文件未变化时直接返回缓存结果，不再解析文件头
+        original_probe = utils._probe_wav_duration
+        utils._probe_wav_duration = None
+        try:
+            assert probe_audio_duration(path) == 1.0
+        finally:
+            utils._probe_wav_duration = original_probe
+
+        # 大小相同但修改时间不同（采样率改变），缓存失效
+        mtime_ns = os.stat(path).st_mtime_ns
+        _write_wav(path, 16000, sample_rate=8000)
+        os.utime(path, ns=(mtime_ns + 10 ** 9, mtime_ns + 10 ** 9))
+        assert probe_audio_duration(path) == 2.0
+
+        # 文件长度改变，缓存失效
+        _write_wav(path, 4000, sample_rate=8000)
+        assert probe_audio_duration(path) == 0.5
+
+
+if __name__ == "__main__":
+    test_wav_duration()
+    test_streaming_wav_duration()
+    test_mp3_fixture_duration()
+    test_mp3_xing_header_and_garbage()
+    test_duration_cache_invalidation()
+    print("✓ 音频时长探测测试通过")
@@ -0,0 +1,136 @@
+# anki_gpt_addon/tests/test_cache.py
+"""
+llm/cache.py 的单元测试
+在临时目录中检查分析缓存和 TTS 结果缓存的命中、淘汰与失效
+"""
+import logging
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from anki_gpt20.llm.cache import TTS_LOCK_STRIPES, AnalysisCache, TTSResultCache
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+
+def test_analysis_cache_hit_and_miss():
+    """键由模型、变体和规范化后的句子决定"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = AnalysisCache(cache_dir, max_bytes=1024 * 1024)
+        assert cache.get("qwen-plus", "normal", "今日は晴れ") is None
+        cache.put("qwen-plus", "normal", "今日は晴れ", "**解释**")
+        assert cache.get("qwen-plus", "normal", "今日は晴れ") == "**解释**"
+        # 全角空格和首尾空白在规范化后相同
+        assert cache.get("qwen-plus", "normal", "  今日は晴れ　") == "**解释**"
+        assert cache.get("qwen-plus", "asr", "今日は晴れ") is None
+        assert cache.get("qwen-max", "normal", "今日は晴れ") is None
+        stats = cache.stats
+        assert (stats["hits"], stats["misses"], stats["entries"]) == (2, 3, 1)
+
+
+def test_analysis_cache_lru_eviction_by_size():
+    """总大小超过上限时淘汰最久未使用的条目"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        probe = AnalysisCache(cache_dir, max_bytes=1 << 30)
+        probe.put("m", "normal", "a", "x" * 100)
+        entry_size = probe.stats["bytes"]
+        probe._remove(probe.make_key("m", "normal", "a"))
+
+        cache = AnalysisCache(cache_dir, max_bytes=entry_size * 2 + entry_size // 2)
+        cache.put("m", "normal", "a", "x" * 100)
+        cache.put("m", "normal", "b", "y" * 100)
+        # 访问 a 之后 b 成为最久未使用的条目
+        assert cache.get("m", "normal", "a")
+        cache.put("m", "normal", "c", "z" * 100)
+        assert cache.get("m", "normal", "b") is None
+        assert cache.get("m", "normal", "a") == "x" * 100
+        assert cache.get("m", "normal", "c") == "z" * 100
+        assert cache.stats["entries"] == 2
+        assert cache.stats["bytes"] <= cache.max_bytes
+        assert not os.path.exists(cache._path_for(cache.make_key("m", "normal", "b")))
+
+
+def test_analysis_cache_reload_and_unreadable_entry():
+    """重启后从目录重建索引；损坏的条目被丢弃"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = AnalysisCache(cache_dir, max_bytes=1024 * 1024)
+        cache.put("m", "normal", "a", "A")
+        cache.put("m", "normal", "b", "B")
+
+        reloaded = AnalysisCache(cache_dir, max_bytes=1024 * 1024)
+        assert reloaded.stats["entries"] == 2
+        assert reloaded.stats["bytes"] == cache.stats["bytes"]
+        assert reloaded.get("m", "normal", "b") == "B"
+
+        with open(reloaded._path_for(reloaded.make_key("m", "normal", "a")), "w", encoding="utf-8") as f:
+            f.write("{broken")
+        assert reloaded.get("m", "normal", "a") is None
+        assert reloaded.stats["entries"] == 1
+
+
+def _write_audio(path: str, content: bytes) -> None:
+    with open(path, "wb") as f:
+        f.write(content)
+
+
+def test_tts_cache_hit_and_invalidation():
+    """文件存在、大小一致且指纹匹配时命中；参数、文件大小变化或文件缺失时失效"""
+    with tempfile.TemporaryDirectory() as cache_dir, tempfile.TemporaryDirectory() as media_dir:
+        cache = TTSResultCache(cache_dir)
+        audio_path = os.path.join(media_dir, "abc.mp3")
+        params = {"model": "cosyvoice-v2", "voice": "loongyuuna_v2"}
+        timestamps = [{"text": "あ", "begin_time": 0, "end_time": 120}]
+
+        assert cache.get(audio_path, "あ", params) is None
+        _write_audio(audio_path, b"ID3" + b"\x00" * 100)
+        cache.put(audio_path, "あ", params, timestamps)
+        assert cache.get(audio_path, "あ", params) == (audio_path, timestamps)
+
+        # 合成参数或文本变化
+        assert cache.get(audio_path, "あ", {**params, "voice": "other"}) is None
+        assert cache.get(audio_path, "い", params) is None
+        # 文件被替换为不同大小
+        _write_audio(audio_path, b"ID3" + b"\x00" * 50)
+        assert cache.get(audio_path, "あ", params) is None
+        # 文件被删除
+        os.remove(audio_path)
+        assert cache.get(audio_path, "あ", params) is None
+        assert cache.stats == {"hits": 1, "misses": 5}
+
+
+def test_tts_cache_keyed_by_output_path():
+    """后处理转码失败、实际文件仍是 WAV 时，以期望的 MP3 路径查询也能命中"""
+    with tempfile.TemporaryDirectory() as cache_dir, tempfile.TemporaryDirectory() as media_dir:
+        cache = TTSResultCache(cache_dir)
+        output_path = os.path.join(media_dir, "abc.mp3")
+        wav_path = os.path.join(media_dir, "abc.wav")
+        _write_audio(wav_path, b"RIFF" + b"\x00" * 60)
+        cache.put(output_path, "あ", {}, [], audio_path=wav_path)
+        assert cache.get(output_path, "あ", {}) == (wav_path, [])
+        assert not os.path.exists(os.path.join(cache_dir, "abc.wav.json"))
+        os.remove(wav_path)
+        assert cache.get(output_path, "あ", {}) is None
+
+
+def test_tts_cache_locks_are_bounded():
+    """同一文件总是得到同一把锁，锁的数量不随文件数增长"""
+    cache = TTSResultCache(tempfile.gettempdir())
+    assert cache.lock_for("/media/a.mp3") is cache.lock_for("/other/a.mp3")
+    locks = {id(cache.lock_for(f"/media/{i}.mp3")) for i in range(1000)}
+    assert len(locks) <= TTS_LOCK_STRIPES
+    assert len(cache._key_locks) == TTS_LOCK_STRIPES
+
+
+if __name__ == "__main__":
+    test_analysis_cache_hit_and_miss()
+    test_analysis_cache_lru_eviction_by_size()
+    test_analysis_cache_reload_and_unreadable_entry()
+    test_tts_cache_hit_and_invalidation()
+    test_tts_cache_keyed_by_output_path()
+    test_tts_cache_locks_are_bounded()
+    print("✓ cache 测试通过")
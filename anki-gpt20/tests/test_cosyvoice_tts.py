@@ -0,0 +1,177 @@
+# anki_gpt_addon/tests/test_cosyvoice_tts.py
+"""
+CosyVoice 合成器池的单元测试
+SDK 的连接池和合成器被替换为本地对象（不访问网络），检查超时或出错的合成器会被取消并关闭，
+以及服务关闭后共享的池被移除并关闭常驻连接
+"""
+import logging
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from anki_gpt20.llm.providers import cosyvoice_tts as cosyvoice_module
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+
+class MockSynthesizer:
+    def __init__(self, fail_cancel: bool = False):
+        self.calls = []
+        self.fail_cancel = fail_cancel
+
+    def streaming_cancel(self):
+        self.calls.append("streaming_cancel")
+        if self.fail_cancel:
+            raise RuntimeError("already closed")
+
+    def close(self):
+        self.calls.append("close")
+
+
+class MockObjectPool:
+    """模拟 SpeechSynthesizerObjectPool"""
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.returned = []
+        self.shut_down = False
+
+    def borrow_synthesizer(self, **kwargs):
+        return MockSynthesizer()
+
+    def return_synthesizer(self, synthesizer):
+        self.returned.append(synthesizer)
+
+    def shutdown(self):
+        self.shut_down = True
+
+
+def _with_mock_sdk_pool(func):
+    original = cosyvoice_module.SpeechSynthesizerObjectPool
+    cosyvoice_module.SpeechSynthesizerObjectPool = MockObjectPool
+    try:
+        return func()
+    finally:
+        cosyvoice_module.SpeechSynthesizerObjectPool = original
+
+
+def _make_pool(max_size: int = 2):
+    return _with_mock_sdk_pool(lambda: cosyvoice_module._SynthesizerPool("key", max_size))
+
+
+def test_release_returns_reusable_synthesizer():
+    pool = _make_pool()
+    synthesizer = pool.acquire(1.0)
+    pool.release(synthesizer, reusable=True)
+    assert pool._sdk_pool.returned == [synthesizer] and synthesizer.calls == []
+
+
+def test_release_closes_abandoned_synthesizer():
+    """超时或出错的合成器不归还到池中，而是取消任务并关闭连接"""
+    pool = _make_pool(max_size=1)
+    synthesizer = pool.acquire(1.0)
+    pool.release(synthesizer, reusable=False)
+    assert pool._sdk_pool.returned == []
+    assert synthesizer.calls == ["streaming_cancel", "close"]
+
+    # 取消失败时仍然关闭连接并归还名额
+    failing = MockSynthesizer(fail_cancel=True)
+    pool.acquire(1.0)
+    pool.release(failing, reusable=False)
+    assert failing.calls == ["streaming_cancel", "close"]
+    pool.release(pool.acquire(1.0), reusable=True)
+
+
+def test_close_waits_for_running_tasks():
+    pool = _make_pool()
+    sdk_pool = pool._sdk_pool
+    synthesizer = pool.acquire(1.0)
+    pool.close()
+    assert not sdk_pool.shut_down  # 仍有任务在进行
+    pool.release(synthesizer, reusable=True)
+    assert sdk_pool.shut_down and sdk_pool.returned == []
+    assert synthesizer.calls == ["streaming_cancel", "close"]
+    # 关闭后仍可使用，但不再复用常驻连接
+    assert pool._sdk_pool is None
+
+    idle = _make_pool()
+    idle.close()
+    idle.close()
+    assert idle._sdk_pool is None
+
+
+def test_services_release_shared_pools():
+    """服务关闭后不再使用的池从共享表中移除，仍被其他服务使用的池保留"""
+    def create(key, size):
+        return cosyvoice_module.CosyVoiceTTSService(api_key=key, pool_size=size)
+
+    first = _with_mock_sdk_pool(lambda: create("old-key", 2))
+    second = _with_mock_sdk_pool(lambda: create("old-key", 2))
+    other = _with_mock_sdk_pool(lambda: create("old-key", 3))
+    pool = first._pool
+    assert second._pool is pool and pool.users == 2
+    assert ("old-key", 2) in cosyvoice_module._pools and ("old-key", 3) in cosyvoice_module._pools
+
+    first.close()
+    first.close()
+    assert cosyvoice_module._pools.get(("old-key", 2)) is pool and not pool._closed
+    second.close()
+    other.close()
+    assert ("old-key", 2) not in cosyvoice_module._pools and ("old-key", 3) not in cosyvoice_module._pools
+    assert pool._closed
+
+
+def test_scoped_api_key_restores_global():
+    dashscope = cosyvoice_module.dashscope
+    original = dashscope.api_key
+    dashscope.api_key = "global"
+    try:
+        with cosyvoice_module._scoped_api_key("scoped"):
+            assert dashscope.api_key == "scoped"
+        try:
+            with cosyvoice_module._scoped_api_key("scoped"):
+                raise RuntimeError("boom")
+        except RuntimeError:
+            pass
+        assert dashscope.api_key == "global"
+    finally:
+        dashscope.api_key = original
+
+
+def test_create_synthesizer_prefers_per_object_key():
+    """构造函数支持 api_key 参数时按对象传入，不修改全局凭据"""
+    seen = []
+
+    class KeyedSynthesizer:
+        def __init__(self, api_key=None, **kwargs):
+            seen.append((api_key, cosyvoice_module.dashscope.api_key))
+
+    class LegacySynthesizer:
+        def __init__(self, **kwargs):
+            seen.append((None, cosyvoice_module.dashscope.api_key))
+
+    original = (cosyvoice_module.SpeechSynthesizer, cosyvoice_module._SYNTHESIZER_ACCEPTS_API_KEY,
+                cosyvoice_module.dashscope.api_key)
+    cosyvoice_module.dashscope.api_key = "global"
+    try:
+        for cls in (KeyedSynthesizer, LegacySynthesizer):
+            cosyvoice_module.SpeechSynthesizer = cls
+            cosyvoice_module._SYNTHESIZER_ACCEPTS_API_KEY = cosyvoice_module._accepts_api_key(cls)
+            cosyvoice_module._create_synthesizer("key", model="m")
+        assert seen == [("key", "global"), (None, "key")]
+        assert cosyvoice_module.dashscope.api_key == "global"
+    finally:
+        (cosyvoice_module.SpeechSynthesizer, cosyvoice_module._SYNTHESIZER_ACCEPTS_API_KEY,
+         cosyvoice_module.dashscope.api_key) = original
+
+
+if __name__ == "__main__":
+    test_release_returns_reusable_synthesizer()
+    test_release_closes_abandoned_synthesizer()
+    test_close_waits_for_running_tasks()
+    test_services_release_shared_pools()
+    test_scoped_api_key_restores_global()
+    test_create_synthesizer_prefers_per_object_key()
+    print("✓ CosyVoice 合成器池测试通过")
@@ -0,0 +1,120 @@
+# anki_gpt_addon/tests/test_dashscope_batch.py
+"""
+DashScopeLLMService 批量分析的单元测试
+检查批量响应的拆分、缺失句子回退为逐句调用，以及批量结果的缓存变体（不访问网络）
+"""
+import logging
+import sys
+import tempfile
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from anki_gpt20.llm.cache import AnalysisCache
+from anki_gpt20.llm.providers.dashscope import BATCH_PROMPT_VARIANT, DashScopeLLMService
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+split = DashScopeLLMService._split_batch_response
+
+
+def _block(index: int, sentence: str, reading: bool = True) -> str:
+    body = f"===== [{index}] =====\n**中文翻译：**\n{sentence} 的翻译\n"
+    if reading:
+        body += f"**句子读法：**\n- {sentence}\n- romaji\n"
+    return body
+
+
+def test_well_formed_response():
+    content = "".join(_block(i, f"文{i}") for i in range(1, 4))
+    analyses = split(content, 3)
+    assert len(analyses) == 3
+    for i, analysis in enumerate(analyses, 1):
+        assert analysis.startswith("**中文翻译：**")
+        assert f"- 文{i}" in analysis and "=====" not in analysis
+
+
+def test_delimiter_variants():
+    """全角括号和不带括号的分隔行同样可以识别"""
+    content = "=====【1】=====\n**句子读法：**\n- あ\n===== 2 =====\n**句子读法：**\n- い\n"
+    assert split(content, 2) == ["**句子读法：**\n- あ", "**句子读法：**\n- い"]
+
+
+def test_missing_and_out_of_range_blocks():
+    content = _block(1, "文1") + _block(3, "文3") + _block(7, "文7")
+    analyses = split(content, 3)
+    assert analyses[1] is None
+    assert "文1" in analyses[0] and "文3" in analyses[2]
+
+
+def test_duplicated_block_keeps_first():
+    content = _block(1, "最初") + _block(2, "文2") + _block(1, "重复")
+    analyses = split(content, 2)
+    assert "最初" in analyses[0] and "重复" not in analyses[0]
+    assert "文2" in analyses[1]
+
+
+def test_block_without_reading_is_rejected():
+    """缺少句子读法的块视为截断的输出"""
+    content = _block(1, "文1", reading=False) + _block(2, "文2")
+    analyses = split(content, 2)
+    assert analyses[0] is None and "文2" in analyses[1]
+
+
+def test_empty_or_unstructured_response():
+    assert split(None, 2) == [None, None]
+    assert split("", 2) == [None, None]
+    assert split("**句子读法：**\n- 没有分隔符", 1) == [None]
+
+
+def test_batch_falls_back_for_missing_sentences():
+    """拆分失败的句子改为逐句调用，其余句子直接使用批量结果"""
+    service = DashScopeLLMService(api_key="test")
+    service._call_batch = lambda sentences: _block(1, sentences[0]) + _block(3, sentences[2], reading=False)
+    single_calls = []
+
+    def generate_analysis(sentence, is_asr_text=False):
+        single_calls.append(sentence)
+        return f"single {sentence}"
+
+    service.generate_analysis = generate_analysis
+    results = service.generate_batch_analysis(["文1", "文2", "文3"])
+    assert single_calls == ["文2", "文3"]
+    assert "- 文1" in results[0]
+    assert results[1:] == ["single 文2", "single 文3"]
+
+
+def test_batch_results_cached_separately():
+    """批量结果缓存在单独的变体下，单句分析不会命中；批量分析可以复用单句结果"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = AnalysisCache(cache_dir, max_bytes=1024 * 1024)
+        cache.put("qwen-plus", "normal", "文0", "single 文0")
+        service = DashScopeLLMService(api_key="test", model="qwen-plus", cache=cache)
+        batches = []
+
+        def call_batch(sentences):
+            batches.append(sentences)
+            return "".join(_block(i + 1, sentence) for i, sentence in enumerate(sentences))
+
+        service._call_batch = call_batch
+        results = service.generate_batch_analysis(["文0", "文1", "文2"])
+        assert batches == [["文1", "文2"]] and results[0] == "single 文0"
+        assert cache.get("qwen-plus", BATCH_PROMPT_VARIANT, "文1") == results[1]
+        assert cache.get("qwen-plus", "normal", "文1") is None
+
+        # 再次批量分析时全部命中缓存
+        assert service.generate_batch_analysis(["文0", "文1", "文2"]) == results and len(batches) == 1
+
+
+if __name__ == "__main__":
+    test_well_formed_response()
+    test_delimiter_variants()
+    test_missing_and_out_of_range_blocks()
+    test_duplicated_block_keeps_first()
+    test_block_without_reading_is_rejected()
+    test_empty_or_unstructured_response()
+    test_batch_falls_back_for_missing_sentences()
+    test_batch_results_cached_separately()
+    print("✓ 批量响应拆分测试通过")
@@ -0,0 +1,212 @@
+# anki_gpt_addon/tests/test_deck_maintenance.py
+"""
+deck_maintenance 模块的单元测试
+使用模拟的集合检查回填候选笔记的扫描、时间戳写回，以及失败记录在音频变化后重新尝试
+"""
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+import anki_gpt20.dialog.deck_maintenance as maintenance_module
+from anki_gpt20.dialog.deck_maintenance import DeckMaintenanceHandler
+from anki_gpt20.llm.timestamp_codec import decode_timestamps
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+CARD_TYPE = "问答题（附翻转卡片）"
+MODEL_ID = 1
+NO_TIMESTAMPS_MODEL_ID = 2
+
+
+# --- 模拟对象定义 ---
+class MockMedia:
+    """模拟 Anki 媒体对象"""
+    def __init__(self, media_dir: str):
+        self._media_dir = media_dir
+
+    def dir(self) -> str:
+        return self._media_dir
+
+
+class MockModels:
+    """模拟 Anki 模型集合，按 ID 返回笔记类型"""
+    def __init__(self):
+        self._models = {
+            MODEL_ID: {"name": CARD_TYPE, "flds": [{"name": f, "ord": i} for i, f in
+                                                   enumerate(["正面", "背面", "Audio", "Timestamps"])]},
+            NO_TIMESTAMPS_MODEL_ID: {"name": CARD_TYPE, "flds": [{"name": f, "ord": i} for i, f in
+                                                                 enumerate(["正面", "背面", "Audio"])]},
+        }
+
+    def get(self, mid: int) -> dict | None:
+        return self._models.get(mid)
+
+
+class MockNote:
+    """模拟 Anki 笔记对象，字段直接读写集合中的 flds"""
+    def __init__(self, col: "MockCol", nid: int):
+        self.id = nid
+        self._col = col
+        mid, _ = col.notes[nid]
+        self._names = [f["name"] for f in col.models.get(mid)["flds"]]
+
+    def keys(self):
+        return self._names
+
+    def __getitem__(self, key: str) -> str:
+        return self._col.notes[self.id][1][self._names.index(key)]
+
+    def __setitem__(self, key: str, value: str):
+        self._pending = (self._names.index(key), value)
+
+
+class MockDB:
+    """模拟 col.db，只支持按 ID 查询 notes 表"""
+    def __init__(self, col: "MockCol"):
+        self._col = col
+
+    def all(self, sql: str) -> list:
+        ids = [int(nid) for nid in re.findall(r'\d+', sql[sql.index(" in "):])]
+        return [(nid, self._col.notes[nid][0], "\x1f".join(self._col.notes[nid][1]))
+                for nid in ids if nid in self._col.notes]
+
+
+class MockCol:
+    """模拟 Anki 集合对象"""
+    def __init__(self, media_dir: str):
+        self.media = MockMedia(media_dir)
+        self.models = MockModels()
+        self.db = MockDB(self)
+        self.notes: dict[int, tuple[int, list[str]]] = {}  # {nid: (mid, fields)}
+        self.updated: list[int] = []
+
+    def add(self, nid: int, front: str, audio: str, timestamps: str = "", mid: int = MODEL_ID) -> None:
+        fields = [front, "背面", audio, timestamps] if mid == MODEL_ID else [front, "背面", audio]
+        self.notes[nid] = (mid, fields)
+
+    def find_notes(self, query: str) -> list[int]:
+        return list(self.notes)
+
+    def get_note(self, nid: int) -> MockNote:
+        if nid not in self.notes:
+            raise KeyError(nid)
+        return MockNote(self, nid)
+
+    def update_notes(self, notes: list) -> None:
+        for note in notes:
+            index, value = note._pending
+            self.notes[note.id][1][index] = value
+            self.updated.append(note.id)
+
+
+class MockTaskManager:
+    """模拟 mw.taskman，主线程任务立即执行"""
+    def run_on_main(self, func) -> None:
+        func()
+
+
+class MockWebview:
+    def eval(self, script: str) -> None:
+        pass
+
+
+def _setup(temp_dir: str) -> tuple[MockCol, DeckMaintenanceHandler]:
+    media_dir = os.path.join(temp_dir, "media")
+    os.makedirs(media_dir)
+    col = MockCol(media_dir)
+    maintenance_module.mw = type('MockMW', (), {'col': col, 'taskman': MockTaskManager()})()
+    maintenance_module.BACKFILL_STATE_PATH = os.path.join(temp_dir, "user_files", "deck_maintenance.json")
+    return col, DeckMaintenanceHandler({}, MockWebview(), None)
+
+
+def _write_media(col: MockCol, name: str) -> str:
+    path = os.path.join(col.media.dir(), name)
+    with open(path, "wb") as f:
+        f.write(b"audio")
+    return path
+
+
+# --- 测试函数 ---
+def test_find_candidates():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        col, handler = _setup(temp_dir)
+        a = _write_media(col, "a.mp3")
+        _write_media(col, "b.mp3")
+        col.add(1, "候选", "[sound:a.mp3]")
+        col.add(2, "已有时间戳", "[sound:a.mp3]", timestamps="ts1:AA")
+        col.add(3, "音频文件不存在", "[sound:missing.mp3]")
+        col.add(4, "没有音频", "")
+        col.add(5, "", "[sound:a.mp3]")
+        col.add(6, "没有 Timestamps 字段", "[sound:a.mp3]", mid=NO_TIMESTAMPS_MODEL_ID)
+        col.add(7, "失败过且音频未变", "[sound:b.mp3]")
+        col.add(8, "失败过但音频已替换", "[sound:a.mp3]")
+
+        skipped = {7: handler._audio_signature(os.path.join(col.media.dir(), "b.mp3")), 8: ("old.mp3", 1)}
+        candidates = handler._find_candidates("deck", skipped)
+        assert candidates == [(1, "候选", a), (8, "失败过但音频已替换", a)]
+
+
+def test_apply_updates():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        col, _ = _setup(temp_dir)
+        col.add(1, "あい", "[sound:a.mp3]")
+        col.add(2, "既存", "[sound:a.mp3]", timestamps="ts1:AA")
+        timestamps = [{"text": "あ", "begin_time": 0, "end_time": 100},
+                      {"text": "い", "begin_time": 100, "end_time": 200}]
+        written = DeckMaintenanceHandler._apply_updates([(1, timestamps), (2, timestamps), (99, timestamps)])
+        assert written == 1 and col.updated == [1]
+        assert decode_timestamps(col.notes[1][1][3]) == timestamps
+        assert col.notes[2][1][3] == "ts1:AA"
+        assert DeckMaintenanceHandler._apply_updates([(99, timestamps)]) == 0
+
+
+def test_failed_notes_retried_after_audio_changes():
+    """估算失败的笔记在音频未变化时跳过，音频修改后或旧格式的记录会重新尝试"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        col, handler = _setup(temp_dir)
+        _write_media(col, "ok.mp3")
+        bad = _write_media(col, "bad.mp3")
+        col.add(1, "あ", "[sound:ok.mp3]")
+        col.add(2, "い", "[sound:bad.mp3]")
+        token = type('MockToken', (), {'cancelled': False})()
+
+        original_estimate = maintenance_module.estimate_timestamps_bulk
+        maintenance_module.estimate_timestamps_bulk = lambda items, ssml_config, logger: [
+            None if path == bad else [{"text": text, "begin_time": 0, "end_time": 100}] for text, path in items]
+        try:
+            stats = handler._backfill("deck", token)
+            assert (stats["total"], stats["updated"], stats["failed"]) == (2, 1, 1)
+            with open(maintenance_module.BACKFILL_STATE_PATH, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            assert state["deck"]["failed"] == {"2": ["bad.mp3", os.stat(bad).st_mtime_ns]}
+
+            assert handler._backfill("deck", token)["total"] == 0
+
+            mtime_ns = os.stat(bad).st_mtime_ns + 10 ** 9
+            os.utime(bad, ns=(mtime_ns, mtime_ns))
+            stats = handler._backfill("deck", token)
+            assert (stats["total"], stats["failed"]) == (1, 1)
+            assert handler._load_failed("deck") == {2: ("bad.mp3", mtime_ns)}
+
+            # 旧版本记录的纯 ID 列表不含音频信息，重新尝试一次
+            with open(maintenance_module.BACKFILL_STATE_PATH, "w", encoding="utf-8") as f:
+                json.dump({"deck": {"failed": [2]}}, f)
+            assert handler._backfill("deck", token)["total"] == 1
+            assert handler._backfill("deck", token)["total"] == 0
+        finally:
+            maintenance_module.estimate_timestamps_bulk = original_estimate
+
+
+if __name__ == "__main__":
+    test_find_candidates()
+    test_apply_updates()
+    test_failed_notes_retried_after_audio_changes()
+    print("✓ deck_maintenance 测试通过")
@@ -0,0 +1,145 @@
+# anki_gpt_addon/tests/test_dispatcher.py
+"""
+CommandDispatcher 的单元测试
+后台任务由模拟的 taskman 手动执行，检查命令路由、取代、取消后丢弃过期回调，以及批量生成任务可以被 cancel_all 取消
+"""
+import logging
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+
+class MockFuture:
+    def __init__(self, value):
+        self._value = value
+
+    def result(self):
+        return self._value
+
+
+class MockTaskManager:
+    """模拟 mw.taskman：记录后台任务，由测试决定执行顺序"""
+
+    def __init__(self):
+        self.tasks = []
+
+    def run_in_background(self, task, on_done):
+        self.tasks.append((task, on_done))
+
+    def run(self, index: int) -> None:
+        task, on_done = self.tasks[index]
+        on_done(MockFuture(task()))
+
+
+def _make_dispatcher():
+    import anki_gpt20.dialog.dispatcher as dispatcher_module
+    taskman = MockTaskManager()
+    dispatcher_module.mw = type('MockMW', (), {'taskman': taskman})()
+    return dispatcher_module.CommandDispatcher(), taskman
+
+
+def test_dispatch_routes_commands():
+    dispatcher, _ = _make_dispatcher()
+    calls = []
+    dispatcher.register("spread", lambda a, b: calls.append(("spread", a, b)))
+    dispatcher.register("whole", lambda args: calls.append(("whole", args)), spread_args=False)
+    dispatcher.dispatch('spread::[1, "x"]')
+    dispatcher.dispatch('whole::[1, 2]')
+    dispatcher.dispatch('unknown::[]')
+    dispatcher.dispatch('spread::not json')
+    assert calls == [("spread", 1, "x"), ("whole", [1, 2])]
+
+
+def test_superseded_request_drops_on_done():
+    dispatcher, taskman = _make_dispatcher()
+    done = []
+    tokens = []
+
+    def task(name):
+        def run(token):
+            tokens.append(token)
+            return name
+        return run
+
+    first = dispatcher.run_in_background("preview", task("first"), lambda f: done.append(f.result()))
+    second = dispatcher.run_in_background("preview", task("second"), lambda f: done.append(f.result()))
+    assert second > first
+    # 旧请求晚于新请求完成，其结果被丢弃
+    taskman.run(1)
+    taskman.run(0)
+    assert done == ["second"]
+    assert tokens[0].cancelled is False and tokens[1].cancelled is True  # tokens 按执行顺序记录
+
+    # 不同 key 和 supersede=False 的任务不会被取代
+    dispatcher.run_in_background("asr", task("asr"), lambda f: done.append(f.result()))
+    dispatcher.run_in_background("batch", task("batch"), lambda f: done.append(f.result()), supersede=False)
+    dispatcher.run_in_background("batch", task("batch2"), lambda f: done.append(f.result()), supersede=False)
+    taskman.run(2)
+    taskman.run(3)
+    taskman.run(4)
+    assert done == ["second", "asr", "batch", "batch2"]
+
+
+def test_cancel_and_cancel_all():
+    dispatcher, taskman = _make_dispatcher()
+    done = []
+    dispatcher.run_in_background("preview", lambda token: token, lambda f: done.append("preview"))
+    dispatcher.run_in_background("asr", lambda token: token, lambda f: done.append("asr"))
+    dispatcher.run_in_background("backfill", lambda token: token, lambda f: done.append("backfill"))
+    dispatcher.cancel("preview")
+    dispatcher.cancel("missing")
+    taskman.run(0)
+    assert done == []
+    dispatcher.cancel_all()
+    taskman.run(1)
+    taskman.run(2)
+    assert done == []
+
+
+def test_begin_and_follow_up_stage():
+    """begin 登记的请求可以被新请求取代，后续阶段沿用同一个取消标记"""
+    dispatcher, taskman = _make_dispatcher()
+    done = []
+    token = dispatcher.begin("asr")
+    dispatcher.run_in_background("asr", lambda t: t is token, lambda f: done.append(f.result()), token=token)
+    taskman.run(0)
+    assert done == [True]
+
+    stale = dispatcher.begin("asr")
+    newer = dispatcher.begin("asr")
+    assert stale.cancelled and not newer.cancelled
+    dispatcher.finish("asr", stale)  # 过期的请求不会移除新请求
+    dispatcher.cancel("asr")
+    assert newer.cancelled
+
+
+def test_batch_generation_cancelled_by_cancel_all():
+    """批量任务各自使用独立的 key，互不取代，但对话框关闭时都会被取消"""
+    import anki_gpt20.dialog.generator_handler as generator_module
+    dispatcher, taskman = _make_dispatcher()
+    webview = type('MockWebview', (), {'eval': lambda self, script: None})()
+    handler = generator_module.GeneratorHandler({"dashscope_api_key": "key"}, webview, dispatcher)
+    tokens = []
+    handler._batch_generate = lambda *args: tokens.append(args[-1])
+    handler.split_and_generate_cards("一つ目。二つ目。", "问答题", "deck", False)
+    handler.split_and_generate_cards("三つ目。", "问答题", "deck", False)
+    for index in range(2):
+        task, _ = taskman.tasks[index]
+        task()
+    assert len(tokens) == 2 and not any(token.cancelled for token in tokens)
+    dispatcher.cancel_all()
+    assert all(token.cancelled for token in tokens)
+
+
+if __name__ == "__main__":
+    test_dispatch_routes_commands()
+    test_superseded_request_drops_on_done()
+    test_cancel_and_cancel_all()
+    test_begin_and_follow_up_stage()
+    test_batch_generation_cancelled_by_cancel_all()
+    print("✓ dispatcher 测试通过")
@@ -0,0 +1,178 @@
+# anki_gpt_addon/tests/test_pipeline.py
+"""
+CardPipeline 分阶段流水线的单元测试
+使用假的卡片生成器，检查输出顺序、在途条目上限、单个条目失败的隔离，以及提前退出和取消时不会卡住
+"""
+import logging
+import queue
+import random
+import sys
+import threading
+import time
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from anki_gpt20.llm.pipeline import CardPipeline
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+
+class FakeCardGenerator:
+    """模拟 AnkiCardGenerator：各阶段随机耗时，使条目乱序完成"""
+
+    def __init__(self, fail_llm=(), fail_tts=()):
+        self.fail_llm = set(fail_llm)
+        self.fail_tts = set(fail_tts)
+        self.lock = threading.Lock()
+        self.started = 0
+        self.released = 0
+        self.max_outstanding = 0
+
+    def item_started(self) -> None:
+        with self.lock:
+            self.started += 1
+            self.max_outstanding = max(self.max_outstanding, self.started - self.released)
+
+    def item_released(self) -> None:
+        with self.lock:
+            self.released += 1
+
+    def generate_analyses(self, sentences):
+        for _ in sentences:
+            self.item_started()
+        time.sleep(random.uniform(0, 0.005))
+        if self.fail_llm.intersection(sentences):
+            raise RuntimeError("llm failed")
+        return [(f"<b>{s}</b>", f"**句子读法：** {s}") for s in sentences]
+
+    def extract_kana(self, back_content_md, sentence):
+        return f"kana-{sentence}"
+
+    def synthesize(self, kana_text, output_dir):
+        time.sleep(random.uniform(0, 0.005))
+        if kana_text.removeprefix("kana-") in self.fail_tts:
+            raise RuntimeError("tts failed")
+        return f"{output_dir}/{kana_text}.mp3", [{"text": kana_text, "begin_time": 0, "end_time": 100}]
+
+
+def _run(generator, sentences, release_delay=0.0, **options):
+    """运行流水线；release_delay > 0 时在另一个线程中延迟调用 done，模拟繁忙的主线程"""
+    pipeline = CardPipeline(generator, "/tmp/audio", **options)
+    results = []
+    releases: queue.Queue = queue.Queue()
+
+    def releaser():
+        while True:
+            done = releases.get()
+            if done is None:
+                return
+            time.sleep(release_delay)
+            generator.item_released()
+            done()
+
+    thread = threading.Thread(target=releaser, daemon=True)
+    thread.start()
+
+    def sink(item, done):
+        results.append(item)
+        releases.put(done)
+
+    pipeline.run(sentences, sink)
+    releases.put(None)
+    thread.join()
+    return pipeline, results
+
+
+def test_output_order():
+    """乱序完成的条目按原始句子顺序交给 sink"""
+    sentences = [f"s{i}" for i in range(60)]
+    _, results = _run(FakeCardGenerator(), sentences, llm_workers=4, tts_workers=3, queue_size=2)
+    assert [item["index"] for item in results] == list(range(60))
+    assert [item["sentence"] for item in results] == sentences
+    assert all(item["timestamps"] for item in results)
+
+
+def test_in_flight_bound():
+    """sink 迟迟不调用 done 时，在途条目数不超过 max_in_flight"""
+    generator = FakeCardGenerator()
+    pipeline, results = _run(generator, [f"s{i}" for i in range(80)], release_delay=0.002,
+                             llm_workers=2, tts_workers=1, queue_size=1, sink_capacity=3)
+    assert len(results) == 80
+    assert 0 < generator.max_outstanding <= pipeline.max_in_flight, \
+        (generator.max_outstanding, pipeline.max_in_flight)
+
+
+def test_failure_isolation():
+    """单个条目在某个阶段失败时只标记该条目，其他条目正常完成"""
+    sentences = [f"s{i}" for i in range(12)]
+    generator = FakeCardGenerator(fail_llm={"s3"}, fail_tts={"s7"})
+    _, results = _run(generator, sentences, llm_workers=3, tts_workers=2, queue_size=2)
+    failed = {item["sentence"]: item["error"] for item in results if item.get("error")}
+    assert failed == {"s3": "llm failed", "s7": "tts failed"}
+    # LLM 阶段失败的条目不再进入后续阶段
+    assert "kana_text" not in results[3]
+    ok = [item for item in results if not item.get("error")]
+    assert len(ok) == 10 and all(item["audio_path"].endswith(".mp3") for item in ok)
+
+
+def test_sink_exception_releases_slot():
+    """sink 抛出异常时流水线释放名额，不会卡住"""
+    pipeline = CardPipeline(FakeCardGenerator(), "/tmp/audio", llm_workers=1, tts_workers=1, queue_size=1)
+    seen = []
+
+    def sink(item, done):
+        seen.append(item["index"])
+        raise ValueError("sink failed")
+
+    pipeline.run([f"s{i}" for i in range(pipeline.max_in_flight * 3)], sink)
+    assert seen == list(range(pipeline.max_in_flight * 3))
+
+
+def test_early_exit_does_not_hang():
+    """重排循环异常退出时（sink 未释放名额），投料线程不会永远阻塞在等待名额上"""
+    pipeline = CardPipeline(FakeCardGenerator(), "/tmp/audio", llm_workers=1, tts_workers=1, queue_size=1)
+
+    def sink(item, done):
+        raise KeyboardInterrupt
+
+    started = time.monotonic()
+    try:
+        pipeline.run([f"s{i}" for i in range(pipeline.max_in_flight * 3)], sink)
+        raise AssertionError("KeyboardInterrupt 未传播")
+    except KeyboardInterrupt:
+        pass
+    assert time.monotonic() - started < 5
+    assert not any(thread.is_alive() for stage in pipeline.stages for thread in stage._threads)
+
+
+def test_cancellation_stops_feeding():
+    """取消后停止投料，剩余条目不再交给 sink"""
+    generator = FakeCardGenerator()
+    pipeline = CardPipeline(generator, "/tmp/audio", llm_workers=1, tts_workers=1, queue_size=1)
+    cancelled = threading.Event()
+    seen = []
+
+    def sink(item, done):
+        seen.append(item["index"])
+        if len(seen) == 3:
+            cancelled.set()
+        done()
+
+    total = pipeline.max_in_flight * 10
+    assert not pipeline.run([f"s{i}" for i in range(total)], sink, is_cancelled=cancelled.is_set)
+    assert seen == [0, 1, 2]
+    assert generator.started < total
+    assert pipeline.run([f"s{i}" for i in range(5)], lambda item, done: done())
+
+
+if __name__ == "__main__":
+    test_output_order()
+    test_in_flight_bound()
+    test_failure_isolation()
+    test_sink_exception_releases_slot()
+    test_early_exit_does_not_hang()
+    test_cancellation_stops_feeding()
+    print("✓ pipeline 测试通过")
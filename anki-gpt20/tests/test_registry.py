@@ -0,0 +1,53 @@
+# anki_gpt_addon/tests/test_registry.py
+"""
+ServiceRegistry 的单元测试
+卡片生成器的创建被替换为本地对象，检查配置未变化时复用实例、变化时关闭旧实例
+"""
+import logging
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+import anki_gpt20.llm as llm_module
+from anki_gpt20.llm.registry import ServiceRegistry
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+
+class MockGenerator:
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+        self.closed = 0
+
+    def close(self):
+        self.closed += 1
+
+
+def test_rebuild_closes_previous_generator():
+    original = llm_module.create_card_generator
+    llm_module.create_card_generator = lambda api_key, config: MockGenerator(api_key)
+    try:
+        registry = ServiceRegistry()
+        config = {"tts_provider": "cosyvoice"}
+        first = registry.get_card_generator("key", config)
+        assert registry.get_card_generator("key", {**config, "deck_name": "other"}) is first
+
+        second = registry.get_card_generator("new-key", config)
+        assert second is not first and first.closed == 1
+
+        registry.refresh("new-key", {"tts_provider": "qwen"})
+        assert second.closed == 1
+        registry.refresh("new-key", {"tts_provider": "qwen"})  # 已经丢弃的实例不会重复关闭
+        assert second.closed == 1
+        third = registry.get_card_generator("new-key", {"tts_provider": "qwen"})
+        assert third is not second and third.closed == 0
+    finally:
+        llm_module.create_card_generator = original
+
+
+if __name__ == "__main__":
+    test_rebuild_closes_previous_generator()
+    print("✓ ServiceRegistry 测试通过")
@@ -0,0 +1,121 @@
+# anki_gpt_addon/tests/test_timestamp_codec.py
+"""
+timestamp_codec 模块的单元测试
+检查紧凑格式的往返编码、回退到 JSON 的情况、旧格式兼容和无效输入，
+并用固定的 ts1: 向量同时校验 Python 和前端（webview_interactive_player.js）的解码
+"""
+import base64
+import json
+import logging
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from anki_gpt20.llm.timestamp_codec import decode_timestamps, encode_timestamps, is_compact_timestamps
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+# 固定向量：多字符文本、非 BMP 字符、空文本、负的开始时间增量（240 - 250）和较大的间隔
+VECTOR_TIMESTAMPS = [
+    {"text": "今日", "begin_time": 0, "end_time": 250},
+    {"text": "😀", "begin_time": 240, "end_time": 400},
+    {"text": "", "begin_time": 400, "end_time": 400},
+    {"text": "は。", "begin_time": 1000, "end_time": 1300},
+]
+VECTOR = "ts1:BAIBAAIAEwCwCfQDwAIA2ATku4rml6Xwn5iA44Gv44CC"
+
+PLAYER_JS = Path(__file__).parent.parent / "webview" / "webview_interactive_player.js"
+
+
+def test_fixed_vector():
+    assert encode_timestamps(VECTOR_TIMESTAMPS) == VECTOR
+    assert decode_timestamps(VECTOR) == VECTOR_TIMESTAMPS
+
+
+def test_round_trip():
+    timestamps = [
+        {"text": "𠮷", "begin_time": 5, "end_time": 80},
+        {"text": "野家", "begin_time": 60, "end_time": 200},  # 与上一条重叠
+        {"text": "\n", "begin_time": 200, "end_time": 200},
+        {"text": "word", "begin_time": 3_600_000, "end_time": 3_600_500},
+        {"text": "x", "begin_time": 10, "end_time": 0},  # 负时长
+    ]
+    encoded = encode_timestamps(timestamps)
+    assert is_compact_timestamps(encoded)
+    assert decode_timestamps(encoded) == timestamps
+    assert len(encoded) < len(json.dumps(timestamps))
+
+
+def test_float_times_are_rounded():
+    encoded = encode_timestamps([{"text": "a", "begin_time": 1.4, "end_time": 2.6}])
+    assert decode_timestamps(encoded) == [{"text": "a", "begin_time": 1, "end_time": 3}]
+
+
+def test_json_fallback():
+    """包含额外键、缺少时间或文本不是字符串的条目保持 JSON 格式"""
+    for timestamps in (
+        [{"text": "a", "begin_time": 0, "end_time": 10, "speaker": 1}],
+        [{"text": "a", "begin_time": 0}],
+        [{"text": "a", "begin_time": None, "end_time": 10}],
+        [{"text": "a", "begin_time": True, "end_time": 10}],
+        [{"text": 1, "begin_time": 0, "end_time": 10}],
+    ):
+        encoded = encode_timestamps(timestamps)
+        assert not is_compact_timestamps(encoded)
+        assert decode_timestamps(encoded) == timestamps
+    assert encode_timestamps([]) == "" and encode_timestamps(None) == ""
+
+
+def test_legacy_json_input():
+    legacy = [{"text": "あ", "begin_time": 0, "end_time": 120}, {"text": "。", "begin_time": 120, "end_time": 120}]
+    assert decode_timestamps(json.dumps(legacy)) == legacy
+    assert decode_timestamps(json.dumps(legacy, ensure_ascii=False)) == legacy
+    assert decode_timestamps('{"text": "a"}') is None
+    assert decode_timestamps("[broken") is None
+    assert decode_timestamps("") is None and decode_timestamps("  ") is None and decode_timestamps(None) is None
+
+
+def test_invalid_compact_input():
+    assert decode_timestamps("ts1:@@@@") is None  # 非 base64
+    assert decode_timestamps("ts1:BAIBAA") is None  # 长度不是 4 的倍数
+    assert decode_timestamps(VECTOR[:-8]) is None  # 截断的文本
+    assert decode_timestamps("ts1:BAIB") is None  # 截断的整数列
+    assert decode_timestamps("ts1:") is None  # 没有条目数
+    # 文本长度与记录的长度不一致
+    payload = bytes([1, 2, 0, 2]) + "abc".encode("utf-8")  # 记录 2 个字符，实际 3 个
+    assert decode_timestamps("ts1:" + base64.b64encode(payload).decode("ascii")) is None
+
+
+def test_js_decoder_matches_vector():
+    """用 node 运行前端的 decodeTimestamps，结果应与 Python 一致（没有 node 时跳过）"""
+    node = shutil.which("node")
+    if not node:
+        return
+    source = PLAYER_JS.read_text(encoding="utf-8")
+    start = source.index("const COMPACT_TIMESTAMPS_PREFIX")
+    end = source.index("\n}\n", source.index("function decodeTimestamps")) + 3
+    script = source[start:end] + (
+        "\nconst values = JSON.parse(require('fs').readFileSync(0, 'utf8'));"
+        "\nprocess.stdout.write(JSON.stringify(values.map(decodeTimestamps)));"
+    )
+    values = [VECTOR, json.dumps(VECTOR_TIMESTAMPS), "ts1:@@@@", VECTOR[:-8]]
+    result = subprocess.run([node, "-e", script], input=json.dumps(values), capture_output=True,
+                            text=True, encoding="utf-8", timeout=30)
+    assert result.returncode == 0, result.stderr
+    assert json.loads(result.stdout) == [VECTOR_TIMESTAMPS, VECTOR_TIMESTAMPS, [], []]
+
+
+if __name__ == "__main__":
+    test_fixed_vector()
+    test_round_trip()
+    test_float_times_are_rounded()
+    test_json_fallback()
+    test_legacy_json_input()
+    test_invalid_compact_input()
+    test_js_decoder_matches_vector()
+    print("✓ 时间戳编码测试通过")
@@ -0,0 +1,201 @@
+# anki_gpt_addon/tests/test_transcription_manager.py
+"""
+TranscriptionManager 的单元测试
+Transcription.fetch 被替换为本地函数（不访问网络），检查调度顺序、退避间隔、超时、
+连续查询失败、取消后丢弃回调，以及调度线程空闲退出后重新启动
+"""
+import logging
+import sys
+import threading
+import time
+import types
+from contextlib import contextmanager
+from http import HTTPStatus
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from anki_gpt20.llm.providers import dashscope_asr as asr_module
+from anki_gpt20.llm.providers.dashscope_asr import TranscriptionManager, _TranscriptionJob
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+
+@contextmanager
+def _patched(fetch, **constants):
+    """临时替换 Transcription.fetch 和模块常量"""
+    originals = {name: getattr(asr_module, name) for name in constants}
+    original_transcription = asr_module.Transcription
+    asr_module.Transcription = type('MockTranscription', (), {'fetch': staticmethod(fetch)})
+    for name, value in constants.items():
+        setattr(asr_module, name, value)
+    try:
+        yield
+    finally:
+        asr_module.Transcription = original_transcription
+        for name, value in originals.items():
+            setattr(asr_module, name, value)
+
+
+def _response(task_status: str):
+    return types.SimpleNamespace(status_code=HTTPStatus.OK, output=types.SimpleNamespace(task_status=task_status))
+
+
+class ResultCollector:
+    """收集完成回调的结果，可以等待指定数量的回调"""
+
+    def __init__(self):
+        self.results = []
+        self._condition = threading.Condition()
+
+    def callback(self, name: str):
+        def on_complete(result):
+            with self._condition:
+                self.results.append((name, result))
+                self._condition.notify_all()
+        return on_complete
+
+    def wait(self, count: int, timeout: float = 5.0) -> bool:
+        with self._condition:
+            return self._condition.wait_for(lambda: len(self.results) >= count, timeout)
+
+
+def _job(task_id: str, on_complete=None, is_cancelled=None) -> _TranscriptionJob:
+    return _TranscriptionJob(task_id, "key", lambda response: {"success": True, "task": task_id},
+                             on_complete, is_cancelled)
+
+
+def test_jobs_polled_in_due_order():
+    """调度线程按下次查询时间查询任务，时间相同时按加入顺序"""
+    fetched = []
+
+    def fetch(task, api_key):
+        fetched.append(task)
+        return _response("SUCCEEDED")
+
+    with _patched(fetch, POLL_INITIAL_INTERVAL=0.08):
+        manager = TranscriptionManager()
+        collector = ResultCollector()
+        with manager._condition:
+            for task_id, delay in (("a", 0.06), ("b", 0.02), ("c", 0.04), ("c2", 0.04)):
+                manager._push(_job(task_id, collector.callback(task_id)), delay)
+        manager.track("d", "key", lambda response: {"success": True}, collector.callback("d"))
+        assert collector.wait(5)
+        assert fetched == ["b", "c", "c2", "a", "d"]
+        assert manager.pending_count == 0
+
+
+def test_backoff_is_capped():
+    manager = TranscriptionManager()
+    job = _job("a")
+    intervals = []
+    for _ in range(10):
+        intervals.append(job.interval)
+        manager._reschedule(job)
+    assert intervals[:4] == [0.5, 0.75, 1.125, 1.6875]
+    assert intervals[-3:] == [asr_module.POLL_MAX_INTERVAL] * 3
+    assert all(a <= b for a, b in zip(intervals, intervals[1:]))
+    assert manager.pending_count == 10
+
+
+def test_pending_task_rescheduled_until_finished():
+    statuses = iter(["PENDING", "RUNNING", "SUCCEEDED"])
+    with _patched(lambda task, api_key: _response(next(statuses))):
+        manager = TranscriptionManager()
+        collector = ResultCollector()
+        job = _job("a", collector.callback("a"))
+        manager._poll(job)
+        manager._poll(job)
+        assert manager.pending_count == 2 and not collector.results
+        manager._poll(job)
+        assert collector.wait(1)
+        assert collector.results == [("a", {"success": True, "task": "a"})] and job.polls == 3
+
+
+def test_deadline():
+    fetched = []
+    with _patched(lambda task, api_key: fetched.append(task)):
+        manager = TranscriptionManager()
+        collector = ResultCollector()
+        job = _job("a", collector.callback("a"))
+        job.deadline = time.monotonic() - 1
+        manager._poll(job)
+        assert collector.wait(1)
+        name, result = collector.results[0]
+        assert not result["success"] and str(asr_module.TRANSCRIPTION_TIMEOUT) in result["error"]
+        assert fetched == [] and manager.pending_count == 0
+
+
+def test_consecutive_fetch_errors():
+    """连续失败 MAX_FETCH_ERRORS 次后结束任务，期间一次成功的查询会重置计数"""
+    outcomes = iter([OSError("net")] * 4 + [_response("RUNNING")] + [OSError("net")] * 5)
+
+    def fetch(task, api_key):
+        outcome = next(outcomes)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    with _patched(fetch):
+        manager = TranscriptionManager()
+        collector = ResultCollector()
+        job = _job("a", collector.callback("a"))
+        for _ in range(5 + asr_module.MAX_FETCH_ERRORS - 1):
+            manager._poll(job)
+        assert job.errors == asr_module.MAX_FETCH_ERRORS - 1 and not collector.results
+        manager._poll(job)
+        assert collector.wait(1)
+        name, result = collector.results[0]
+        assert not result["success"] and "net" in result["error"]
+        assert manager.pending_count == 5 + asr_module.MAX_FETCH_ERRORS - 1  # 每次未结束的查询都重新排队一次
+
+
+def test_cancellation_drops_callbacks():
+    cancelled = threading.Event()
+    finalized = []
+    fetched = []
+
+    def fetch(task, api_key):
+        fetched.append(task)
+        cancelled.set()  # 查询返回后、生成结果之前被取消
+        return _response("SUCCEEDED")
+
+    with _patched(fetch):
+        manager = TranscriptionManager()
+        collector = ResultCollector()
+        job = _TranscriptionJob("a", "key", finalized.append, collector.callback("a"), cancelled.is_set)
+        manager._poll(job)
+        manager._poll(job)  # 已取消的任务不再查询，也不重新排队
+        manager._executor.shutdown(wait=True)
+        assert fetched == ["a"] and finalized == [] and collector.results == []
+        assert manager.pending_count == 0
+
+
+def test_idle_scheduler_exits_and_restarts():
+    with _patched(lambda task, api_key: _response("SUCCEEDED"), POLL_INITIAL_INTERVAL=0.01,
+                  SCHEDULER_IDLE_TIMEOUT=0.05):
+        manager = TranscriptionManager()
+        collector = ResultCollector()
+        manager.track("a", "key", lambda response: {"success": True}, collector.callback("a"))
+        first_thread = manager._thread
+        assert first_thread is not None and collector.wait(1)
+        first_thread.join(2)
+        assert not first_thread.is_alive() and manager._thread is None
+
+        manager.track("b", "key", lambda response: {"success": True}, collector.callback("b"))
+        assert manager._thread is not None and manager._thread is not first_thread
+        assert collector.wait(2)
+        assert [name for name, _ in collector.results] == ["a", "b"]
+
+
+if __name__ == "__main__":
+    test_jobs_polled_in_due_order()
+    test_backoff_is_capped()
+    test_pending_task_rescheduled_until_finished()
+    test_deadline()
+    test_consecutive_fetch_errors()
+    test_cancellation_drops_callbacks()
+    test_idle_scheduler_exits_and_restarts()
+    print("✓ TranscriptionManager 测试通过")
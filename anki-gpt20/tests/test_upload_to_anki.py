@@ -195,7 +195,64 @@ def test_upload_anki():
         upload_module.mw = original_mw
 
 
+def test_upload_anki_bulk():
+    """测试 upload_anki_bulk 函数（模拟集合没有 add_notes，走逐条添加的回退路径）"""
+    mock_mw = type('MockMW', (), {
+        'col': MockCol()
+    })()
+
+    import anki_gpt20.upload_to_anki as upload_module
+    original_mw = upload_module.mw
+    upload_module.mw = mock_mw
+
+    try:
+        cards = [
+            {"front": "テスト", "back": "試験"},
+            {"front": "勉強", "back": "学习", "timestamps": [{"char": "勉", "begin_time": 0, "end_time": 100}]},
+        ]
+        note_ids = upload_module.upload_anki_bulk(cards, card_type="Basic-b860c", deck_name="japanese-llm-cards")
+        assert len(note_ids) == 2 and all(note_ids), note_ids
+        assert len(mock_mw.col._notes) == 2
+        # 不支持的卡片类型时每张卡片都失败
+        assert upload_module.upload_anki_bulk(cards, card_type="Unknown") == [None, None]
+        print(f"✓ 模拟批量上传成功，笔记ID: {note_ids}")
+    finally:
+        upload_module.mw = original_mw
+
+
+def test_upload_anki_bulk_add_notes_error_not_retried():
+    """add_notes 写入时抛出的异常（包括 AttributeError）不会触发逐条添加，避免重复笔记"""
+    class FailingCol(MockCol):
+        def add_notes(self, requests) -> None:
+            self._notes.append(requests[0].note)  # 部分写入后失败
+            raise AttributeError("broken note")
+
+    class MockAddNoteRequest:
+        def __init__(self, note, deck_id):
+            self.note = note
+            self.deck_id = deck_id
+
+    import anki_gpt20.upload_to_anki as upload_module
+    original_mw, original_request_class = upload_module.mw, upload_module._add_note_request_class
+    try:
+        # 集合没有 add_notes 时选择逐条添加
+        upload_module.mw = type('MockMW', (), {'col': MockCol()})()
+        assert upload_module._add_note_request_class() is None
+
+        col = FailingCol()
+        upload_module.mw = type('MockMW', (), {'col': col})()
+        upload_module._add_note_request_class = lambda: MockAddNoteRequest
+        cards = [{"front": "テスト", "back": "試験"}, {"front": "勉強", "back": "学习"}]
+        assert upload_module.upload_anki_bulk(cards, card_type="Basic-b860c") == [None, None]
+        assert len(col._notes) == 1
+    finally:
+        upload_module.mw = original_mw
+        upload_module._add_note_request_class = original_request_class
+
+
 if __name__ == "__main__":
     print("--- 独立测试 upload_to_anki.py ---")
     test_upload_anki()
+    test_upload_anki_bulk()
+    test_upload_anki_bulk_add_notes_error_not_retried()
 
@@ -3,12 +3,12 @@
 Anki 卡片上传模块
 负责将生成的卡片内容上传到 Anki 集合中
 """
-import json
 import logging
 import os
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 from aqt import mw  # 导入 Anki 主窗口对象，用于访问集合 (collection)
-from .consts import SUPPORTED_CARD_TYPES
+from .consts import DEFAULT_FIELD_NAMES, SUPPORTED_CARD_TYPES
+from .llm.timestamp_codec import encode_timestamps
 
 logger = logging.getLogger(__name__)
 # --- 辅助函数：确保牌组存在 ---
@@ -49,13 +49,65 @@ def find_notes_by_field(query_field: str, query_value: str, model_name: str) ->
     except Exception as e:
         logger.error(f"Error finding notes by field '{query_field}' with value '{query_value}': {e}")
         return []
+# --- 辅助函数：准备笔记内容 ---
+def _add_audio_to_media(audio_file_path: Optional[str]) -> str:
+    """
+    将音频文件添加到 Anki 媒体集合，返回 [sound:...] 标记；没有音频或添加失败时返回空字符串。
+    """
+    if audio_file_path and os.path.exists(audio_file_path):
+        # mw.col.media.add_file(path) 会将文件复制到媒体文件夹并返回文件名
+        anki_media_filename = mw.col.media.add_file(audio_file_path)
+        if anki_media_filename:
+            logger.info(f"Audio file '{audio_file_path}' added to Anki media as '{anki_media_filename}'.")
+            return f"[sound:{anki_media_filename}]"
+        logger.warning(f"Failed to add audio file '{audio_file_path}' to Anki media.")
+    elif audio_file_path:
+        logger.warning(f"Audio file path provided but file does not exist: {audio_file_path}")
+    return ""
+
+
+def _build_fields(card_config: Dict[str, str], word_or_sentence: str, back_content: str, audio_html: str,
+                  timestamps: Optional[List[Dict[str, Any]]]) -> Dict[str, str]:
+    """根据卡片类型配置生成字段字典"""
+    front_field = card_config['front_field']
+    back_field = card_config['back_field']
+    audio_field = card_config['audio_field']
+
+    fields = {front_field: word_or_sentence}
+
+    # 根据卡片类型决定音频放置位置
+    if audio_field == back_field:
+        # Basic卡片：音频放在背面
+        fields[back_field] = f"{audio_html}<br>{back_content}"
+    else:
+        # 问答题类型：音频放在独立字段
+        fields[back_field] = back_content
+        fields[audio_field] = audio_html
+    if timestamps:
+        fields[DEFAULT_FIELD_NAMES['Timestamps']] = encode_timestamps(timestamps)
+    return fields
+
+
+def _new_note(model, deck_id: int, fields: Dict[str, str], card_type: str):
+    """创建笔记对象并填充字段（尚未加入集合）"""
+    note = mw.col.new_note(model)
+    note.did = deck_id  # 设置牌组 ID
+    for field_name, field_value in fields.items():
+        if field_name in note.keys():  # 检查字段是否存在于笔记模型中
+            note[field_name] = field_value
+        elif field_name != DEFAULT_FIELD_NAMES['Timestamps']:
+            logger.warning(f"Field '{field_name}' not found in note type '{card_type}'. Skipping.")
+    return note
+
+
 # --- 主上传函数 ---
 def upload_anki(
         word_or_sentence: str,
         back_content: str,
         card_type: str,
         audio_file_path: Optional[str] = None,
-        deck_name: str = "japanese-llm-cards"
+        deck_name: str = "japanese-llm-cards",
+        timestamps: Optional[List[Dict[str, Any]]] = None
 ) -> Optional[List[int]]:
     """
     将生成的卡片内容上传到 Anki。
@@ -65,6 +117,7 @@ def upload_anki(
         card_type (str): 卡片类型（笔记模型名称）。
         audio_file_path (str | None): 音频文件的绝对路径，如果存在。
         deck_name (str): 目标牌组名称。
+        timestamps (list | None): 音频时间戳，笔记类型包含 Timestamps 字段时在添加前写入。
     Returns:
         list[int] | None: 成功创建的笔记 ID 列表，如果失败则为 None。
     """
@@ -75,51 +128,20 @@ def upload_anki(
             logger.error(f"Failed to ensure deck '{deck_name}' exists.")
             return None
         # 2. 处理音频文件
-        audio_html = ""
-        if audio_file_path and os.path.exists(audio_file_path):
-            # 将音频文件添加到 Anki 媒体集合
-            # mw.col.media.add_file(path) 会将文件复制到媒体文件夹并返回文件名
-            anki_media_filename = mw.col.media.add_file(audio_file_path)
-            if anki_media_filename:
-                audio_html = f"[sound:{anki_media_filename}]"
-                logger.info(f"Audio file '{audio_file_path}' added to Anki media as '{anki_media_filename}'.")
-            else:
-                logger.warning(f"Failed to add audio file '{audio_file_path}' to Anki media.")
-        elif audio_file_path:
-            logger.warning(f"Audio file path provided but file does not exist: {audio_file_path}")
+        audio_html = _add_audio_to_media(audio_file_path)
         # 3. 准备笔记字段
         card_config = SUPPORTED_CARD_TYPES.get(card_type)
         if not card_config:
             logger.error(f"Unsupported card type: {card_type}. Supported types: {list(SUPPORTED_CARD_TYPES.keys())}")
             return None
-        
-        front_field = card_config['front_field']
-        back_field = card_config['back_field']
-        audio_field = card_config['audio_field']
-        
-        fields = {front_field: word_or_sentence}
-        
-        # 根据卡片类型决定音频放置位置
-        if audio_field == back_field:
-            # Basic卡片：音频放在背面
-            fields[back_field] = f"{audio_html}<br>{back_content}"
-        else:
-            # 问答题类型：音频放在独立字段
-            fields[back_field] = back_content
-            fields[audio_field] = audio_html
+        fields = _build_fields(card_config, word_or_sentence, back_content, audio_html, timestamps)
         # 4. 创建 Anki 笔记对象
         # 获取笔记模型
         model = mw.col.models.by_name(card_type)
         if not model:
             logger.error(f"Note type '{card_type}' not found.")
             return None
-        note = mw.col.new_note(model)
-        note.did = deck_id  # 设置牌组 ID
-        for field_name, field_value in fields.items():
-            if field_name in note.keys():  # 检查字段是否存在于笔记模型中
-                note[field_name] = field_value
-            else:
-                logger.warning(f"Field '{field_name}' not found in note type '{card_type}'. Skipping.")
+        note = _new_note(model, deck_id, fields, card_type)
         # 5. 添加笔记到集合
         mw.col.add_note(note, deck_id)  # 传入 note 和 deck_id
         mw.col.save()  # 保存集合以确保新笔记被保存
@@ -127,4 +149,80 @@ def upload_anki(
         return [note.id]  # 返回新笔记的 ID 列表
     except Exception as e:
         logger.error(f"Error uploading Anki card for '{word_or_sentence}': {e}", exc_info=True)
-        return None
\ No newline at end of file
+        return None
+
+
+def _add_note_request_class():
+    """
+    返回 anki.collection.AddNoteRequest；当前 Anki 版本不支持批量添加（add_notes）时返回 None
+    """
+    if not hasattr(mw.col, "add_notes"):
+        return None
+    try:
+        from anki.collection import AddNoteRequest
+    except ImportError:
+        return None
+    return AddNoteRequest
+
+
+def upload_anki_bulk(
+        cards: List[Dict[str, Any]],
+        card_type: str,
+        deck_name: str = "japanese-llm-cards"
+) -> List[Optional[int]]:
+    """
+    批量将卡片上传到 Anki。
+    牌组和笔记类型只解析一次，所有字段（包括 Timestamps）在添加前填好，
+    所有笔记通过一次 add_notes 操作加入集合，最后只保存一次。
+    Args:
+        cards (list[dict]): 卡片列表，每项包含 front、back，可选 audio_file_path、timestamps。
+        card_type (str): 卡片类型（笔记模型名称）。
+        deck_name (str): 目标牌组名称。
+    Returns:
+        list[int | None]: 与输入顺序一致的笔记 ID 列表，失败的卡片为 None。
+    """
+    note_ids: List[Optional[int]] = [None] * len(cards)
+    if not cards:
+        return note_ids
+    try:
+        deck_id = ensure_deck_exists(deck_name)
+        if deck_id is None:
+            logger.error(f"Failed to ensure deck '{deck_name}' exists.")
+            return note_ids
+        card_config = SUPPORTED_CARD_TYPES.get(card_type)
+        if not card_config:
+            logger.error(f"Unsupported card type: {card_type}. Supported types: {list(SUPPORTED_CARD_TYPES.keys())}")
+            return note_ids
+        model = mw.col.models.by_name(card_type)
+        if not model:
+            logger.error(f"Note type '{card_type}' not found.")
+            return note_ids
+
+        # 1. 准备所有笔记（单张卡片准备失败不影响其他卡片）
+        prepared = []  # [(输入位置, note)]
+        for i, card in enumerate(cards):
+            try:
+                audio_html = _add_audio_to_media(card.get("audio_file_path"))
+                fields = _build_fields(card_config, card["front"], card["back"], audio_html, card.get("timestamps"))
+                prepared.append((i, _new_note(model, deck_id, fields, card_type)))
+            except Exception as e:
+                logger.error(f"Error preparing Anki card for '{card.get('front')}': {e}", exc_info=True)
+        if not prepared:
+            return note_ids
+
+        # 2. 一次性加入集合；旧版 Anki 没有 add_notes 时逐条添加
+        # 写入前确定使用哪种方式，写入本身的异常交给外层处理，避免部分写入后再逐条添加造成重复
+        add_note_request = _add_note_request_class()
+        if add_note_request is not None:
+            mw.col.add_notes([add_note_request(note=note, deck_id=deck_id) for _i, note in prepared])
+        else:
+            for _i, note in prepared:
+                mw.col.add_note(note, deck_id)
+        mw.col.save()
+
+        for i, note in prepared:
+            note_ids[i] = note.id
+        logger.info(f"Successfully added {len(prepared)}/{len(cards)} notes to deck '{deck_name}' in one batch.")
+    except Exception as e:
+        logger.error(f"Error uploading {len(cards)} Anki cards in bulk: {e}", exc_info=True)
+    return note_ids
@@ -4,8 +4,10 @@
 包含跨模块使用的工具函数
 """
 import base64
+import logging
 import os
-from typing import Optional
+import urllib.parse
+from typing import Any, Dict, Optional
 
 
 def encode_audio_to_base64(audio_path: str, mime_type: str = "audio/mpeg") -> Optional[str]:
@@ -55,3 +57,56 @@ def get_audio_mime_type(audio_path: str) -> str:
     }
     return mime_types.get(ext, 'audio/mpeg')  # 默认为 MP3
 
+
+
+def get_media_server_url(audio_path: str) -> Optional[str]:
+    """
+    返回媒体目录中文件在 Anki 内置媒体服务器上的 URL
+
+    webview 通过该 URL 直接加载音频（支持 Range 请求），无需经 eval 传递 base64 数据。
+    URL 附带文件修改时间作为版本参数，重新合成的同名文件不会命中浏览器缓存。
+
+    Args:
+        audio_path: 音频文件路径
+
+    Returns:
+        URL 字符串；文件不在媒体目录中或媒体服务器不可用时返回 None
+    """
+    if not audio_path or not os.path.exists(audio_path):
+        return None
+    try:
+        from aqt import mw
+        media_dir = mw.col.media.dir()
+        if os.path.dirname(os.path.abspath(audio_path)) != os.path.abspath(media_dir):
+            return None
+        port = mw.mediaServer.getPort()
+        version = os.stat(audio_path).st_mtime_ns
+    except Exception as e:
+        logging.getLogger(__name__).warning(f"Media server URL unavailable for '{audio_path}': {e}")
+        return None
+    filename = urllib.parse.quote(os.path.basename(audio_path))
+    return f"http://127.0.0.1:{port}/{filename}?v={version}"
+
+
+def build_audio_payload(audio_path: Optional[str], use_media_url: bool = True) -> Dict[str, Any]:
+    """
+    生成传给 webview 的音频字段
+
+    优先使用媒体服务器 URL（audioMediaUrl），无法使用时回退为 base64 数据 URI（audioBase64）。
+
+    Args:
+        audio_path: 音频文件路径
+        use_media_url: 是否允许使用媒体服务器 URL
+
+    Returns:
+        包含 audioBase64、audioMediaUrl 的字典
+    """
+    payload = {"audioBase64": "", "audioMediaUrl": ""}
+    if not audio_path or not os.path.exists(audio_path):
+        return payload
+    media_url = get_media_server_url(audio_path) if use_media_url else None
+    if media_url:
+        payload["audioMediaUrl"] = media_url
+    else:
+        payload["audioBase64"] = encode_audio_to_base64(audio_path, get_audio_mime_type(audio_path)) or ""
+    return payload
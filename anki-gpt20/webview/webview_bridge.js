@@ -0,0 +1,63 @@
+// webview_bridge.js - 接收 Python 分块发送的大消息
+
+// 消息ID -> {handler, total, received, chunks, startedAt}
+const bridgeMessages = new Map();
+// 未收齐的消息超过该时间（毫秒）或数量时丢弃，避免分块丢失后一直占用内存
+const BRIDGE_MESSAGE_TIMEOUT_MS = 60000;
+const BRIDGE_MAX_PENDING_MESSAGES = 16;
+
+/**
+ * 丢弃过期的未完成消息；仍超出数量上限时丢弃最早开始的消息（Map 按插入顺序遍历）
+ * @param {number} now - 当前时间戳（毫秒）
+ */
+function dropStaleBridgeMessages(now) {
+    for (const [messageId, message] of bridgeMessages) {
+        if (now - message.startedAt > BRIDGE_MESSAGE_TIMEOUT_MS || bridgeMessages.size >= BRIDGE_MAX_PENDING_MESSAGES) {
+            console.warn('[bridgeReceiveChunk] 丢弃未收齐的消息:', messageId, `${message.received}/${message.total}`);
+            bridgeMessages.delete(messageId);
+        }
+    }
+}
+
+/**
+ * 接收一个分块，全部到齐后重组 JSON 并调用对应的全局处理函数
+ * @param {number} messageId - 消息ID
+ * @param {number} seq - 分块序号（从0开始）
+ * @param {number} total - 分块总数
+ * @param {string} handlerName - 全局处理函数名称
+ * @param {string} chunk - JSON 文本的一段
+ */
+window.bridgeReceiveChunk = function(messageId, seq, total, handlerName, chunk) {
+    let message = bridgeMessages.get(messageId);
+    if (!message) {
+        const now = Date.now();
+        dropStaleBridgeMessages(now);
+        message = {handler: handlerName, total: total, received: 0, chunks: new Array(total), startedAt: now};
+        bridgeMessages.set(messageId, message);
+    }
+    if (message.chunks[seq] === undefined) {
+        message.chunks[seq] = chunk;
+        message.received += 1;
+    }
+    if (message.received < message.total) {
+        return;
+    }
+
+    bridgeMessages.delete(messageId);
+    let data;
+    try {
+        data = JSON.parse(message.chunks.join(''));
+    } catch (e) {
+        console.error('[bridgeReceiveChunk] 消息重组失败:', messageId, e);
+        if (typeof window.displayTemporaryMessage === 'function') {
+            window.displayTemporaryMessage('解析数据失败，请检查日志。', 'red', 5000);
+        }
+        return;
+    }
+    const handler = window[message.handler];
+    if (typeof handler === 'function') {
+        handler(data);
+    } else {
+        console.error('[bridgeReceiveChunk] 未找到处理函数:', message.handler);
+    }
+};
@@ -1,9 +1,15 @@
 // webview_deck_browser.js - 牌组浏览模块
 
 // 牌组浏览相关变量
-let deckCardList = []; // 保存当前牌组的卡片列表
 let currentCardIndex = -1; // 当前卡片索引
 
+// 卡片列表按页向后端请求，只渲染可见区域附近的行
+const DECK_PAGE_SIZE = 100; // 每页条数
+const DECK_MAX_CACHED_PAGES = 10; // 每个列表最多保留在内存中的页数
+const DECK_ROW_OVERSCAN = 10; // 可见区域上下额外渲染的行数
+const DECK_DEFAULT_ROW_HEIGHT = 46; // 首次渲染前估计的行高（px）
+const deckCardWindows = {}; // listId -> 列表状态
+
 /**
  * 应用保存的列表面板宽度
  */
@@ -139,88 +145,320 @@ window.populateDeckBrowser = function(decks) {
 };
 
 /**
- * 填充牌组卡片列表（通用函数）
- * @param {Array} cards - 卡片列表
- * @param {string} listId - 列表元素ID（可选，默认使用deckCardList）
- * @param {number} preserveIndex - 是否保留当前索引（用于删除后刷新）
+ * 获取（必要时创建）列表的分页状态
+ * @param {string} listId - 列表元素ID
  */
-function populateCardList(cards, listId, preserveIndex) {
-    const list = document.getElementById(listId || 'deckCardList');
-    if (!list) {
-        console.error('[populateCardList] 未找到列表元素:', listId);
-        return;
+function getDeckCardWindow(listId) {
+    if (!deckCardWindows[listId]) {
+        const state = {
+            listId: listId,
+            deckName: '',
+            token: 0, // 每次重新加载时递增，用于丢弃过期的分页结果
+            total: 0,
+            pages: new Map(), // 页码 -> 卡片数组
+            pending: new Set(), // 已请求但未返回的页码
+            waiters: [], // 等待某个索引加载完成的回调 [{index, callback}]
+            rowHeight: DECK_DEFAULT_ROW_HEIGHT,
+            selectedIndex: -1,
+            renderScheduled: false,
+            onFirstPage: null
+        };
+        deckCardWindows[listId] = state;
+        const list = document.getElementById(listId);
+        if (list) {
+            list.addEventListener('scroll', () => scheduleDeckCardRender(state));
+            // 捕获阶段记录选中的索引，重新渲染时保持选中状态
+            list.addEventListener('click', (event) => {
+                const li = event.target.closest('li');
+                if (li && li.dataset.index !== undefined && !event.target.classList.contains('history-delete-btn')) {
+                    state.selectedIndex = parseInt(li.dataset.index);
+                }
+            }, true);
+        }
     }
-    
-    list.innerHTML = '';
-    if (cards.length === 0) {
-        list.innerHTML = '<li class="placeholder">此牌组中没有卡片</li>';
+    return deckCardWindows[listId];
+}
+
+/**
+ * 重新加载列表：清空已缓存的页并请求第一页
+ * @param {string} listId - 列表元素ID
+ * @param {string} deckName - 牌组名称
+ * @param {Function} onFirstPage - 第一页返回后的回调（可选）
+ */
+function loadDeckCardWindow(listId, deckName, onFirstPage) {
+    const state = getDeckCardWindow(listId);
+    state.deckName = deckName;
+    state.token += 1;
+    state.total = 0;
+    state.pages = new Map();
+    state.pending = new Set();
+    state.waiters = [];
+    state.selectedIndex = -1;
+    state.onFirstPage = onFirstPage || null;
+    if (listId === 'deckCardList') {
+        currentCardIndex = -1;
+    }
+    const list = document.getElementById(listId);
+    if (list) {
+        list.innerHTML = '<li class="placeholder">正在加载卡片列表...</li>';
+        list.scrollTop = 0;
+    }
+    requestDeckCardPage(state, 0);
+}
+
+function requestDeckCardPage(state, pageIndex) {
+    if (!state.deckName || state.pages.has(pageIndex) || state.pending.has(pageIndex)) {
         return;
     }
-    
-    cards.forEach((card, index) => {
-        const li = document.createElement('li');
-        li.className = 'history-item';
-        
-        const textSpan = document.createElement('span');
-        textSpan.className = 'history-item-text';
-        textSpan.textContent = card.front.substring(0, 30) + (card.front.length > 30 ? '...' : '');
-        textSpan.dataset.nid = card.nid;
-        textSpan.dataset.index = index;
-        
-        const deleteBtn = document.createElement('button');
-        deleteBtn.className = 'history-delete-btn';
-        deleteBtn.innerHTML = '×';
-        deleteBtn.title = '删除卡片';
-        deleteBtn.addEventListener('click', (e) => {
-            e.stopPropagation();
-            if (confirm('确定要删除这张卡片吗？')) {
-                deleteDeckCard(card.nid, listId);
-            }
-        });
-        
-        li.appendChild(textSpan);
-        li.appendChild(deleteBtn);
-        li.dataset.nid = card.nid;
-        li.dataset.index = index;
-        list.appendChild(li);
-    });
+    state.pending.add(pageIndex);
+    if (typeof pycmd === 'function') {
+        const args = [state.deckName, pageIndex * DECK_PAGE_SIZE, DECK_PAGE_SIZE, state.listId, state.token];
+        pycmd(`fetch_deck_cards::${JSON.stringify(args)}`);
+    }
 }
 
 /**
- * 填充牌组浏览器tab的卡片列表
- * @param {Array} cards - 卡片列表
- * @param {number} preserveIndex - 是否保留当前索引（用于删除后刷新）
+ * 根据当前激活的tab返回对应的卡片列表ID
  */
-window.populateDeckCardList = function(cards, preserveIndex) {
-    deckCardList = cards; // 保存卡片列表
-    if (!preserveIndex) {
-        currentCardIndex = -1; // 重置索引
+function getActiveDeckCardListId() {
+    const generatorTab = document.getElementById('generatorTab');
+    const asrTab = document.getElementById('asrTab');
+    if (generatorTab && generatorTab.classList.contains('active')) return 'deckCardsList';
+    if (asrTab && asrTab.classList.contains('active')) return 'asrDeckCardsList';
+    return 'deckCardList';
+}
+
+/**
+ * 接收后端返回的一页卡片
+ * @param {object} page - {deckName, listId, token, offset, total, cards}
+ */
+window.receiveDeckCardsPage = function(page) {
+    const state = getDeckCardWindow(page.listId || getActiveDeckCardListId());
+    if (!page.listId) {
+        // 未指定列表的请求视为重新加载
+        state.deckName = page.deckName;
+        state.token += 1;
+        state.pages = new Map();
+        state.pending = new Set();
+        state.waiters = [];
+    } else if (page.deckName !== state.deckName || page.token !== state.token) {
+        return; // 过期的结果
     }
-    populateCardList(cards, 'deckCardList', preserveIndex);
-    
-    if (cards.length === 0) {
-        // 清空预览区
+    const pageIndex = Math.floor(page.offset / DECK_PAGE_SIZE);
+    state.pending.delete(pageIndex);
+    state.total = page.total;
+    state.pages.set(pageIndex, page.cards);
+    evictDeckCardPages(state, pageIndex);
+
+    state.waiters = state.waiters.filter(waiter => {
+        const card = getLoadedDeckCard(state, waiter.index);
+        if (card) {
+            waiter.callback(card);
+            return false;
+        }
+        return true;
+    });
+
+    renderDeckCardWindow(state);
+
+    if (state.listId === 'deckCardList' && state.total === 0) {
         const previewPanel = document.getElementById('deckCardPreview');
         if (previewPanel) {
             previewPanel.innerHTML = '<div class="preview-placeholder"><p>此牌组中没有卡片</p></div>';
         }
     }
+    if (pageIndex === 0 && state.onFirstPage) {
+        const callback = state.onFirstPage;
+        state.onFirstPage = null;
+        callback(state);
+    }
 };
 
 /**
- * 填充生成器tab的牌组卡片列表
- * @param {Array} cards - 卡片列表
+ * 淘汰离刚加载的页最远的页，使内存占用与牌组大小无关
  */
-window.populateGeneratorDeckCards = function(cards) {
-    populateCardList(cards, 'deckCardsList', false);
+function evictDeckCardPages(state, keepPageIndex) {
+    while (state.pages.size > DECK_MAX_CACHED_PAGES) {
+        let farthest = null;
+        state.pages.forEach((_cards, index) => {
+            if (farthest === null || Math.abs(index - keepPageIndex) > Math.abs(farthest - keepPageIndex)) {
+                farthest = index;
+            }
+        });
+        state.pages.delete(farthest);
+    }
+}
+
+function getLoadedDeckCard(state, index) {
+    const cards = state.pages.get(Math.floor(index / DECK_PAGE_SIZE));
+    return cards ? cards[index % DECK_PAGE_SIZE] || null : null;
+}
+
+function scheduleDeckCardRender(state) {
+    if (state.renderScheduled) return;
+    state.renderScheduled = true;
+    requestAnimationFrame(() => {
+        state.renderScheduled = false;
+        renderDeckCardWindow(state);
+    });
+}
+
+function createDeckListSpacer(height) {
+    const spacer = document.createElement('li');
+    spacer.className = 'deck-list-spacer';
+    spacer.style.height = `${height}px`;
+    return spacer;
+}
+
+function createDeckCardRow(state, card, index) {
+    const li = document.createElement('li');
+    li.className = 'history-item';
+    li.dataset.index = index;
+    const selectedIndex = state.listId === 'deckCardList' ? currentCardIndex : state.selectedIndex;
+    if (index === selectedIndex) {
+        li.classList.add('selected');
+    }
+
+    const textSpan = document.createElement('span');
+    textSpan.className = 'history-item-text';
+    textSpan.dataset.index = index;
+    li.appendChild(textSpan);
+
+    if (!card) {
+        // 所在页尚未加载
+        li.classList.add('loading');
+        textSpan.textContent = '加载中...';
+        return li;
+    }
+
+    textSpan.textContent = card.front.substring(0, 30) + (card.front.length > 30 ? '...' : '');
+    textSpan.dataset.nid = card.nid;
+    li.dataset.nid = card.nid;
+
+    const deleteBtn = document.createElement('button');
+    deleteBtn.className = 'history-delete-btn';
+    deleteBtn.innerHTML = '×';
+    deleteBtn.title = '删除卡片';
+    deleteBtn.addEventListener('click', (e) => {
+        e.stopPropagation();
+        if (confirm('确定要删除这张卡片吗？')) {
+            deleteDeckCard(card.nid, state.listId);
+        }
+    });
+    li.appendChild(deleteBtn);
+    return li;
+}
+
+/**
+ * 只渲染可见区域附近的行，上下用占位元素撑开滚动高度；缺失的页按需请求
+ */
+function renderDeckCardWindow(state) {
+    const list = document.getElementById(state.listId);
+    if (!list) return;
+    if (state.total === 0) {
+        list.innerHTML = '<li class="placeholder">此牌组中没有卡片</li>';
+        return;
+    }
+
+    const rowHeight = state.rowHeight;
+    const scrollTop = list.scrollTop;
+    const viewportRows = Math.ceil((list.clientHeight || rowHeight * 20) / rowHeight);
+    const first = Math.max(0, Math.floor(scrollTop / rowHeight) - DECK_ROW_OVERSCAN);
+    const last = Math.min(state.total, first + viewportRows + DECK_ROW_OVERSCAN * 2);
+
+    const fragment = document.createDocumentFragment();
+    fragment.appendChild(createDeckListSpacer(first * rowHeight));
+    for (let index = first; index < last; index++) {
+        const card = getLoadedDeckCard(state, index);
+        if (!card) {
+            requestDeckCardPage(state, Math.floor(index / DECK_PAGE_SIZE));
+        }
+        fragment.appendChild(createDeckCardRow(state, card, index));
+    }
+    fragment.appendChild(createDeckListSpacer((state.total - last) * rowHeight));
+
+    list.innerHTML = '';
+    list.appendChild(fragment);
+    list.scrollTop = scrollTop;
+
+    // 用实际渲染的行高校正估计值
+    const row = list.querySelector('li.history-item');
+    if (row && row.offsetHeight > 0) {
+        const style = window.getComputedStyle(row);
+        const measured = row.offsetHeight + (parseFloat(style.marginTop) || 0) + (parseFloat(style.marginBottom) || 0);
+        if (Math.abs(measured - state.rowHeight) > 1) {
+            state.rowHeight = measured;
+            scheduleDeckCardRender(state);
+        }
+    }
+}
+
+/**
+ * 滚动列表使指定索引可见
+ */
+function scrollDeckCardIntoView(listId, index) {
+    const state = getDeckCardWindow(listId);
+    const list = document.getElementById(listId);
+    if (!list) return;
+    const top = index * state.rowHeight;
+    if (top < list.scrollTop || top + state.rowHeight > list.scrollTop + list.clientHeight) {
+        list.scrollTop = Math.max(0, top - list.clientHeight / 2);
+    }
+    renderDeckCardWindow(state);
+}
+
+/**
+ * 按索引获取牌组浏览tab中的卡片，所在页未加载时先请求再回调
+ * @param {number} index - 卡片索引
+ * @param {Function} callback - 回调，参数为 {nid, front}
+ */
+function getDeckCard(index, callback) {
+    const state = getDeckCardWindow('deckCardList');
+    const card = getLoadedDeckCard(state, index);
+    if (card) {
+        callback(card);
+        return;
+    }
+    state.waiters.push({index: index, callback: callback});
+    requestDeckCardPage(state, Math.floor(index / DECK_PAGE_SIZE));
+}
+
+/**
+ * 获取牌组浏览tab中的卡片总数
+ */
+function getDeckCardCount() {
+    return getDeckCardWindow('deckCardList').total;
+}
+
+/**
+ * 加载牌组浏览tab的卡片列表
+ * @param {string} deckName - 牌组名称
+ */
+window.loadDeckCardList = function(deckName) {
+    loadDeckCardWindow('deckCardList', deckName);
 };
 
 /**
- * 填充ASR tab的牌组卡片列表
- * @param {Array} cards - 卡片列表
+ * 删除卡片后刷新牌组浏览tab的列表，并选中原位置的下一张卡片
+ * @param {string} deckName - 被删除卡片所在的牌组
  */
-window.populateAsrDeckCards = function(cards) {
-    populateCardList(cards, 'asrDeckCardsList', false);
+window.reloadDeckCardListAfterDelete = function(deckName) {
+    const state = getDeckCardWindow('deckCardList');
+    if (state.deckName !== deckName) return;
+    const previousIndex = currentCardIndex;
+    loadDeckCardWindow('deckCardList', deckName, (loaded) => {
+        const previewPanel = document.getElementById('deckCardPreview');
+        if (loaded.total === 0 || previousIndex < 0) return;
+        const targetIndex = Math.min(previousIndex, loaded.total - 1);
+        currentCardIndex = targetIndex;
+        scrollDeckCardIntoView('deckCardList', targetIndex);
+        getDeckCard(targetIndex, (card) => {
+            if (previewPanel) {
+                previewPanel.innerHTML = '<div class="preview-placeholder loading"><p>正在加载卡片详情...</p></div>';
+            }
+            pycmd(`fetch_card_details::[${parseInt(card.nid)}]`);
+        });
+    });
 };
 
 /**
@@ -330,10 +568,52 @@ function setCurrentCardIndex(index) {
     currentCardIndex = index;
 }
 
+
+// --- 时间戳回填 ---
+let backfillRunning = false;
+
 /**
- * 获取卡片列表
+ * 开始或取消当前牌组的时间戳回填任务
  */
-function getDeckCardList() {
-    return deckCardList;
+function toggleBackfillTimestamps() {
+    if (typeof pycmd !== 'function') return;
+    if (backfillRunning) {
+        pycmd('cancel_backfill::[]');
+        return;
+    }
+    const deckName = document.getElementById('deckBrowserSelect').value;
+    if (!deckName) {
+        window.displayTemporaryMessage('请先选择一个牌组', 'red', 3000);
+        return;
+    }
+    pycmd(`backfill_deck_timestamps::${JSON.stringify([deckName])}`);
 }
 
+/**
+ * 接收后端推送的回填进度
+ * @param {Object} progress - {deckName, processed, total, updated, failed, done, cancelled, error}
+ */
+window.updateBackfillProgress = function(progress) {
+    const button = document.getElementById('backfillTimestampsBtn');
+    const status = document.getElementById('backfillStatus');
+    if (!button || !status) return;
+
+    backfillRunning = !progress.done;
+    button.textContent = backfillRunning ? '取消补全' : '补全时间戳';
+    status.classList.toggle('error', !!progress.error);
+
+    if (progress.error) {
+        status.textContent = `补全失败：${progress.error}`;
+    } else if (progress.cancelled && progress.deckName === undefined) {
+        status.textContent = '已取消补全';
+    } else if (!progress.done) {
+        status.textContent = progress.total
+            ? `正在补全 ${progress.processed}/${progress.total}`
+            : '正在扫描牌组...';
+    } else {
+        const failedText = progress.failed ? `，${progress.failed} 张无法估算` : '';
+        status.textContent = progress.total
+            ? `${progress.cancelled ? '已中断' : '已完成'}：更新 ${progress.updated}/${progress.total} 张${failedText}`
+            : '该牌组没有需要补全时间戳的卡片';
+    }
+};
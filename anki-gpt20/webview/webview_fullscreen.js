@@ -20,10 +20,10 @@ function toggleFullscreen() {
  */
 function enterFullscreen() {
     console.log('[enterFullscreen] 进入全屏模式');
-    const deckCardList = typeof getDeckCardList === 'function' ? getDeckCardList() : [];
-    console.log('[enterFullscreen] 卡片列表长度:', deckCardList.length);
+    const cardCount = typeof getDeckCardCount === 'function' ? getDeckCardCount() : 0;
+    console.log('[enterFullscreen] 卡片总数:', cardCount);
     
-    if (deckCardList.length === 0) {
+    if (cardCount === 0) {
         console.warn('[enterFullscreen] 卡片列表为空');
         if (typeof window.displayTemporaryMessage === 'function') {
             window.displayTemporaryMessage('请先选择一个牌组并加载卡片', 'orange', 3000);
@@ -31,24 +31,10 @@ function enterFullscreen() {
         return;
     }
     
-    // 找到当前选中的卡片
-    const selectedLi = document.querySelector('#deckCardList li.selected');
-    console.log('[enterFullscreen] 选中的列表项:', selectedLi);
-    
-    let startIndex = 0;
-    if (selectedLi && selectedLi.dataset.index !== undefined) {
-        startIndex = parseInt(selectedLi.dataset.index);
-        console.log('[enterFullscreen] 使用选中卡片的索引:', startIndex);
-    } else if (deckCardList.length > 0) {
-        startIndex = 0;
-        console.log('[enterFullscreen] 没有选中项，使用第一个卡片，索引:', startIndex);
-    } else {
-        console.warn('[enterFullscreen] 没有可显示的卡片');
-        if (typeof window.displayTemporaryMessage === 'function') {
-            window.displayTemporaryMessage('没有可显示的卡片', 'orange', 3000);
-        }
-        return;
-    }
+    // 从当前选中的卡片开始（列表只渲染可见行，因此使用记录的索引而不是查找选中的元素）
+    const selectedIndex = typeof getCurrentCardIndex === 'function' ? getCurrentCardIndex() : -1;
+    const startIndex = selectedIndex >= 0 && selectedIndex < cardCount ? selectedIndex : 0;
+    console.log('[enterFullscreen] 起始索引:', startIndex);
     
     const fullscreenContainer = document.getElementById('fullscreenContainer');
     console.log('[enterFullscreen] 全屏容器:', fullscreenContainer);
@@ -97,10 +83,10 @@ function exitFullscreen() {
  */
 function loadCardInFullscreen(index, autoPlay = false) {
     console.log('[loadCardInFullscreen] 加载卡片，索引:', index, '自动播放:', autoPlay);
-    const deckCardList = typeof getDeckCardList === 'function' ? getDeckCardList() : [];
-    console.log('[loadCardInFullscreen] 卡片列表长度:', deckCardList.length);
+    const cardCount = typeof getDeckCardCount === 'function' ? getDeckCardCount() : 0;
+    console.log('[loadCardInFullscreen] 卡片总数:', cardCount);
     
-    if (index < 0 || index >= deckCardList.length) {
+    if (index < 0 || index >= cardCount) {
         console.warn('[loadCardInFullscreen] 索引超出范围:', index);
         return;
     }
@@ -108,25 +94,28 @@ function loadCardInFullscreen(index, autoPlay = false) {
     if (typeof setCurrentCardIndex === 'function') {
         setCurrentCardIndex(index);
     }
-    const card = deckCardList[index];
-    console.log('[loadCardInFullscreen] 卡片数据:', card);
-    
-    if (card && card.nid) {
-        const fullscreenPreview = document.getElementById('fullscreenPreview');
-        if (fullscreenPreview) {
-            console.log('[loadCardInFullscreen] 设置加载占位符');
-            fullscreenPreview.innerHTML = '<div class="preview-placeholder loading"><p>正在加载...</p></div>';
-            console.log('[loadCardInFullscreen] 发送请求获取卡片详情，NID:', card.nid);
-            
-            // 保存自动播放标志
-            fullscreenPreview.dataset.autoPlay = autoPlay ? 'true' : 'false';
-            
-            pycmd(`fetch_card_details::[${parseInt(card.nid)}]`);
-        } else {
-            console.error('[loadCardInFullscreen] 全屏预览容器不存在！');
-        }
+    const fullscreenPreview = document.getElementById('fullscreenPreview');
+    if (fullscreenPreview) {
+        console.log('[loadCardInFullscreen] 设置加载占位符');
+        fullscreenPreview.innerHTML = '<div class="preview-placeholder loading"><p>正在加载...</p></div>';
+        // 保存自动播放标志
+        fullscreenPreview.dataset.autoPlay = autoPlay ? 'true' : 'false';
+        
+        // 卡片所在页可能尚未加载，由 getDeckCard 按需请求
+        getDeckCard(index, (card) => {
+            console.log('[loadCardInFullscreen] 卡片数据:', card);
+            if (typeof getCurrentCardIndex === 'function' && getCurrentCardIndex() !== index) {
+                return; // 等待期间已切换到其他卡片
+            }
+            if (card && card.nid) {
+                console.log('[loadCardInFullscreen] 发送请求获取卡片详情，NID:', card.nid);
+                pycmd(`fetch_card_details::[${parseInt(card.nid)}]`);
+            } else {
+                console.warn('[loadCardInFullscreen] 卡片数据无效或没有NID');
+            }
+        });
     } else {
-        console.warn('[loadCardInFullscreen] 卡片数据无效或没有NID');
+        console.error('[loadCardInFullscreen] 全屏预览容器不存在！');
     }
     if (typeof updateFullscreenCounter === 'function') {
         updateFullscreenCounter();
@@ -138,10 +127,10 @@ function loadCardInFullscreen(index, autoPlay = false) {
  */
 function updateFullscreenCounter() {
     const counter = document.getElementById('fullscreenCardCounter');
-    const deckCardList = typeof getDeckCardList === 'function' ? getDeckCardList() : [];
+    const cardCount = typeof getDeckCardCount === 'function' ? getDeckCardCount() : 0;
     const currentCardIndex = typeof getCurrentCardIndex === 'function' ? getCurrentCardIndex() : -1;
-    if (counter && deckCardList.length > 0 && currentCardIndex >= 0) {
-        counter.textContent = `${currentCardIndex + 1} / ${deckCardList.length}`;
+    if (counter && cardCount > 0 && currentCardIndex >= 0) {
+        counter.textContent = `${currentCardIndex + 1} / ${cardCount}`;
     }
 }
 
@@ -331,7 +320,7 @@ function handleFullscreenKeyboard(event) {
         return false;
     }
     
-    const deckCardList = typeof getDeckCardList === 'function' ? getDeckCardList() : [];
+    const cardCount = typeof getDeckCardCount === 'function' ? getDeckCardCount() : 0;
     const currentCardIndex = typeof getCurrentCardIndex === 'function' ? getCurrentCardIndex() : -1;
     
     // 空格键：下一个卡片 + 自动播放
@@ -339,8 +328,8 @@ function handleFullscreenKeyboard(event) {
         console.log('[handleFullscreenKeyboard] 空格键按下，切换到下一个卡片');
         event.preventDefault();
         event.stopPropagation();
-        if (deckCardList.length > 0) {
-            const nextIndex = (currentCardIndex + 1) % deckCardList.length;
+        if (cardCount > 0) {
+            const nextIndex = (currentCardIndex + 1) % cardCount;
             if (typeof loadCardInFullscreen === 'function') {
                 loadCardInFullscreen(nextIndex, true); // true表示自动播放
             }
@@ -353,8 +342,8 @@ function handleFullscreenKeyboard(event) {
         console.log('[handleFullscreenKeyboard] 左箭头按下，切换到上一个卡片');
         event.preventDefault();
         event.stopPropagation();
-        if (deckCardList.length > 0) {
-            const prevIndex = currentCardIndex > 0 ? currentCardIndex - 1 : deckCardList.length - 1;
+        if (cardCount > 0) {
+            const prevIndex = currentCardIndex > 0 ? currentCardIndex - 1 : cardCount - 1;
             if (typeof loadCardInFullscreen === 'function') {
                 loadCardInFullscreen(prevIndex, true); // true表示自动播放
             }
@@ -367,8 +356,8 @@ function handleFullscreenKeyboard(event) {
         console.log('[handleFullscreenKeyboard] 右箭头按下，切换到下一个卡片');
         event.preventDefault();
         event.stopPropagation();
-        if (deckCardList.length > 0) {
-            const nextIndex = (currentCardIndex + 1) % deckCardList.length;
+        if (cardCount > 0) {
+            const nextIndex = (currentCardIndex + 1) % cardCount;
             if (typeof loadCardInFullscreen === 'function') {
                 loadCardInFullscreen(nextIndex, true); // true表示自动播放
             }
@@ -26,6 +26,86 @@ let timelineEditorState = {
     lastPlayheadX: -1 // 上一个播放头的X位置，用于清除
 };
 
+// Timestamps 字段紧凑格式的前缀（与 llm/timestamp_codec.py 保持一致）
+const COMPACT_TIMESTAMPS_PREFIX = 'ts1:';
+
+/**
+ * 解码时间戳数据
+ * 数组原样返回；字符串按紧凑格式（ts1:）或旧的 JSON 格式解析，无效时返回空数组
+ */
+function decodeTimestamps(value) {
+    if (Array.isArray(value)) {
+        return value;
+    }
+    if (typeof value !== 'string' || !value.trim()) {
+        return [];
+    }
+    if (!value.startsWith(COMPACT_TIMESTAMPS_PREFIX)) {
+        try {
+            const parsed = JSON.parse(value);
+            return Array.isArray(parsed) ? parsed : [];
+        } catch (e) {
+            console.warn('[decodeTimestamps] 无效的 JSON 时间戳:', e);
+            return [];
+        }
+    }
+    try {
+        const binary = atob(value.slice(COMPACT_TIMESTAMPS_PREFIX.length).trim());
+        const bytes = new Uint8Array(binary.length);
+        for (let i = 0; i < binary.length; i++) {
+            bytes[i] = binary.charCodeAt(i);
+        }
+        let pos = 0;
+        // LEB128 变长整数；用乘法累加，避免位运算截断为 32 位
+        const readVarint = () => {
+            let result = 0;
+            let scale = 1;
+            while (true) {
+                if (pos >= bytes.length) {
+                    throw new Error('数据不完整');
+                }
+                const byte = bytes[pos++];
+                result += (byte & 0x7f) * scale;
+                if (byte < 0x80) {
+                    return result;
+                }
+                scale *= 128;
+            }
+        };
+        const unzigzag = n => (n % 2 === 0 ? n / 2 : -(n + 1) / 2);
+        const count = readVarint();
+        const columns = [[], [], []]; // 文本长度、开始时间增量、时长
+        columns.forEach(column => {
+            for (let i = 0; i < count; i++) {
+                column.push(readVarint());
+            }
+        });
+        // 按 Unicode 字符切分，与 Python 的字符串长度一致
+        const chars = Array.from(new TextDecoder('utf-8', { fatal: true }).decode(bytes.subarray(pos)));
+        const [lengths, begins, durations] = columns;
+        const timestamps = [];
+        let offset = 0;
+        let previousEnd = 0;
+        for (let i = 0; i < count; i++) {
+            const begin = previousEnd + unzigzag(begins[i]);
+            previousEnd = begin + unzigzag(durations[i]);
+            timestamps.push({
+                text: chars.slice(offset, offset + lengths[i]).join(''),
+                begin_time: begin,
+                end_time: previousEnd
+            });
+            offset += lengths[i];
+        }
+        if (offset !== chars.length) {
+            throw new Error('文本长度不匹配');
+        }
+        return timestamps;
+    } catch (e) {
+        console.warn('[decodeTimestamps] 无效的紧凑时间戳:', e);
+        return [];
+    }
+}
+
 /**
  * 渲染交互式句子（带时间戳的单词）
  */
@@ -347,13 +347,10 @@ function loadDeckCards(tabType, deckName) {
     }
     
     const listId = tabType === 'generator' ? 'deckCardsList' : 'asrDeckCardsList';
-    const list = document.getElementById(listId);
-    if (!list) return;
+    if (!document.getElementById(listId)) return;
     
-    list.innerHTML = '<li class="placeholder">加载中...</li>';
-    
-    if (typeof pycmd === 'function') {
-        pycmd(`fetch_deck_cards::${JSON.stringify(deckName)}`);
+    if (typeof loadDeckCardWindow === 'function') {
+        loadDeckCardWindow(listId, deckName);
     }
 }
 
@@ -706,8 +703,7 @@ function setupEventListeners() {
         document.getElementById('deckCardListHeader').textContent = deckName ? `牌组 "${deckName}"` : '请先选择一个牌组';
         previewEl.innerHTML = '<div class="preview-placeholder"><p>请在左侧选择一张卡片进行预览</p></div>';
         if (deckName) {
-            listEl.innerHTML = '<li class="placeholder">正在加载卡片列表...</li>';
-            pycmd(`fetch_deck_cards::["${deckName}"]`);
+            loadDeckCardWindow('deckCardList', deckName);
         } else {
             listEl.innerHTML = '<li class="placeholder">...</li>';
         }
@@ -863,6 +859,12 @@ function setupEventListeners() {
         exitFullscreenBtn.addEventListener('click', exitFullscreen);
     }
     
+    // 牌组时间戳回填
+    const backfillTimestampsBtn = document.getElementById('backfillTimestampsBtn');
+    if (backfillTimestampsBtn) {
+        backfillTimestampsBtn.addEventListener('click', toggleBackfillTimestamps);
+    }
+    
     // 全屏模式下的键盘事件（使用捕获阶段，确保优先处理）
     document.addEventListener('keydown', handleFullscreenKeyboard, true);
     
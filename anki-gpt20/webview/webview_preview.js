@@ -26,6 +26,11 @@ function renderCardPreview(container, data) {
         return;
     }
 
+    // 已有卡片的时间戳可能是 Timestamps 字段中的紧凑编码字符串
+    if (data.timestamps && typeof decodeTimestamps === 'function') {
+        data.timestamps = decodeTimestamps(data.timestamps);
+    }
+
     const isExistingCard = data.isExistingCard || false;
     const previewHtml = `
         <div class="preview-section-inner" style="color: #ffffff !important; background-color: #2e2e2e !important;">
@@ -58,18 +63,20 @@ function renderCardPreview(container, data) {
         console.error('[renderCardPreview] 未找到背面内容容器！');
     }
     
-    // 处理音频：优先使用audioBase64，如果没有则使用audioUrl
-    if (data.audioBase64 || data.audioUrl) {
+    // 处理音频：优先使用audioBase64，其次是媒体服务器URL（audioMediaUrl），最后是原始音频URL（audioUrl）
+    if (data.audioBase64 || data.audioMediaUrl || data.audioUrl) {
         const audioContainer = container.querySelector('.preview-audio-container');
         const audioPlayer = container.querySelector('.preview-audio');
         if (audioContainer && audioPlayer) {
             audioContainer.style.display = 'block';
             if (data.audioBase64) {
             audioPlayer.src = data.audioBase64;
+            } else if (data.audioMediaUrl) {
+                audioPlayer.src = data.audioMediaUrl;
             } else if (data.audioUrl) {
                 audioPlayer.src = data.audioUrl;
             }
-            console.log('[renderCardPreview] 音频已设置', data.audioBase64 ? '(base64)' : '(URL)');
+            console.log('[renderCardPreview] 音频已设置', data.audioBase64 ? '(base64)' : (data.audioMediaUrl ? '(媒体服务器)' : '(URL)'));
             
             // 为音频控件添加preload属性，确保音频可以预加载
             audioPlayer.setAttribute('preload', 'auto');
@@ -691,6 +698,38 @@ function displayPreview(data) {
     }
 }
 
+/**
+ * 显示 LLM 流式生成中的部分预览
+ * 首次调用时收起全屏加载遮罩（控件保持禁用），之后只更新背面内容；
+ * 生成完成后由 displayPreview 渲染完整预览并替换。
+ * @param {string} backContentHtml - 当前累计的背面内容 HTML
+ */
+function displayStreamingPreview(backContentHtml) {
+    const asrTab = document.getElementById('asrTab');
+    const panelId = (asrTab && asrTab.classList.contains('active')) ? 'asrPreviewPanel' : 'generatorPreviewPanel';
+    const previewPanel = document.getElementById(panelId);
+    if (!previewPanel) return;
+
+    const loadingIndicator = document.getElementById('loadingIndicator');
+    if (loadingIndicator) loadingIndicator.style.display = 'none';
+
+    let backContentEl = previewPanel.querySelector('.streaming-preview .back-content');
+    if (!backContentEl) {
+        previewPanel.innerHTML = `
+            <div class="preview-section-inner streaming-preview" style="color: #ffffff !important; background-color: #2e2e2e !important;">
+                <h2 style="color: #00aaff !important;">正在生成...</h2>
+                <div class="preview-group stretch">
+                    <strong style="color: #ffffff !important;">背面:</strong>
+                    <div class="preview-content back-content" style="color: #ffffff !important; background-color: #4a4a4a !important;"></div>
+                </div>
+            </div>
+        `;
+        backContentEl = previewPanel.querySelector('.streaming-preview .back-content');
+    }
+    backContentEl.innerHTML = backContentHtml || '';
+    backContentEl.scrollTop = backContentEl.scrollHeight;
+}
+
 /**
  * 初始化音频控制按钮（循环播放和播放速度）
  * @param {HTMLElement} audioContainer - 音频容器元素